@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict
+
+# Process-wide cache of parsed banks for the JSON backend. Each bank is stored
+# with the (mtime, size, inode) of its snapshot and journal when it was read;
+# a lookup whose files no longer match is a miss and the bank is parsed again.
+# Banks are evicted least recently used first once their estimated size
+# exceeds the memory cap.
+#
+# Writes made through the store change the cached XPathBank in place and then
+# record the new file state, so the next read does not parse the bank again
+# (see JsonBankStore.write_ops).
+
+DEFAULT_MAX_MB = 512
+# Parsed banks take several times their size on disk
+MEMORY_FACTOR = 6
+
+
+class BankCache:
+    """LRU of {name: (file state, XPathBank, estimated bytes)}"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_MB * 2**20):
+        self.max_bytes = max_bytes
+        self._banks = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0, 'write_through': 0, 'invalidations': 0}
+
+    def get(self, name, state):
+        """The cached bank if it was read from files in `state`, else None"""
+        with self._lock:
+            item = self._banks.get(name)
+            if item is not None and item[0] == state:
+                self._banks.move_to_end(name)
+                self.stats['hits'] += 1
+                return item[1]
+            self.stats['misses'] += 1
+            if item is not None:
+                self.stats['stale'] += 1
+                self._drop(name)
+            return None
+
+    def put(self, name, state, bank):
+        size = estimated_bytes(state)
+        with self._lock:
+            self._drop(name)
+            self._banks[name] = (state, bank, size)
+            self._bytes += size
+            # Keep at least the bank just read, however large
+            while self._bytes > self.max_bytes and len(self._banks) > 1:
+                oldest = next(iter(self._banks))
+                self._drop(oldest)
+                self.stats['evictions'] += 1
+
+    def written(self, name, bank, state):
+        """Record the file state after a write already applied to the cached bank"""
+        with self._lock:
+            item = self._banks.get(name)
+            if item is None or item[1] is not bank:
+                return
+            self._bytes += estimated_bytes(state) - item[2]
+            self._banks[name] = (state, bank, estimated_bytes(state))
+            self.stats['write_through'] += 1
+
+    def invalidate(self, name):
+        with self._lock:
+            if name in self._banks:
+                self._drop(name)
+                self.stats['invalidations'] += 1
+
+    def _drop(self, name):
+        item = self._banks.pop(name, None)
+        if item is not None:
+            self._bytes -= item[2]
+
+    def info(self):
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {**self.stats, 'banks': len(self._banks), 'estimated_bytes': self._bytes,
+                    'max_bytes': self.max_bytes,
+                    'hit_rate': round(self.stats['hits'] / lookups, 4) if lookups else None}
+
+
+def estimated_bytes(state):
+    """Rough in-memory size of a bank from the sizes of its files"""
+    return MEMORY_FACTOR * sum(part[1] for part in state if part)
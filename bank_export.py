@@ -0,0 +1,202 @@
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+
+from bank_store import get_store, read_config
+
+# Streaming exports of xpath banks. Rows are produced one entry at a time from
+# the store's iter_rows and encoded in small chunks, so a download starts
+# immediately and memory stays flat whatever the bank size. The "all banks"
+# mode walks the banks one after another and never holds more than one.
+
+VISUAL_LABELS = {
+    'text': 'Text',
+    'tag_text': 'Tag + Text',
+    'tag_contains': 'Tag Contains',
+    'placeholder': 'Placeholder',
+    'value': 'Value',
+    'accessibility': 'Aria-Label',
+    'name': 'Name',
+    'href': 'Href',
+    'src': 'Src',
+    'alt': 'Alt',
+    'title': 'Title',
+    'attributes': 'Attributes'
+}
+
+# Column id -> CSV header. The defaults reproduce the original CSV download.
+COLUMNS = {
+    'bank': 'Bank',
+    'page_url': 'Page URL',
+    'page_full_url': 'Page Full URL',
+    'page_name': 'Page Name',
+    'display_order': 'Display Order',
+    'id': 'Entry ID',
+    'name': 'Element Name',
+    'final_xpath': 'Final XPath',
+    'custom_xpath': 'Custom XPath',
+    'created_on': 'Created On',
+    'relative_xpath': 'Relative XPath',
+    'relative_xpath_count': 'Relative XPath Count',
+    'full_xpath': 'Full XPath',
+    'full_xpath_count': 'Full XPath Count',
+    'css_selector': 'CSS Selector',
+    'css_selector_count': 'CSS Selector Count',
+}
+for _key, _label in VISUAL_LABELS.items():
+    COLUMNS[f'visual_{_key}'] = f'Visual XPath ({_label})'
+    COLUMNS[f'visual_{_key}_count'] = f'Visual XPath ({_label}) Count'
+
+DEFAULT_COLUMNS = ['page_url', 'page_name', 'name', 'final_xpath', 'created_on']
+FORMATS = ('csv', 'jsonl')
+CHUNK_ROWS = 200
+
+
+def parse_columns(value, all_banks=False):
+    """Turn "a,b,c" or "all" into a column list; raises ValueError on unknown ids"""
+    if not value:
+        columns = list(DEFAULT_COLUMNS)
+    elif value == 'all':
+        columns = list(COLUMNS)
+    else:
+        columns = [c.strip() for c in value.split(',') if c.strip()]
+        unknown = [c for c in columns if c not in COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown export columns: {', '.join(unknown)}")
+    if all_banks and 'bank' not in columns:
+        columns.insert(0, 'bank')
+    return columns
+
+
+def _candidate(entry, field):
+    """(xpath, count) of a candidate locator stored as {'xpath', 'count'} or a plain string"""
+    if field.startswith('visual_'):
+        value = (entry.get('visual_xpath') or {}).get(field[len('visual_'):])
+    else:
+        value = entry.get(field)
+    if isinstance(value, dict):
+        return value.get('xpath', ''), value.get('count', '')
+    return value or '', ''
+
+
+def row_values(bank, page_key, page_data, entry, columns):
+    """Values of the requested columns for one entry"""
+    values = {}
+    for column in columns:
+        if column == 'bank':
+            values[column] = bank
+        elif column == 'page_url':
+            values[column] = page_key
+        elif column in ('page_full_url', 'page_name', 'display_order'):
+            values[column] = page_data.get(column, '')
+        elif column.endswith('_count'):
+            values[column] = _candidate(entry, column[:-len('_count')])[1]
+        elif column in ('relative_xpath', 'full_xpath', 'css_selector') or column.startswith('visual_'):
+            values[column] = _candidate(entry, column)[0]
+        else:
+            values[column] = entry.get(column, '')
+    return values
+
+
+def iter_bank_rows(store, names):
+    """Yield (bank, page_key, page_data, entry) for every entry of the given banks, one bank at a time"""
+    for name in names:
+        # Read past the bank cache: a whole-store export would evict every bank in use
+        for page_key, page_data, entry in store.iter_rows(name, cached=False):
+            if entry is not None:
+                yield name, page_key, page_data, entry
+
+
+def iter_csv(rows, columns):
+    """Encode rows as CSV text chunks of CHUNK_ROWS rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([COLUMNS[c] for c in columns])
+    pending = 0
+    for bank, page_key, page_data, entry in rows:
+        values = row_values(bank, page_key, page_data, entry, columns)
+        writer.writerow([values[c] for c in columns])
+        pending += 1
+        if pending >= CHUNK_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def iter_jsonl(rows, columns=None):
+    """Encode rows as JSON lines
+
+    Without columns each line is the stored entry plus bank, page_url and
+    page_name; with columns it is a flat object of those columns.
+    """
+    lines = []
+    for bank, page_key, page_data, entry in rows:
+        if columns:
+            record = row_values(bank, page_key, page_data, entry, columns)
+        else:
+            record = {'bank': bank, 'page_url': page_key, 'page_name': page_data.get('page_name', '')}
+            record.update(entry)
+        lines.append(json.dumps(record, ensure_ascii=False))
+        if len(lines) >= CHUNK_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def gzip_stream(chunks):
+    """Compress an iterator of bytes into a gzip stream"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(store, names, fmt='csv', columns=None, gzip=False):
+    """Bytes chunks of a CSV or JSONL export of the given banks"""
+    rows = iter_bank_rows(store, names)
+    if fmt == 'csv':
+        text = iter_csv(rows, columns or DEFAULT_COLUMNS)
+    elif fmt == 'jsonl':
+        text = iter_jsonl(rows, columns)
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+    chunks = (chunk.encode('utf-8') for chunk in text)
+    return gzip_stream(chunks) if gzip else chunks
+
+
+def export_filename(name, fmt='csv', gzip=False):
+    base = name[:-len('.json')] if name.endswith('.json') else name
+    return f"{base}.{fmt}" + ('.gz' if gzip else '')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export xpath banks as CSV or JSONL')
+    parser.add_argument('names', nargs='*', help='Bank names, e.g. google.com.json (default: all banks)')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--columns', help=f"Comma-separated columns or 'all' (default: {','.join(DEFAULT_COLUMNS)})")
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('-o', '--output', help='Output file (default: stdout)')
+    args = parser.parse_args()
+
+    store = get_store(read_config())
+    names = args.names or store.list_banks()
+    columns = parse_columns(args.columns, all_banks=not args.names) if (args.columns or args.format == 'csv') else None
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in export_stream(store, names, args.format, columns, args.gzip):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
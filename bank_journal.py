@@ -0,0 +1,216 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from xpath_bank import XPathBank
+
+# Banks are stored as a readable snapshot (output_folder/<domain>.json) plus a
+# write-ahead journal (output_folder/<domain>.journal.jsonl). Every change is
+# appended to the journal as one JSON operation per line:
+#
+#   {"op": "add", "page": <page key>, "entry": {"id": ..., ...}, "page_data": {...}}
+#   {"op": "update", "id": <entry id>, "fields": {...}}
+#   {"op": "delete", "id": <entry id>}
+#   {"op": "batch", "ops": [<update or delete>, ...]}
+#   {"op": "base", "v": <version>}
+#
+# "page_data" is only present when the add creates the page. The operations are
+# produced by XPathBank's mutators. Readers replay the journal over the
+# snapshot; compaction folds the journal into a new snapshot.
+#
+# Every line is stamped with the bank's version ("v"), which goes up by one per
+# line, so a batch is applied all or nothing (a torn final line is dropped) and
+# counts as one change. Compaction replaces the journal with a single "base"
+# line carrying the version on, so versions never go back. Lines written
+# before versions existed count one each.
+
+JOURNAL_SUFFIX = '.journal.jsonl'
+LOCK_SUFFIX = '.lock'
+
+
+class VersionConflict(Exception):
+    """The bank is no longer at the version a change was based on"""
+
+    def __init__(self, version):
+        super().__init__(f'Bank is at version {version}')
+        self.version = version
+
+
+def journal_path(bank_path):
+    base = bank_path[:-len('.json')] if bank_path.endswith('.json') else bank_path
+    return base + JOURNAL_SUFFIX
+
+
+def bank_exists(bank_path):
+    return os.path.exists(bank_path) or os.path.exists(journal_path(bank_path))
+
+
+def list_banks(folder):
+    """File names of all banks in folder, including banks not compacted yet"""
+    if not os.path.exists(folder):
+        return []
+    names = set()
+    for f in os.listdir(folder):
+        if f.endswith(JOURNAL_SUFFIX):
+            names.add(f[:-len(JOURNAL_SUFFIX)] + '.json')
+        elif f.endswith('.json'):
+            names.add(f)
+    return sorted(names)
+
+
+@contextmanager
+def bank_lock(bank_path, timeout=10, stale_after=30):
+    """Cross-process lock around journal appends and compaction of one bank"""
+    lock_path = bank_path + LOCK_SUFFIX
+    deadline = time.time() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            break
+        except FileExistsError:
+            try:
+                # A crashed holder leaves the lock file behind
+                if time.time() - os.path.getmtime(lock_path) > stale_after:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            if time.time() > deadline:
+                raise TimeoutError(f'Timed out waiting for lock on {bank_path}')
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+def append_ops(bank_path, ops):
+    """Durably append operations to the bank's journal; returns the new version"""
+    with bank_lock(bank_path):
+        return append_locked(bank_path, ops)
+
+
+def append_locked(bank_path, ops):
+    """append_ops for a caller already holding bank_lock (one write, fsync'd)"""
+    version = current_version(bank_path)
+    lines = ''.join(json.dumps({**op, 'v': version + i}, ensure_ascii=False) + '\n'
+                    for i, op in enumerate(ops, 1))
+    with open(journal_path(bank_path), 'a', encoding='utf-8') as f:
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+    return version + len(ops)
+
+
+def next_version(version, op):
+    return op['v'] if 'v' in op else version + 1
+
+
+def current_version(bank_path, chunk_size=65536):
+    """The bank's version, read from the end of its journal"""
+    path = journal_path(bank_path)
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return 0
+    with f:
+        position = f.seek(0, os.SEEK_END)
+        tail = b''
+        while position > 0:
+            step = min(chunk_size, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+            lines = tail.split(b'\n')
+            # The first piece may be the end of a line that starts further back
+            for line in reversed(lines[1:] if position > 0 else lines):
+                if not line.strip():
+                    continue
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    continue  # Torn final append
+                if 'v' in op:
+                    return op['v']
+                # Journal written before versions: count its lines
+                version = 0
+                for op in read_journal(bank_path):
+                    version = next_version(version, op)
+                return version
+    return 0
+
+
+def read_journal(bank_path):
+    path = journal_path(bank_path)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    ops = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            ops.append(json.loads(line))
+        except json.JSONDecodeError:
+            if number == len(lines):
+                break  # Torn final append from a crash; the operation never completed
+            print(f"Skipping corrupt journal line {number} in {path}")
+    return ops
+
+
+def read_snapshot(bank_path):
+    if not os.path.exists(bank_path):
+        return {}
+    with open(bank_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_bank(bank_path):
+    """Read the snapshot into an XPathBank and replay the journal over it"""
+    bank = XPathBank.from_dict(read_snapshot(bank_path))
+    for op in read_journal(bank_path):
+        bank.apply(op)
+    return bank
+
+
+def write_snapshot(bank_path, data):
+    """Atomically replace the snapshot: write a temp file, fsync, rename"""
+    tmp_path = bank_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, bank_path)
+
+
+def compact(bank_path):
+    """Fold the journal into a fresh snapshot, leaving only its version in the journal"""
+    with bank_lock(bank_path):
+        if all(op.get('op') == 'base' for op in read_journal(bank_path)):
+            return False
+        bank = load_bank(bank_path)
+        write_snapshot(bank_path, bank.to_dict())
+        # Readers between the two replaces replay the old journal over the new
+        # snapshot, which changes nothing
+        path = journal_path(bank_path)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'op': 'base', 'v': bank.version}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        return True
+
+
+def quarantine_snapshot(bank_path):
+    """Move an unreadable snapshot aside so it is kept for inspection, not overwritten"""
+    corrupt_path = f"{bank_path}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    os.replace(bank_path, corrupt_path)
+    return corrupt_path
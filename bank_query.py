@@ -0,0 +1,87 @@
+from xpath_bank import entry_xpaths
+
+# Filtering, field projection and pagination for /load_json. Works on the
+# (page_key, page_data, entry) rows produced by every store's iter_rows, so the
+# SQLite backend streams rows instead of building the whole bank.
+
+
+def _matches(value, needle):
+    return needle in (value or '').lower()
+
+
+def project_entry(entry, fields):
+    """Keep only the requested entry fields; the id is always kept for addressing"""
+    if not fields:
+        return entry
+    projected = {'id': entry.get('id')}
+    for field in fields:
+        if field in entry:
+            projected[field] = entry[field]
+    return projected
+
+
+def query_bank(rows, page_url=None, name=None, xpath=None, fields=None,
+               page=None, page_size=None, entry_offset=0, entry_limit=None,
+               page_key=None, entry_id=None):
+    """Filter, project and paginate bank rows
+
+    page/page_size paginate page sections (1-based, ordered by display_order);
+    entry_offset/entry_limit paginate the entries inside each returned page.
+    page_url, name and xpath are case-insensitive substrings; page_key and
+    entry_id match exactly. Returns (data, pagination); raises ValueError on
+    an out-of-range page, page_size, entry_offset or entry_limit.
+    """
+    if page is not None and page < 1:
+        raise ValueError('page must be 1 or more')
+    if page_size is not None and page_size < 1:
+        raise ValueError('page_size must be 1 or more')
+    if entry_offset < 0:
+        raise ValueError('entry_offset must be 0 or more')
+    if entry_limit is not None and entry_limit < 0:
+        raise ValueError('entry_limit must be 0 or more')
+    page_url = page_url.lower() if page_url else None
+    name = name.lower() if name else None
+    xpath = xpath.lower() if xpath else None
+    filter_entries = bool(name or xpath or entry_id)
+
+    pages = {}
+    for key, page_data, entry in rows:
+        if page_key is not None and key != page_key:
+            continue
+        if page_url and not (_matches(key, page_url) or _matches(page_data.get('page_url'), page_url)):
+            continue
+        if key not in pages:
+            pages[key] = (page_data, [])
+        if entry is None:
+            continue
+        if entry_id and entry.get('id') != entry_id:
+            continue
+        if name and not _matches(entry.get('name'), name):
+            continue
+        if xpath and not any(xpath in value.lower() for value in entry_xpaths(entry)):
+            continue
+        pages[key][1].append(project_entry(entry, fields))
+
+    ordered = [(key, value) for key, value in pages.items() if value[1] or not filter_entries]
+    ordered.sort(key=lambda item: item[1][0].get('display_order') or 0)
+    total_pages = len(ordered)
+    if page_size:
+        start = ((page or 1) - 1) * page_size
+        ordered = ordered[start:start + page_size]
+
+    data = {}
+    for page_key, (page_data, entries) in ordered:
+        data[page_key] = dict(page_data)
+        data[page_key]['xpath_total'] = len(entries)
+        end = entry_offset + entry_limit if entry_limit is not None else None
+        data[page_key]['xpaths'] = entries[entry_offset:end]
+
+    pagination = {
+        'page': page or 1,
+        'page_size': page_size,
+        'total_pages': total_pages,
+        'has_more': bool(page_size) and (page or 1) * page_size < total_pages,
+        'entry_offset': entry_offset,
+        'entry_limit': entry_limit
+    }
+    return data, pagination
@@ -0,0 +1,91 @@
+import sys
+
+# Compact in-memory form of bank entries. An entry dict is split into a shape
+# (its keys in order, and how each value is stored) and a flat tuple of the
+# values that are not empty. Shapes are interned, so the thousands of entries
+# captured the same way share one shape tuple and no entry stores key strings.
+#
+# Value kinds in a shape:
+#   c  {"xpath": str, "count": int}   -> xpath and count in the values tuple
+#   z  {"xpath": "", "count": 0}      -> nothing stored
+#   e  ""                             -> nothing stored
+#   v  nested dict (visual_xpath)     -> its own shape, values appended flat
+#   r  anything else                  -> stored as is
+#
+# EntryRecord.to_dict() rebuilds the original dict, key order included, so the
+# JSON written from a compact bank is the same as before.
+
+_shapes = {}
+
+
+def intern_shape(shape):
+    return _shapes.setdefault(shape, shape)
+
+
+def _kind(value):
+    if type(value) is dict:
+        if len(value) == 2 and type(value.get('xpath')) is str and type(value.get('count')) is int \
+                and next(iter(value)) == 'xpath':
+            return 'z' if value['xpath'] == '' and value['count'] == 0 else 'c'
+        return 'v'
+    if value == '' and type(value) is str:
+        return 'e'
+    return 'r'
+
+
+def _encode(data, values, nested=True):
+    shape = []
+    for key, value in data.items():
+        kind = _kind(value)
+        if kind == 'v' and not nested:
+            kind = 'r'
+        if kind == 'c':
+            values.append(value['xpath'])
+            values.append(value['count'])
+            shape.append((sys.intern(key), kind))
+        elif kind == 'v':
+            shape.append((sys.intern(key), kind, _encode(value, values, nested=False)))
+        else:
+            if kind == 'r':
+                values.append(value)
+            shape.append((sys.intern(key), kind))
+    return intern_shape(tuple(shape))
+
+
+def _decode(shape, values, position):
+    data = {}
+    for item in shape:
+        key, kind = item[0], item[1]
+        if kind == 'c':
+            data[key] = {'xpath': values[position], 'count': values[position + 1]}
+            position += 2
+        elif kind == 'z':
+            data[key] = {'xpath': '', 'count': 0}
+        elif kind == 'e':
+            data[key] = ''
+        elif kind == 'v':
+            data[key], position = _decode(item[2], values, position)
+        else:
+            data[key] = values[position]
+            position += 1
+    return data, position
+
+
+class EntryRecord:
+    """One captured entry as an interned shape plus its non-empty values"""
+
+    __slots__ = ('shape', 'values')
+
+    def __init__(self, shape, values):
+        self.shape = shape
+        self.values = values
+
+    @classmethod
+    def from_dict(cls, entry):
+        values = []
+        shape = _encode(entry, values)
+        return cls(shape, tuple(values))
+
+    def to_dict(self):
+        return _decode(self.shape, self.values, 0)[0]
+
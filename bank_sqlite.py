@@ -0,0 +1,475 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import bank_journal
+from bank_journal import VersionConflict
+from xpath_bank import CANDIDATE_FIELDS, XPathBank, new_entry_id
+
+# SQLite storage backend. Pages, entries and candidate locators live in indexed
+# tables so the web app can read or change one entry without parsing the whole
+# bank. The output_folder/<domain>.json format stays the interchange format:
+# import_json/export_json convert losslessly in both directions.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS banks (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS pages (
+    bank TEXT NOT NULL,
+    page_key TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    page_url TEXT,
+    page_full_url TEXT,
+    page_name TEXT,
+    display_order INTEGER,
+    extra TEXT,
+    PRIMARY KEY (bank, page_key)
+);
+CREATE INDEX IF NOT EXISTS pages_by_seq ON pages (bank, seq);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id TEXT NOT NULL,
+    bank TEXT NOT NULL,
+    page_key TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    name TEXT,
+    custom_xpath TEXT,
+    final_xpath TEXT,
+    created_on TEXT,
+    has_visual INTEGER NOT NULL DEFAULT 1,
+    extra TEXT,
+    PRIMARY KEY (bank, id)
+);
+CREATE INDEX IF NOT EXISTS entries_by_page ON entries (bank, page_key, seq);
+CREATE INDEX IF NOT EXISTS entries_by_name ON entries (bank, name);
+CREATE INDEX IF NOT EXISTS entries_by_final_xpath ON entries (bank, final_xpath);
+CREATE TABLE IF NOT EXISTS candidates (
+    bank TEXT NOT NULL,
+    entry_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    xpath TEXT,
+    count INTEGER,
+    is_object INTEGER NOT NULL,
+    PRIMARY KEY (bank, entry_id, kind)
+);
+CREATE INDEX IF NOT EXISTS candidates_by_xpath ON candidates (xpath);
+"""
+
+# Databases created when entry ids were global: re-key entries and candidates
+# by bank, since legacy ids are derived from content and repeat across banks
+# that share entries
+UPGRADE_PER_BANK_KEYS = """
+ALTER TABLE entries RENAME TO entries_v1;
+ALTER TABLE candidates RENAME TO candidates_v1;
+DROP INDEX IF EXISTS entries_by_page;
+DROP INDEX IF EXISTS entries_by_name;
+DROP INDEX IF EXISTS entries_by_final_xpath;
+DROP INDEX IF EXISTS candidates_by_xpath;
+""" + SCHEMA + """
+INSERT INTO entries SELECT id, bank, page_key, seq, name, custom_xpath, final_xpath, created_on, has_visual, extra
+    FROM entries_v1;
+INSERT INTO candidates SELECT e.bank, c.entry_id, c.kind, c.position, c.xpath, c.count, c.is_object
+    FROM candidates_v1 c JOIN entries_v1 e ON e.id = c.entry_id;
+DROP TABLE entries_v1;
+DROP TABLE candidates_v1;
+"""
+
+PAGE_COLUMNS = ['page_url', 'page_full_url', 'page_name', 'display_order']
+ENTRY_COLUMNS = ['name', 'custom_xpath', 'final_xpath', 'created_on']
+VISUAL_PREFIX = 'visual:'
+
+
+def split_entry(entry):
+    """Split an entry dict into (columns, candidate rows, extra fields, has_visual)"""
+    columns = {column: entry.get(column) for column in ENTRY_COLUMNS}
+    candidates = []
+    for position, (key, value) in enumerate((entry.get('visual_xpath') or {}).items()):
+        candidates.append(_candidate_row(VISUAL_PREFIX + key, position, value))
+    for position, field in enumerate(CANDIDATE_FIELDS):
+        if field in entry:
+            candidates.append(_candidate_row(field, position, entry[field]))
+    known = {'id', 'visual_xpath', *ENTRY_COLUMNS, *CANDIDATE_FIELDS}
+    extra = {k: v for k, v in entry.items() if k not in known}
+    return columns, candidates, extra, 'visual_xpath' in entry
+
+
+def _candidate_row(kind, position, value):
+    if isinstance(value, dict):
+        return kind, position, value.get('xpath', ''), value.get('count', 0), 1
+    return kind, position, value, None, 0
+
+
+def join_entry(entry_id, columns, candidates, extra, has_visual):
+    """Inverse of split_entry; rebuilds the entry in the JSON field order"""
+    by_kind = {kind: (xpath if not is_object else {'xpath': xpath, 'count': count})
+               for kind, position, xpath, count, is_object in sorted(candidates, key=lambda c: c[1])}
+    entry = {'id': entry_id}
+    if columns.get('name') is not None:
+        entry['name'] = columns['name']
+    if has_visual:
+        entry['visual_xpath'] = {kind[len(VISUAL_PREFIX):]: value for kind, value in by_kind.items()
+                                 if kind.startswith(VISUAL_PREFIX)}
+    for field in CANDIDATE_FIELDS:
+        if field in by_kind:
+            entry[field] = by_kind[field]
+    for column in ['custom_xpath', 'final_xpath', 'created_on']:
+        if columns.get(column) is not None:
+            entry[column] = columns[column]
+    entry.update(extra)
+    return entry
+
+
+class SqliteBankStore:
+    """Banks kept in one SQLite database in WAL mode"""
+
+    def __init__(self, db_path, migrate_from='output_folder'):
+        self.db_path = db_path
+        self._local = threading.local()
+        is_new = not os.path.exists(db_path)
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        conn = self._connect()
+        tracked = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'meta'").fetchone()
+        if not is_new:
+            self._upgrade(conn)
+        conn.executescript(SCHEMA)
+        if not is_new and not tracked:
+            # Created before the migration was recorded; it ran when the file was new
+            self._set_meta('migrated', 'untracked')
+        # Retried on the next start until it completes once
+        if migrate_from and os.path.isdir(migrate_from) and self._meta('migrated') is None:
+            migrated = migrate_folder(self, migrate_from)
+            self._set_meta('migrated', migrate_from)
+            print(f"Imported {len(migrated)} JSON banks into {db_path}")
+
+    def _upgrade(self, conn):
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(candidates)')]
+        if columns and 'bank' not in columns:
+            try:
+                conn.executescript('BEGIN IMMEDIATE;' + UPGRADE_PER_BANK_KEYS + 'COMMIT;')
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+
+    def _meta(self, key):
+        row = self._connect().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self._connect().execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=OFF')
+            self._local.conn = conn
+        return conn
+
+    def list_banks(self):
+        return [row[0] for row in self._connect().execute('SELECT name FROM banks ORDER BY name')]
+
+    def exists(self, name):
+        return self._connect().execute('SELECT 1 FROM banks WHERE name = ?', (name,)).fetchone() is not None
+
+    def version(self, name):
+        row = self._connect().execute('SELECT version FROM banks WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else 0
+
+    def check(self, name):
+        """Nothing to parse up front: the database is opened already"""
+
+    def signature(self, name):
+        """(signature, last_modified) identifying the current content of a bank"""
+        st = os.stat(self.db_path)
+        last_modified = st.st_mtime
+        if os.path.exists(self.db_path + '-wal'):
+            last_modified = max(last_modified, os.path.getmtime(self.db_path + '-wal'))
+        return f'{st.st_ino:x}-v{self.version(name)}', last_modified
+
+    def load(self, name):
+        return XPathBank.from_dict(self.export_dict(name))
+
+    def export_dict(self, name):
+        data = {}
+        for page_key, page_data, entry in self.iter_rows(name):
+            if page_key not in data:
+                data[page_key] = dict(page_data)
+                data[page_key]['xpaths'] = []
+            if entry is not None:
+                data[page_key]['xpaths'].append(entry)
+        return data
+
+    def iter_rows(self, name, cached=True):
+        """Yield (page_key, page_data, entry) in page and capture order, streaming from one query
+
+        Pages without entries are yielded once with entry None. There is no
+        cache to bypass, so cached is ignored.
+        """
+        cursor = self._connect().execute("""
+            SELECT p.page_key, p.page_url, p.page_full_url, p.page_name, p.display_order, p.extra,
+                   e.id, e.name, e.custom_xpath, e.final_xpath, e.created_on, e.has_visual, e.extra,
+                   c.kind, c.position, c.xpath, c.count, c.is_object
+            FROM pages p
+            LEFT JOIN entries e ON e.bank = p.bank AND e.page_key = p.page_key
+            LEFT JOIN candidates c ON c.bank = e.bank AND c.entry_id = e.id
+            WHERE p.bank = ?
+            ORDER BY p.seq, e.seq, c.position
+        """, (name,))
+        current = None
+        for row in cursor:
+            page_key, entry_id = row[0], row[6]
+            if current is None or current[0] != page_key or current[1] != entry_id:
+                if current is not None:
+                    yield self._finish_row(current)
+                page_data = {k: v for k, v in zip(PAGE_COLUMNS, row[1:5]) if v is not None}
+                page_data.update(json.loads(row[5]) if row[5] else {})
+                current = (page_key, entry_id, page_data, row[7:13], [])
+            if row[13] is not None:
+                current[4].append(row[13:18])
+        if current is not None:
+            yield self._finish_row(current)
+
+    def _finish_row(self, current):
+        page_key, entry_id, page_data, entry_row, candidates = current
+        if entry_id is None:
+            return page_key, page_data, None
+        name, custom_xpath, final_xpath, created_on, has_visual, extra = entry_row
+        columns = {'name': name, 'custom_xpath': custom_xpath, 'final_xpath': final_xpath, 'created_on': created_on}
+        return page_key, page_data, join_entry(entry_id, columns, candidates,
+                                               json.loads(extra) if extra else {}, has_visual)
+
+    def get_entry(self, name, entry_id):
+        conn = self._connect()
+        row = conn.execute("""
+            SELECT page_key, name, custom_xpath, final_xpath, created_on, has_visual, extra
+            FROM entries WHERE bank = ? AND id = ?
+        """, (name, entry_id)).fetchone()
+        if row is None:
+            return None, None
+        candidates = conn.execute(
+            'SELECT kind, position, xpath, count, is_object FROM candidates WHERE bank = ? AND entry_id = ?',
+            (name, entry_id)).fetchall()
+        columns = dict(zip(ENTRY_COLUMNS, row[1:5]))
+        return row[0], join_entry(entry_id, columns, candidates, json.loads(row[6]) if row[6] else {}, row[5])
+
+    def resolve_entry(self, name, entry_id=None, page_url=None, index=None):
+        conn = self._connect()
+        if entry_id:
+            row = conn.execute('SELECT id FROM entries WHERE bank = ? AND id = ?', (name, entry_id)).fetchone()
+        elif isinstance(index, int) and index >= 0:
+            row = conn.execute("""
+                SELECT id FROM entries WHERE bank = ? AND page_key = ?
+                ORDER BY seq LIMIT 1 OFFSET ?
+            """, (name, page_url, index)).fetchone()
+        else:
+            row = None
+        return row[0] if row else None
+
+    def add_entry(self, name, page_key, entry, page_name=None):
+        """Add a captured entry unless the page already has one with its name and final xpath
+
+        Returns the journal op, or None for a duplicate.
+        """
+        with self._transaction(name) as conn:
+            duplicate = conn.execute("""
+                SELECT 1 FROM entries WHERE bank = ? AND page_key = ? AND name IS ? AND final_xpath IS ?
+            """, (name, page_key, entry['name'], entry['final_xpath'])).fetchone()
+            if duplicate:
+                return None
+            op = {'op': 'add', 'page': page_key}
+            if not conn.execute('SELECT 1 FROM pages WHERE bank = ? AND page_key = ?', (name, page_key)).fetchone():
+                order = conn.execute('SELECT COALESCE(MAX(display_order), 0) + 1 FROM pages WHERE bank = ?',
+                                     (name,)).fetchone()[0]
+                op['page_data'] = {'page_url': page_key, 'page_full_url': page_key,
+                                   'page_name': page_name, 'display_order': order}
+            op['entry'] = entry if entry.get('id') else {'id': new_entry_id(), **entry}
+            self._add(conn, name, page_key, op['entry'], op.get('page_data'))
+            self._bump(conn, name, 1)
+            return op
+
+    def update_entry(self, name, entry_id, fields, expected_version=None):
+        return self.apply_batch(name, [{'op': 'update', 'id': entry_id, 'fields': fields}], expected_version)
+
+    def delete_entry(self, name, entry_id, expected_version=None):
+        return self.apply_batch(name, [{'op': 'delete', 'id': entry_id}], expected_version)
+
+    def apply_batch(self, name, ops, expected_version=None):
+        """Apply update/delete ops all or nothing as one change; returns the new version
+
+        Raises KeyError for an entry that does not exist (or was deleted
+        earlier in the batch) and VersionConflict if the bank is not at
+        expected_version.
+        """
+        with self._transaction(name, expected_version) as conn:
+            for op in ops:
+                if not conn.execute('SELECT 1 FROM entries WHERE bank = ? AND id = ?', (name, op['id'])).fetchone():
+                    raise KeyError(op['id'])
+                self._apply(conn, name, op)
+            return self._bump(conn, name, 1)
+
+    def append_ops(self, name, ops):
+        """Apply XPathBank journal operations as targeted statements in one transaction"""
+        with self._transaction(name) as conn:
+            for op in ops:
+                self._apply(conn, name, op)
+            return self._bump(conn, name, len(ops))
+
+    @contextmanager
+    def _transaction(self, name, expected_version=None):
+        """BEGIN IMMEDIATE: this connection is the only writer until COMMIT"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT OR IGNORE INTO banks (name, version) VALUES (?, 0)', (name,))
+            if expected_version is not None:
+                version = conn.execute('SELECT version FROM banks WHERE name = ?', (name,)).fetchone()[0]
+                if version != expected_version:
+                    raise VersionConflict(version)
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _bump(self, conn, name, changes):
+        conn.execute('UPDATE banks SET version = version + ? WHERE name = ?', (changes, name))
+        return conn.execute('SELECT version FROM banks WHERE name = ?', (name,)).fetchone()[0]
+
+    def _apply(self, conn, name, op):
+        kind = op.get('op')
+        if kind == 'add':
+            self._add(conn, name, op['page'], op['entry'], op.get('page_data'))
+        elif kind == 'update':
+            self._update(conn, name, op['id'], op['fields'])
+        elif kind == 'delete':
+            self._delete(conn, name, op['id'])
+        elif kind == 'batch':
+            for item in op['ops']:
+                self._apply(conn, name, item)
+        elif kind != 'base':
+            raise ValueError(f"Unknown operation: {kind}")
+
+    def compact(self, name):
+        return False  # Every write is already in place
+
+    def _add(self, conn, name, page_key, entry, page_data=None):
+        exists = conn.execute('SELECT 1 FROM pages WHERE bank = ? AND page_key = ?', (name, page_key)).fetchone()
+        if not exists:
+            page_data = page_data or {'page_url': page_key, 'page_full_url': page_key}
+            self._insert_page(conn, name, page_key, page_data)
+        seq = conn.execute('SELECT COALESCE(MAX(seq), -1) + 1 FROM entries WHERE bank = ? AND page_key = ?',
+                           (name, page_key)).fetchone()[0]
+        self._insert_entry(conn, name, page_key, seq, entry)
+
+    def _update(self, conn, name, entry_id, fields):
+        page_key, entry = self.get_entry(name, entry_id)
+        if entry is None:
+            return  # Entry deleted meanwhile
+        entry.update(fields)
+        seq = conn.execute('SELECT seq FROM entries WHERE bank = ? AND id = ?', (name, entry_id)).fetchone()[0]
+        conn.execute('DELETE FROM candidates WHERE bank = ? AND entry_id = ?', (name, entry_id))
+        conn.execute('DELETE FROM entries WHERE bank = ? AND id = ?', (name, entry_id))
+        self._insert_entry(conn, name, page_key, seq, entry)
+
+    def _delete(self, conn, name, entry_id):
+        row = conn.execute('SELECT page_key FROM entries WHERE bank = ? AND id = ?', (name, entry_id)).fetchone()
+        if row is None:
+            return
+        conn.execute('DELETE FROM candidates WHERE bank = ? AND entry_id = ?', (name, entry_id))
+        conn.execute('DELETE FROM entries WHERE bank = ? AND id = ?', (name, entry_id))
+        # If no xpaths left for this page, remove the parent page entry
+        left = conn.execute('SELECT 1 FROM entries WHERE bank = ? AND page_key = ? LIMIT 1', (name, row[0])).fetchone()
+        if not left:
+            conn.execute('DELETE FROM pages WHERE bank = ? AND page_key = ?', (name, row[0]))
+
+    def _insert_page(self, conn, name, page_key, page_data, seq=None):
+        if seq is None:
+            seq = conn.execute('SELECT COALESCE(MAX(seq), -1) + 1 FROM pages WHERE bank = ?', (name,)).fetchone()[0]
+        extra = {k: v for k, v in page_data.items() if k not in PAGE_COLUMNS and k != 'xpaths'}
+        conn.execute("""
+            INSERT INTO pages (bank, page_key, seq, page_url, page_full_url, page_name, display_order, extra)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (name, page_key, seq, *[page_data.get(c) for c in PAGE_COLUMNS], json.dumps(extra) if extra else None))
+
+    def _insert_entry(self, conn, name, page_key, seq, entry):
+        columns, candidates, extra, has_visual = split_entry(entry)
+        conn.execute("""
+            INSERT INTO entries (id, bank, page_key, seq, name, custom_xpath, final_xpath, created_on, has_visual, extra)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (entry['id'], name, page_key, seq, *[columns[c] for c in ENTRY_COLUMNS],
+              1 if has_visual else 0, json.dumps(extra) if extra else None))
+        conn.executemany("""
+            INSERT INTO candidates (bank, entry_id, kind, position, xpath, count, is_object)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(name, entry['id'], *candidate) for candidate in candidates])
+
+    def import_json(self, json_path, name=None):
+        """Replace a bank with the contents of a JSON bank (snapshot plus journal)"""
+        name = name or os.path.basename(json_path)
+        bank = bank_journal.load_bank(json_path)
+        with self._transaction(name) as conn:
+            conn.execute('DELETE FROM candidates WHERE bank = ?', (name,))
+            conn.execute('DELETE FROM entries WHERE bank = ?', (name,))
+            conn.execute('DELETE FROM pages WHERE bank = ?', (name,))
+            for page_seq, (page_key, page_data) in enumerate(bank.pages.items()):
+                self._insert_page(conn, name, page_key, page_data, seq=page_seq)
+                for seq, entry in enumerate(bank.entries(page_key)):
+                    self._insert_entry(conn, name, page_key, seq, entry)
+            self._bump(conn, name, 1)
+        return len(bank)
+
+    def export_json(self, name, json_path):
+        bank_journal.write_snapshot(json_path, self.export_dict(name))
+
+
+def migrate_folder(store, folder):
+    """One-shot import of every JSON bank in folder"""
+    migrated = []
+    for name in bank_journal.list_banks(folder):
+        store.import_json(os.path.join(folder, name), name)
+        migrated.append(name)
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import/export xpath banks between JSON and SQLite')
+    parser.add_argument('--db', default=os.path.join('output_folder', 'banks.sqlite3'))
+    sub = parser.add_subparsers(dest='command', required=True)
+    import_cmd = sub.add_parser('import', help='Import JSON banks (replaces banks of the same name)')
+    import_cmd.add_argument('files', nargs='+')
+    export_cmd = sub.add_parser('export', help='Export banks to JSON')
+    export_cmd.add_argument('names', nargs='*', help='Bank names, e.g. google.com.json (default: all)')
+    export_cmd.add_argument('--dest', default='output_folder')
+    migrate_cmd = sub.add_parser('migrate', help='Import every JSON bank in a folder')
+    migrate_cmd.add_argument('folder', nargs='?', default='output_folder')
+    args = parser.parse_args()
+
+    store = SqliteBankStore(args.db, migrate_from=None)
+    if args.command == 'import':
+        for path in args.files:
+            count = store.import_json(path)
+            print(f"Imported {count} xpaths from {path}")
+    elif args.command == 'export':
+        os.makedirs(args.dest, exist_ok=True)
+        for name in args.names or store.list_banks():
+            store.export_json(name, os.path.join(args.dest, name))
+            print(f"Exported {name} to {args.dest}")
+    elif args.command == 'migrate':
+        for name in migrate_folder(store, args.folder):
+            print(f"Imported {name}")
+
+
+if __name__ == '__main__':
+    main()
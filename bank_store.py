@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+
+import bank_journal
+from bank_cache import DEFAULT_MAX_MB, BankCache
+
+# Storage backends for xpath banks. A bank is addressed by its file name
+# ("<domain>.json") whatever the backend, so the UI and the CSV/JSON formats
+# do not change. Select the backend with "storage_backend" in config.json:
+# "json" (default) or "sqlite".
+
+OUTPUT_FOLDER = 'output_folder'
+
+_stores = {}
+
+
+class JsonBankStore:
+    """Banks kept as output_folder/<domain>.json snapshots plus journals
+
+    With a BankCache, parsed banks are shared between calls until their files
+    change; the bank returned by load() must then only be changed through
+    write_ops and the methods built on it.
+    """
+
+    def __init__(self, folder=OUTPUT_FOLDER, cache=None):
+        self.folder = folder
+        self.cache = cache
+        self._locks = {}  # bank name -> RLock around reading and changing its cached XPathBank
+        self._listing = (None, [])  # (folder mtime, bank names)
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def list_banks(self):
+        try:
+            mtime = os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        # The folder's mtime changes whenever a bank file is created or removed
+        if self._listing[0] != mtime:
+            self._listing = (mtime, bank_journal.list_banks(self.folder))
+        return list(self._listing[1])
+
+    def exists(self, name):
+        return bank_journal.bank_exists(self.path(name))
+
+    def file_state(self, name):
+        """(mtime_ns, size, inode) of the snapshot and of the journal; None for a missing file"""
+        state = []
+        for path in (self.path(name), bank_journal.journal_path(self.path(name))):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                state.append(None)
+                continue
+            state.append((st.st_mtime_ns, st.st_size, st.st_ino))
+        return tuple(state)
+
+    def _lock(self, name):
+        return self._locks.setdefault(name, threading.RLock())
+
+    def load(self, name):
+        if self.cache is None:
+            return bank_journal.load_bank(self.path(name))
+        # Concurrent readers wait for one parse instead of parsing in parallel
+        with self._lock(name):
+            state = self.file_state(name)
+            bank = self.cache.get(name, state)
+            if bank is None:
+                # Files changed after the stat only make the entry stale sooner
+                bank = bank_journal.load_bank(self.path(name))
+                self.cache.put(name, state, bank)
+            return bank
+
+    def export_dict(self, name):
+        with self._lock(name):
+            return self.load(name).to_dict()
+
+    def signature(self, name):
+        """(signature, last_modified) identifying the current content of a bank"""
+        parts = []
+        last_modified = 0
+        for part in self.file_state(name):
+            if part is None:
+                parts.append('-')
+                continue
+            mtime_ns, size, inode = part
+            parts.append(f'{mtime_ns:x}-{size:x}-{inode:x}')
+            last_modified = max(last_modified, mtime_ns / 1e9)
+        return '.'.join(parts), last_modified
+
+    def iter_rows(self, name, cached=True):
+        """Yield (page_key, page_data, entry) in page and capture order
+
+        Pages without entries are yielded once with entry None. With
+        cached=False the bank is read from its files and not kept, so a
+        one-off pass such as an export does not evict the banks in use.
+        """
+        bank = self.load(name) if cached else bank_journal.load_bank(self.path(name))
+        for page_key, page_data in list(bank.pages.items()):
+            entries = bank.entries(page_key)
+            if not entries:
+                yield page_key, page_data, None
+            for entry in entries:
+                yield page_key, page_data, entry
+
+    def resolve_entry(self, name, entry_id=None, page_url=None, index=None):
+        bank = self.load(name)
+        if entry_id:
+            return entry_id if entry_id in bank else None
+        return bank.entry_at(page_url, index)
+
+    def version(self, name):
+        return bank_journal.current_version(self.path(name))
+
+    def check(self, name):
+        """Parse the snapshot only; raises json.JSONDecodeError if it is unreadable"""
+        bank_journal.read_snapshot(self.path(name))
+
+    def add_entry(self, name, page_key, entry, page_name=None):
+        """Add a captured entry unless the page already has one with its name and final xpath
+
+        Returns the journal op, or None for a duplicate.
+        """
+        def change(bank):
+            if bank.find_duplicate(page_key, entry['name'], entry['final_xpath']) is not None:
+                return []
+            return [bank.add(page_key, entry, page_name=page_name)]
+        ops, _ = self.write_ops(name, change)
+        return ops[0] if ops else None
+
+    def update_entry(self, name, entry_id, fields, expected_version=None):
+        return self.write_ops(name, lambda bank: [bank.update(entry_id, fields)], expected_version)[1]
+
+    def delete_entry(self, name, entry_id, expected_version=None):
+        return self.write_ops(name, lambda bank: [bank.delete(entry_id)], expected_version)[1]
+
+    def apply_batch(self, name, ops, expected_version=None):
+        """Apply update/delete ops as one journal line; returns the new version"""
+        return self.write_ops(name, lambda bank: [bank.batch(ops)], expected_version)[1]
+
+    def write_ops(self, name, change, expected_version=None):
+        """Apply change(bank) -> [journal ops] to the current bank and append the ops
+
+        The bank's lock file is held throughout, so the web app and capture
+        sessions take turns as the only writer: the bank read here is the
+        latest, and nothing else is written until these ops are in the journal.
+        Raises VersionConflict if the bank is not at expected_version.
+        Returns (ops, new version).
+        """
+        path = self.path(name)
+        os.makedirs(self.folder, exist_ok=True)
+        with self._lock(name), bank_journal.bank_lock(path):
+            bank = self.load(name)
+            if expected_version is not None and bank.version != expected_version:
+                raise bank_journal.VersionConflict(bank.version)
+            ops = change(bank)  # KeyError before anything changes for an unknown entry
+            if not ops:
+                return ops, bank.version
+            try:
+                bank.version = bank_journal.append_locked(path, ops)
+            except BaseException:
+                if self.cache:
+                    self.cache.invalidate(name)
+                raise
+            if self.cache:
+                # Nobody else could write meanwhile, so the cached bank is current
+                self.cache.written(name, bank, self.file_state(name))
+            return ops, bank.version
+
+    def append_ops(self, name, ops):
+        os.makedirs(self.folder, exist_ok=True)
+        return bank_journal.append_ops(self.path(name), ops)
+
+    def compact(self, name):
+        return bank_journal.compact(self.path(name))
+
+
+def read_config(config_path='config.json'):
+    if os.path.exists(config_path):
+        with open(config_path, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def get_store(config=None):
+    """Return the store selected by config.json, creating it on first use"""
+    if config is None:
+        config = read_config()
+    backend = config.get('storage_backend', 'json')
+    if backend not in _stores:
+        if backend == 'sqlite':
+            from bank_sqlite import SqliteBankStore
+            _stores[backend] = SqliteBankStore(config.get('sqlite_path', os.path.join(OUTPUT_FOLDER, 'banks.sqlite3')))
+        elif backend == 'json':
+            cache_mb = config.get('bank_cache_mb', DEFAULT_MAX_MB)
+            _stores[backend] = JsonBankStore(cache=BankCache(cache_mb * 2**20) if cache_mb else None)
+        else:
+            raise ValueError(f"Unknown storage_backend: {backend}")
+    return _stores[backend]
@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from selenium.webdriver.support.ui import WebDriverWait
+
+from bank_store import get_store, read_config
+from browser import DRIVER_PATH, create_driver
+from recheck import write_validation_report
+from xpath_evaluator import evaluate_xpaths, existence_map
+
+# Unattended recheck: every page of a bank is opened by a pool of headless
+# Edge sessions, its final_xpaths are validated in one batched script call and
+# the results are appended to the daily reports/<date>.csv like the
+# interactive recheck does. A JSON summary with per-page timings is written
+# next to it.
+
+REPORTS_FOLDER = 'reports'
+
+_report_lock = threading.Lock()
+
+
+def collect_pages(store, bank_name):
+    """[(page_key, url_to_open, xpaths_data)] for every page with final xpaths"""
+    pages = {}
+    for page_key, page_data, entry in store.iter_rows(bank_name):
+        if page_key not in pages:
+            pages[page_key] = (page_data.get('page_full_url') or page_data.get('page_url') or page_key, [])
+        if entry is not None and entry.get('final_xpath'):
+            pages[page_key][1].append({
+                'xpath': entry['final_xpath'],
+                'name': entry.get('name', ''),
+                'page_url': page_key,
+                'entry_id': entry.get('id', '')
+            })
+    return [(key, url, xpaths_data) for key, (url, xpaths_data) in pages.items() if xpaths_data]
+
+
+def check_page(driver, url, xpaths_data, page_timeout=30, settle=0.5):
+    """Open one page and return {xpath: exists}"""
+    driver.get(url)
+    WebDriverWait(driver, page_timeout).until(
+        lambda d: d.execute_script('return document.readyState') == 'complete')
+    time.sleep(settle)  # Let client-side rendering finish
+    return existence_map(evaluate_xpaths(driver, [item['xpath'] for item in xpaths_data]))
+
+
+def _worker(work, results, options, stop_event, progress):
+    driver = None
+    try:
+        driver = create_driver(headless=options['headless'], driver_path=options['driver_path'])
+        driver.set_page_load_timeout(options['page_timeout'])
+        while not stop_event.is_set():
+            try:
+                page_key, url, xpaths_data = work.get_nowait()
+            except queue.Empty:
+                break
+            start = time.perf_counter()
+            page_result = {'page_url': page_key, 'xpaths': len(xpaths_data), 'found': 0, 'error': None}
+            try:
+                existence = check_page(driver, url, xpaths_data, options['page_timeout'], options['settle'])
+                page_result['found'] = sum(1 for item in xpaths_data if existence.get(item['xpath']))
+                with _report_lock:
+                    write_validation_report(xpaths_data, existence)
+            except Exception as e:
+                page_result['error'] = str(e).splitlines()[0] if str(e) else type(e).__name__
+            page_result['seconds'] = round(time.perf_counter() - start, 3)
+            results.append(page_result)
+            if progress:
+                progress(page_result)
+    except Exception as e:
+        # The session itself could not start; leave its pages to the other workers
+        print(f"[batch] worker failed: {e}", flush=True)
+    finally:
+        if driver:
+            driver.quit()
+
+
+def run_batch(bank_name, workers=4, headless=True, page_timeout=30, settle=0.5,
+              store=None, driver_path=None, progress=None, stop_event=None):
+    """Recheck every page of a bank with a pool of browser sessions
+
+    Returns a summary dict with per-page results and pages/minute throughput.
+    """
+    store = store or get_store(read_config())
+    if not store.exists(bank_name):
+        raise FileNotFoundError(f"Bank not found: {bank_name}")
+    stop_event = stop_event or threading.Event()
+    pages = collect_pages(store, bank_name)
+
+    work = queue.Queue()
+    for page in pages:
+        work.put(page)
+    results = []
+    options = {'headless': headless, 'page_timeout': page_timeout, 'settle': settle,
+               'driver_path': driver_path or DRIVER_PATH}
+
+    started_on = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    started = time.perf_counter()
+    threads = [threading.Thread(target=_worker, args=(work, results, options, stop_event, progress), daemon=True)
+               for _ in range(max(1, min(workers, len(pages))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    checked = [r for r in results if r['error'] is None]
+    return {
+        'bank': bank_name,
+        'started_on': started_on,
+        'workers': len(threads),
+        'pages': len(pages),
+        'pages_checked': len(checked),
+        'pages_failed': len(results) - len(checked),
+        'pages_skipped': len(pages) - len(results),
+        'xpaths': sum(r['xpaths'] for r in checked),
+        'found': sum(r['found'] for r in checked),
+        'elapsed_seconds': round(elapsed, 3),
+        'pages_per_minute': round(len(results) / elapsed * 60, 2) if elapsed > 0 else 0,
+        'page_results': sorted(results, key=lambda r: r['seconds'], reverse=True)
+    }
+
+
+def write_summary(summary, folder=REPORTS_FOLDER):
+    """Save a batch summary as reports/batch-<timestamp>-<bank>.json"""
+    os.makedirs(folder, exist_ok=True)
+    stamp = datetime.now().strftime('%Y-%m-%d_%H%M%S')
+    path = os.path.join(folder, f"batch-{stamp}-{summary['bank'].replace('.json', '')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=4)
+    return path
+
+
+def print_page_result(result):
+    status = f"ERROR {result['error']}" if result['error'] else f"{result['found']}/{result['xpaths']} found"
+    print(f"[batch] {result['seconds']:7.2f}s  {status}  {result['page_url']}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Recheck every page of a bank with headless browsers')
+    parser.add_argument('bank', help='Bank name, e.g. google.com.json')
+    parser.add_argument('--workers', type=int, default=4, help='Number of parallel browser sessions')
+    parser.add_argument('--headed', action='store_true', help='Show the browser windows')
+    parser.add_argument('--timeout', type=float, default=30, help='Page load timeout in seconds')
+    parser.add_argument('--settle', type=float, default=0.5, help='Seconds to wait after load before validating')
+    parser.add_argument('--driver', default=DRIVER_PATH)
+    args = parser.parse_args()
+
+    summary = run_batch(args.bank, workers=args.workers, headless=not args.headed,
+                        page_timeout=args.timeout, settle=args.settle,
+                        driver_path=args.driver, progress=print_page_result)
+    path = write_summary(summary)
+    print(f"Checked {summary['pages_checked']}/{summary['pages']} pages "
+          f"({summary['pages_failed']} failed) in {summary['elapsed_seconds']:.1f}s "
+          f"with {summary['workers']} workers: {summary['pages_per_minute']} pages/min, "
+          f"{summary['found']}/{summary['xpaths']} xpaths found")
+    print(f"Summary written to {path}")
+
+
+if __name__ == '__main__':
+    main()
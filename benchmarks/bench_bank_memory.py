@@ -0,0 +1,106 @@
+"""Compare the memory of a loaded bank as plain dicts and as compact records.
+
+Builds a synthetic bank in the output_folder/<domain>.json schema (legacy
+entries with 11 visual candidates, mostly empty, and newer entries with
+{"xpath", "count"} candidates), then measures with tracemalloc:
+
+  dicts    the parsed JSON, i.e. what a bank cost before EntryRecord
+  records  the same entries as EntryRecords
+  bank     a full XPathBank (records plus its hash indexes)
+
+and checks that the compact bank writes back exactly the same JSON.
+
+    python benchmarks/bench_bank_memory.py --entries 50000
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank_records import EntryRecord
+from xpath_bank import XPathBank
+
+VISUAL_KEYS = ['text', 'tag_text', 'tag_contains', 'placeholder', 'value', 'accessibility', 'name', 'href',
+               'src', 'alt', 'title']
+
+
+def build_bank(entries, pages, legacy_share):
+    data = {}
+    for i in range(entries):
+        page_key = f'https://shop.example.com/catalog/page-{i % pages}?view=list'
+        page = data.setdefault(page_key, {'page_url': page_key, 'page_full_url': page_key,
+                                          'page_name': f'Catalog {i % pages}', 'display_order': i % pages + 1,
+                                          'xpaths': []})
+        text = f'Product {i}'
+        if i % 100 < legacy_share:
+            visual = {key: '' for key in VISUAL_KEYS}
+            visual.update({'text': f"//*[text()='{text}']", 'tag_text': f"//span[text()='{text}']",
+                           'tag_contains': f"//span[contains(text(),'{text}')]"})
+            candidates = {'relative_xpath': f'//div[@id="p{i}"]/span', 'full_xpath': f'/html/body/div[2]/div[{i}]/span',
+                          'css_selector': f'#p{i} > span'}
+        else:
+            visual = {'text': {'xpath': f"//*[text()='{text}']", 'count': 1},
+                      'tag_text': {'xpath': f"//span[text()='{text}']", 'count': 1},
+                      'title': {'xpath': f"//*[@title='{text}']", 'count': 2}}
+            candidates = {'relative_xpath': {'xpath': f'//div[@id="p{i}"]/span', 'count': 1},
+                          'full_xpath': {'xpath': f'/html/body/div[2]/div[{i}]/span', 'count': 1},
+                          'css_selector': {'xpath': f'#p{i} > span', 'count': 1}}
+        page['xpaths'].append({'id': f'{i:012x}', 'name': text, 'visual_xpath': visual, **candidates,
+                               'custom_xpath': '', 'final_xpath': f"//span[text()='{text}']",
+                               'created_on': f'2025-12-{i % 28 + 1:02d} 10:{i % 60:02d}:00'})
+    return json.dumps(data, indent=4)
+
+
+def measure(build):
+    """(bytes still allocated by the built object, seconds, object)"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, seconds, result
+
+
+def run(args):
+    text = build_bank(args.entries, args.pages, args.legacy_share)
+    print(f"Entries: {args.entries}  Pages: {args.pages}  Legacy share: {args.legacy_share}%  "
+          f"File: {len(text) / 2**20:.1f} MiB")
+
+    dict_bytes, dict_seconds, parsed = measure(lambda: json.loads(text))
+    del parsed
+
+    def records():
+        data = json.loads(text)
+        return [EntryRecord.from_dict(entry) for page in data.values() for entry in page['xpaths']]
+    record_bytes, record_seconds, compact = measure(records)
+    del compact
+
+    bank_bytes, bank_seconds, bank = measure(lambda: XPathBank.from_dict(json.loads(text)))
+
+    for label, size, seconds in (('dicts (json.loads)', dict_bytes, dict_seconds),
+                                 ('records', record_bytes, record_seconds),
+                                 ('XPathBank with indexes', bank_bytes, bank_seconds)):
+        print(f"  {label:<24} {size / 2**20:8.1f} MiB  {size / args.entries:7.0f} B/entry  "
+              f"{seconds * 1000:8.0f} ms to load")
+    print(f"  records vs dicts         {record_bytes / dict_bytes:8.0%}")
+
+    start = time.perf_counter()
+    written = json.dumps(bank.to_dict(), indent=4)
+    print(f"  to_dict + dump           {(time.perf_counter() - start) * 1000:8.0f} ms")
+    print(f"  round trip identical     {written == text}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=50000)
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--legacy-share', type=int, default=50, help='Percent of entries in the legacy string form')
+    run(parser.parse_args())
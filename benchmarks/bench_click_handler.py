@@ -0,0 +1,143 @@
+"""Measure the collector's click handling on a large synthetic page.
+
+Compares the previous handler (every candidate counted with a full ordered
+snapshot, inside the click listener) with static/collector.js (the click only
+records candidates; counting runs afterwards from the page's frequency index,
+with bounded, cached XPath counts for the rest).
+
+    python benchmarks/bench_click_handler.py --rows 5000 --clicks 50 --headless
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from browser import DRIVER_PATH, create_driver
+
+COLLECTOR_JS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'collector.js')
+
+
+def build_page(rows):
+    # ~10 elements per row; texts, names and classes repeat on every row so
+    # text and attribute candidates match thousands of nodes
+    items = ''.join(
+        f'<div class="row"><span>Item {i}</span><span class="tag">Open</span>'
+        f'<input name="qty" placeholder="Quantity {i}" value="1"><a href="#item{i}" title="Open item">Open</a>'
+        f'<button class="btn primary">Add</button><ul><li>Detail</li><li>Price {i % 100}</li></ul></div>'
+        for i in range(rows)
+    )
+    script = "document.addEventListener('click', e => e.preventDefault());"
+    return f'<html><head><title>Synthetic</title></head><body>{items}<script>{script}</script></body></html>'
+
+
+# Runs in the page: clicks sampled elements and times both handlers
+MEASURE_SCRIPT = """
+var clicks = arguments[0];
+var collector = window.xpathCollector;
+collector.buildIndex();  // Normally an idle callback after load
+
+function snapshotCount(xpath) {
+    try {
+        return document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null).snapshotLength;
+    } catch (e) {
+        return 0;
+    }
+}
+
+function previousHandler(element) {
+    var data = collector.buildClickData(element);
+    var counts = {};
+    for (var key in data.visual_xpath) {
+        if (data.visual_xpath[key]) counts[key] = snapshotCount(data.visual_xpath[key]);
+    }
+    counts.relative_xpath = snapshotCount(data.relative_xpath);
+    counts.full_xpath = snapshotCount(data.full_xpath);
+    try { counts.css_selector = document.querySelectorAll(data.css_selector).length; } catch (e) { counts.css_selector = 0; }
+    return counts;
+}
+
+function bucket(count) {
+    return count === 0 ? 0 : (count === 1 ? 1 : 2);
+}
+
+var elements = document.querySelectorAll('body *:not(script)');
+var targets = [];
+for (var i = 0; i < clicks; i++) {
+    targets.push(elements[Math.floor((i * 7919) % elements.length)]);
+}
+
+var result = {nodes: document.getElementsByTagName('*').length, previous: [], clickPath: [], deferred: [], mismatches: 0};
+targets.forEach(function(element) {
+    var start = performance.now();
+    var expected = previousHandler(element);
+    result.previous.push(performance.now() - start);
+
+    start = performance.now();
+    element.click();
+    result.clickPath.push(performance.now() - start);
+
+    // Run the deferred work now instead of waiting for an idle period
+    start = performance.now();
+    collector.flush();
+    result.deferred.push(performance.now() - start);
+
+    var data = collector.countClickData(collector.buildClickData(element));
+    var actual = Object.assign({}, data.visual_xpath_counts, {
+        relative_xpath: data.relative_xpath_count, full_xpath: data.full_xpath_count, css_selector: data.css_selector_count
+    });
+    for (var key in expected) {
+        if (bucket(expected[key]) !== bucket(actual[key])) result.mismatches++;
+    }
+});
+result.stats = collector.stats;
+return result;
+"""
+
+
+def summarize(values):
+    ordered = sorted(values)
+    return {'mean': sum(ordered) / len(ordered), 'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            'max': ordered[-1]}
+
+
+def run(args):
+    driver = create_driver(headless=args.headless, driver_path=args.driver)
+    page_file = tempfile.NamedTemporaryFile('w', suffix='.html', delete=False, encoding='utf-8')
+    try:
+        page_file.write(build_page(args.rows))
+        page_file.close()
+        driver.get('file:///' + page_file.name.replace(os.sep, '/'))
+        with open(COLLECTOR_JS, 'r', encoding='utf-8') as f:
+            # No wsUrl: clicks are counted but not sent anywhere
+            driver.execute_script('window.xpathCollectorConfig = {};\n' + f.read())
+        result = driver.execute_script(MEASURE_SCRIPT, args.clicks)
+
+        print(f"Rows: {args.rows}  Nodes: {result['nodes']}  Clicks: {args.clicks}")
+        for name, label in (('previous', 'previous handler (on click path)'),
+                            ('clickPath', 'new handler (on click path)'),
+                            ('deferred', 'new deferred counting')):
+            stats = summarize(result[name])
+            print(f"  {label:<34} mean {stats['mean']:8.2f} ms  p95 {stats['p95']:8.2f} ms  max {stats['max']:8.2f} ms")
+        speedup = sum(result['previous']) / max(sum(result['clickPath']), 1e-6)
+        print(f"  click path speedup                 {speedup:.0f}x")
+        hits, misses = result['stats']['cacheHits'], result['stats']['cacheMisses']
+        print(f"  count cache hit rate               {hits / max(hits + misses, 1):.0%}")
+        print(f"  index build                        {result['stats']['indexBuildMs']:.1f} ms, "
+              f"{result['stats']['indexKeys']} keys, {result['stats']['indexLookups']} lookups")
+        print(f"  attribute combinations             {result['stats']['combinationsFound']} found, "
+              f"{result['stats']['combinationsTried']} tried")
+        print(f"  0/1/many mismatches                {result['mismatches']}")
+    finally:
+        driver.quit()
+        os.remove(page_file.name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--clicks', type=int, default=50)
+    parser.add_argument('--headless', action='store_true')
+    parser.add_argument('--driver', default=DRIVER_PATH)
+    run(parser.parse_args())
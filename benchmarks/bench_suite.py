@@ -0,0 +1,486 @@
+"""Benchmark suite for the capture and recheck pipelines.
+
+Serves synthetic pages from a local HTTP server and drives the real code paths
+in-process:
+
+  bank      journal append, compaction, /load_json and /download_csv as a
+            bank grows (1k to 100k entries by default)
+  ws        click-to-persisted latency and throughput of main.ws_handler with
+            collector-shaped messages (no browser)
+  click     click-to-persisted latency from a headless Edge running
+            static/collector.js on synthetic pages
+  validate  locators/s through the control channel's "validate" request
+            (main.validate_xpaths) on synthetic pages
+
+Results are written as JSON (meta plus a flat "metrics" map) so runs of
+different versions can be compared with --compare.
+
+    python benchmarks/bench_suite.py --headless
+    python benchmarks/bench_suite.py --scenarios bank,ws --bank-sizes 1000,10000,100000
+    python benchmarks/bench_suite.py --headless --compare benchmarks/results/<older>.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import websockets
+
+import main
+import recheck
+import web_app
+from bank_store import get_store
+from browser import DRIVER_PATH, create_driver
+from capture_channel import CaptureChannel, default_uri
+from session_manager import free_port
+from xpath_bank import XPathBank
+
+SCENARIOS = ('bank', 'ws', 'click', 'validate')
+RESULTS_FOLDER = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+BENCH_BANK = 'bench.json'
+DUPLICATE_TEXTS = ['Open', 'Add', 'Edit', 'Delete', 'Details', 'Save', 'Cancel', 'More']
+
+
+# --- Synthetic pages ---
+
+def build_page(nodes, depth, duplicates):
+    """About `nodes` elements in rows nested `depth` divs deep
+
+    Every row has a unique "Item N" span; link and button texts and input
+    names cycle through `duplicates` values, so text and attribute locators
+    match many nodes.
+    """
+    per_row = depth + 5
+    rows = max(1, nodes // per_row)
+    parts = []
+    for i in range(rows):
+        text = DUPLICATE_TEXTS[i % duplicates % len(DUPLICATE_TEXTS)]
+        parts.append('<div class="level">' * depth)
+        parts.append(f'<span class="item">Item {i}</span><a href="#item{i}">{text}</a>'
+                     f'<button class="btn">{text}</button><input name="field{i % duplicates}" '
+                     f'placeholder="Field {i}"><label>{text} {i % duplicates}</label>')
+        parts.append('</div>' * depth)
+    return ('<html><head><title>Synthetic</title></head><body>'
+            f'<div id="content" data-rows="{rows}">{"".join(parts)}</div></body></html>')
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """GET /page?nodes=N&depth=D&duplicates=K serves build_page(N, D, K)"""
+
+    cache = {}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/page':
+            self.send_error(404)
+            return
+        args = parse_qs(url.query)
+        key = tuple(int(args.get(name, [default])[0])
+                    for name, default in (('nodes', 1000), ('depth', 10), ('duplicates', 4)))
+        if key not in self.cache:
+            self.cache[key] = build_page(*key).encode('utf-8')
+        body = self.cache[key]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_page_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def page_url(server, nodes, args):
+    return (f'http://127.0.0.1:{server.server_address[1]}/page'
+            f'?nodes={nodes}&depth={args.depth}&duplicates={args.duplicates}')
+
+
+# --- Helpers ---
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def timed(function, repeat=1):
+    """Best wall time of `repeat` calls, in ms"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def click_message(i, page_count=20):
+    """A click message shaped like the one static/collector.js sends"""
+    text = f'Bench item {i}'
+    return {
+        'name': text,
+        'visual_xpath': {'text': f"//*[text()='{text}']", 'tag_text': f"//span[text()='{text}']",
+                         'tag_contains': f"//span[contains(text(),'{text}')]"},
+        'visual_xpath_counts': {'text': 1, 'tag_text': 1, 'tag_contains': 2},
+        'relative_xpath': f"//div[@id='row{i}']/span", 'relative_xpath_count': 1,
+        'full_xpath': f'/html/body/div[1]/div[{i + 1}]/span', 'full_xpath_count': 1,
+        'css_selector': f'#row{i} > span', 'css_selector_count': 1,
+        'page_url': f'http://bench.local/page{i % page_count}',
+        'page_name': f'Bench page {i % page_count}'
+    }
+
+
+def bank_entry(i):
+    message = click_message(i)
+    return {
+        'name': message['name'],
+        'visual_xpath': {k: {'xpath': v, 'count': message['visual_xpath_counts'][k]}
+                         for k, v in message['visual_xpath'].items()},
+        'relative_xpath': {'xpath': message['relative_xpath'], 'count': 1},
+        'full_xpath': {'xpath': message['full_xpath'], 'count': 1},
+        'css_selector': {'xpath': message['css_selector'], 'count': 1},
+        'custom_xpath': '',
+        'final_xpath': message['visual_xpath']['tag_text'],
+        'created_on': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }, message['page_url'], message['page_name']
+
+
+@contextlib.contextmanager
+def persisted_events(store):
+    """Yield a queue receiving (time, op) after every entry store.add_entry adds"""
+    events = queue.Queue()
+    original = store.add_entry
+
+    def add_entry(*args, **kwargs):
+        op = original(*args, **kwargs)
+        if op:
+            events.put((time.perf_counter(), op))
+        return op
+
+    store.add_entry = add_entry
+    try:
+        yield events
+    finally:
+        del store.add_entry
+
+
+@contextlib.contextmanager
+def capture_server(store):
+    """Run main.py's WebSocket server in this process on a free port"""
+    main.store = store
+    main.bank_name = BENCH_BANK
+    main.ws_port = free_port()
+    main.stop_event = threading.Event()
+    thread = threading.Thread(target=main.start_ws_server_thread, daemon=True)
+    with contextlib.redirect_stdout(io.StringIO()):  # One line per capture otherwise
+        thread.start()
+        channel = CaptureChannel(default_uri(main.ws_port)).start()
+        try:
+            wait_for(lambda: channel.connected, 10, 'capture WebSocket server')
+            yield channel
+        finally:
+            channel.close()
+            main.stop_event.set()
+            thread.join(timeout=5)
+
+
+def wait_for(condition, timeout, what):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise TimeoutError(f'Timed out waiting for {what}')
+        time.sleep(0.02)
+
+
+def latency_metrics(prefix, latencies, metrics):
+    metrics[f'{prefix}.latency_mean_ms'] = sum(latencies) / len(latencies)
+    metrics[f'{prefix}.latency_p50_ms'] = percentile(latencies, 0.5)
+    metrics[f'{prefix}.latency_p95_ms'] = percentile(latencies, 0.95)
+    metrics[f'{prefix}.latency_max_ms'] = max(latencies)
+
+
+# --- Scenarios ---
+
+def bench_bank(args, metrics):
+    """Journal appends, compaction and web app reads as the bank grows"""
+    store = get_store()
+    client = web_app.app.test_client()
+    model = XPathBank()
+    size = 0
+    for target in args.bank_sizes:
+        grown = max(0, target - size)
+        start = time.perf_counter()
+        while size < target:
+            chunk = min(1000, target - size)
+            ops = []
+            for i in range(size, size + chunk):
+                entry, page_key, page_name = bank_entry(i)
+                ops.append(model.add(page_key, entry, page_name=page_name))
+            store.append_ops(BENCH_BANK, ops)
+            size += chunk
+        grow_seconds = time.perf_counter() - start
+        prefix = f'bank.{target}'
+        metrics[f'{prefix}.bulk_append_entries_per_s'] = grown / grow_seconds if grow_seconds else None
+        metrics[f'{prefix}.compact_ms'] = timed(lambda: store.compact(BENCH_BANK))
+
+        single = []
+        for _ in range(args.repeat * 5):
+            entry, page_key, page_name = bank_entry(size)
+            op = model.add(page_key, entry, page_name=page_name)
+            single.append(timed(lambda: store.append_ops(BENCH_BANK, [op])))
+            size += 1
+        metrics[f'{prefix}.append_one_p50_ms'] = percentile(single, 0.5)
+        metrics[f'{prefix}.append_one_max_ms'] = max(single)
+        store.compact(BENCH_BANK)
+        snapshot = os.path.join('output_folder', BENCH_BANK)
+        if os.path.exists(snapshot):
+            metrics[f'{prefix}.snapshot_bytes'] = os.path.getsize(snapshot)
+
+        metrics[f'{prefix}.load_bank_ms'] = timed(lambda: store.load(BENCH_BANK), args.repeat)
+        for name, url in (('load_json_ms', f'/load_json/{BENCH_BANK}'),
+                          ('load_json_page_ms', f'/load_json/{BENCH_BANK}?page=1&page_size=20'),
+                          ('download_csv_ms', f'/download_csv/{BENCH_BANK}')):
+            def fetch():
+                response = client.get(url)
+                if response.status_code != 200:
+                    raise RuntimeError(f'{url} returned {response.status_code}')
+                response.get_data()  # Drain streamed exports
+            metrics[f'{prefix}.{name}'] = timed(fetch, args.repeat)
+        print(f"  bank {target:>7} entries: append one {metrics[f'{prefix}.append_one_p50_ms']:.2f} ms, "
+              f"compact {metrics[f'{prefix}.compact_ms']:.0f} ms, /load_json {metrics[f'{prefix}.load_json_ms']:.0f} ms, "
+              f"/download_csv {metrics[f'{prefix}.download_csv_ms']:.0f} ms")
+
+
+def bench_ws(args, metrics):
+    """Click messages straight into main.ws_handler, one at a time and as a burst"""
+    store = get_store()
+    with capture_server(store) as channel, persisted_events(store) as events:
+        async def send_all():
+            async with websockets.connect(channel.uri) as websocket:
+                loop = asyncio.get_running_loop()
+                latencies = []
+                for i in range(args.clicks):
+                    start = time.perf_counter()
+                    await websocket.send(json.dumps(click_message(1000000 + i)))
+                    persisted, _ = await loop.run_in_executor(None, events.get, True, 10)
+                    latencies.append((persisted - start) * 1000)
+
+                start = time.perf_counter()
+                for i in range(args.clicks):
+                    await websocket.send(json.dumps(click_message(2000000 + i)))
+                for _ in range(args.clicks):
+                    persisted, _ = await loop.run_in_executor(None, events.get, True, 10)
+                return latencies, args.clicks / (persisted - start)
+
+        latencies, throughput = asyncio.run(send_all())
+    latency_metrics('ws_click', latencies, metrics)
+    metrics['ws_click.burst_clicks_per_s'] = throughput
+    print(f"  ws_handler: p50 {metrics['ws_click.latency_p50_ms']:.2f} ms, "
+          f"p95 {metrics['ws_click.latency_p95_ms']:.2f} ms, burst {throughput:.0f} clicks/s")
+
+
+def load_page(driver, server, nodes, args):
+    driver.get(page_url(server, nodes, args))
+    return driver.execute_script("return document.getElementsByTagName('*').length")
+
+
+def bench_click(args, metrics, driver, server):
+    """Real clicks in Edge through static/collector.js to the journal"""
+    store = get_store()
+    with capture_server(store), persisted_events(store) as events:
+        for nodes in args.page_sizes:
+            element_count = load_page(driver, server, nodes, args)
+            driver.execute_script(main.collector_script())
+            rows = driver.execute_script("return document.querySelectorAll('span.item').length")
+            clicks = min(args.clicks, rows)
+            latencies = []
+            for i in range(clicks):
+                start = time.perf_counter()
+                driver.execute_script("document.querySelectorAll('span.item')[arguments[0]].click()",
+                                      (i * 7919) % rows)
+                persisted, _ = events.get(timeout=30)
+                latencies.append((persisted - start) * 1000)
+            prefix = f'click.{nodes}'
+            metrics[f'{prefix}.elements'] = element_count
+            latency_metrics(prefix, latencies, metrics)
+            print(f"  click on {element_count:>7} elements: p50 {metrics[f'{prefix}.latency_p50_ms']:.1f} ms, "
+                  f"p95 {metrics[f'{prefix}.latency_p95_ms']:.1f} ms")
+
+
+def validation_locators(rows, count, duplicates):
+    locators = []
+    for i in range(count):
+        row = (i * 7) % rows
+        kind = i % 5
+        if kind == 0:
+            locators.append(f"//span[text()='Item {row}']")
+        elif kind == 1:
+            locators.append(f"//*[@placeholder='Field {row}']")
+        elif kind == 2:
+            locators.append(f"//a[text()='{DUPLICATE_TEXTS[i % duplicates % len(DUPLICATE_TEXTS)]}']")
+        elif kind == 3:
+            locators.append(f"//input[@name='field{i % duplicates}']/following-sibling::label")
+        else:
+            locators.append(f"//span[text()='Missing {i}']")
+    return locators
+
+
+def bench_validate(args, metrics, driver, server):
+    """Validation requests over the control channel, batched like recheck jobs"""
+    main.driver = driver
+    store = get_store()
+    with capture_server(store) as channel:
+        for nodes in args.page_sizes:
+            element_count = load_page(driver, server, nodes, args)
+            rows = driver.execute_script("return Number(document.getElementById('content').dataset.rows)")
+            locators = validation_locators(rows, args.locators, args.duplicates)
+            batches = [locators[i:i + recheck.VALIDATION_BATCH]
+                       for i in range(0, len(locators), recheck.VALIDATION_BATCH)]
+            batch_times = []
+            start = time.perf_counter()
+            for batch in batches:
+                batch_start = time.perf_counter()
+                channel.request('validate', timeout=60, xpaths=batch)
+                batch_times.append((time.perf_counter() - batch_start) * 1000)
+            elapsed = time.perf_counter() - start
+            prefix = f'validate.{nodes}'
+            metrics[f'{prefix}.elements'] = element_count
+            metrics[f'{prefix}.locators_per_s'] = len(locators) / elapsed
+            metrics[f'{prefix}.batch_p50_ms'] = percentile(batch_times, 0.5)
+            metrics[f'{prefix}.batch_p95_ms'] = percentile(batch_times, 0.95)
+            print(f"  validate on {element_count:>7} elements: {metrics[f'{prefix}.locators_per_s']:.0f} locators/s, "
+                  f"batch p50 {metrics[f'{prefix}.batch_p50_ms']:.0f} ms")
+
+
+# --- Results ---
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_results(args, metrics, started):
+    revision = git_revision()
+    results = {
+        'meta': {
+            'revision': revision,
+            'started': started.isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'backend': args.backend,
+            'scenarios': args.scenarios,
+            'args': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'driver')}
+        },
+        'metrics': metrics
+    }
+    output = args.output or os.path.join(
+        RESULTS_FOLDER, f"bench-{started.strftime('%Y%m%d-%H%M%S')}-{revision or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"Results written to {output}")
+    return results
+
+
+def compare(previous_path, metrics):
+    """Print the change of every metric present in both runs"""
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = json.load(f)
+    print(f"Compared with {previous_path} (revision {previous['meta'].get('revision')}):")
+    for name in sorted(set(metrics) & set(previous['metrics'])):
+        old, new = previous['metrics'][name], metrics[name]
+        if not old or new is None:
+            continue
+        print(f"  {name:<45} {old:12.2f} -> {new:12.2f}  ({(new - old) / old:+.0%})")
+
+
+def run(args):
+    started = datetime.now()
+    metrics = {}
+    driver_path = os.path.abspath(args.driver)
+    workdir = tempfile.mkdtemp(prefix='xpath-bench-')
+    cwd = os.getcwd()
+    os.chdir(workdir)  # output_folder, sessions and config.json of the run live here
+    server = driver = None
+    try:
+        with open('config.json', 'w') as f:
+            json.dump({'storage_backend': args.backend, 'warm_pool_size': 0}, f)
+        if 'bank' in args.scenarios:
+            print('Bank growth:')
+            bench_bank(args, metrics)
+        if 'ws' in args.scenarios:
+            print('Capture WebSocket:')
+            bench_ws(args, metrics)
+        if 'click' in args.scenarios or 'validate' in args.scenarios:
+            server = start_page_server()
+            driver = create_driver(headless=args.headless, driver_path=driver_path)
+            driver.set_script_timeout(120)
+            if 'click' in args.scenarios:
+                print('Browser clicks:')
+                bench_click(args, metrics, driver, server)
+            if 'validate' in args.scenarios:
+                print('Validation:')
+                bench_validate(args, metrics, driver, server)
+    finally:
+        if driver:
+            driver.quit()
+        if server:
+            server.shutdown()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    write_results(args, metrics, started)
+    if args.compare:
+        compare(args.compare, metrics)
+
+
+def int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument('--bank-sizes', type=int_list, default=[1000, 10000, 100000])
+    parser.add_argument('--page-sizes', type=int_list, default=[1000, 20000, 200000],
+                        help='Approximate element counts of the synthetic pages')
+    parser.add_argument('--depth', type=int, default=10, help='Nesting depth of every row')
+    parser.add_argument('--duplicates', type=int, default=4, help='Distinct values of the repeated texts/names')
+    parser.add_argument('--clicks', type=int, default=50)
+    parser.add_argument('--locators', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--headless', action='store_true')
+    parser.add_argument('--driver', default=DRIVER_PATH)
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/bench-<time>-<revision>.json)')
+    parser.add_argument('--compare', help='Earlier results file to compare with')
+    args = parser.parse_args()
+    args.scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    run(args)
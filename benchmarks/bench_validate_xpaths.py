@@ -0,0 +1,82 @@
+"""Compare batched XPath validation against one find_elements call per XPath.
+
+Loads a synthetic page into Edge and validates the same locator list both ways.
+
+    python benchmarks/bench_validate_xpaths.py --locators 300 --rows 2000 --headless
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from browser import DRIVER_PATH, create_driver
+from xpath_evaluator import evaluate_xpaths, evaluate_xpaths_individually
+
+
+def build_page(rows):
+    items = ''.join(
+        f'<div class="row" id="row{i}"><span>Item {i}</span>'
+        f'<input name="field{i}" placeholder="Field {i}"><a href="/item/{i}">Open</a></div>'
+        for i in range(rows)
+    )
+    return f'<html><head><title>Synthetic</title></head><body>{items}</body></html>'
+
+
+def build_locators(count, rows):
+    locators = []
+    for i in range(count):
+        row = (i * 7) % rows
+        kind = i % 4
+        if kind == 0:
+            locators.append(f"//span[text()='Item {row}']")
+        elif kind == 1:
+            locators.append(f"//*[@placeholder='Field {row}']")
+        elif kind == 2:
+            locators.append(f"//div[@id='row{row}']/a")
+        else:
+            locators.append(f"//span[text()='Missing {i}']")
+    return locators
+
+
+def run(args):
+    driver = create_driver(headless=args.headless, driver_path=args.driver)
+    page_file = tempfile.NamedTemporaryFile('w', suffix='.html', delete=False, encoding='utf-8')
+    try:
+        page_file.write(build_page(args.rows))
+        page_file.close()
+        driver.get('file:///' + page_file.name.replace(os.sep, '/'))
+        locators = build_locators(args.locators, args.rows)
+
+        timings = {'per_xpath': [], 'batched': []}
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            baseline = evaluate_xpaths_individually(driver, locators)
+            timings['per_xpath'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            batched = evaluate_xpaths(driver, locators)
+            timings['batched'].append(time.perf_counter() - start)
+
+        mismatches = [x for x in locators if baseline[x]['count'] != batched[x]['count']]
+        print(f"Locators: {len(locators)}  Rows: {args.rows}  Repeats: {args.repeat}")
+        for name, values in timings.items():
+            best = min(values)
+            print(f"  {name:<10} best {best * 1000:8.1f} ms  ({len(locators) / best:8.0f} locators/s)")
+        print(f"  speedup    {min(timings['per_xpath']) / min(timings['batched']):.1f}x")
+        print(f"  count mismatches: {len(mismatches)}")
+    finally:
+        driver.quit()
+        os.remove(page_file.name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--locators', type=int, default=300)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--headless', action='store_true')
+    parser.add_argument('--driver', default=DRIVER_PATH)
+    run(parser.parse_args())
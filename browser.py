@@ -0,0 +1,41 @@
+import os
+
+from selenium import webdriver
+from selenium.webdriver.edge.service import Service
+from selenium.webdriver.edge.options import Options
+
+# Edge driver factory shared by the capture process, the batch recheck pool
+# and the benchmarks, plus the reset that lets a warm-pool browser be reused.
+
+DRIVER_PATH = os.path.join('driver', 'msedgedriver.exe')
+
+
+def create_driver(headless=False, driver_path=DRIVER_PATH, window_size=(1366, 900)):
+    """Start an Edge session with the options the capture tool relies on"""
+    edge_options = Options()
+    edge_options.add_argument("--disable-web-security")
+    edge_options.add_argument("--disable-features=VizDisplayCompositor")
+    if headless:
+        edge_options.add_argument("--headless=new")
+        edge_options.add_argument(f"--window-size={window_size[0]},{window_size[1]}")
+    service = Service(executable_path=driver_path)
+    return webdriver.Edge(service=service, options=edge_options)
+
+
+def reset_browser(driver, origins=()):
+    """Return a used session to a blank state so it can be handed out again
+
+    Extra tabs are closed, cookies and cache are cleared and the storage
+    (localStorage, IndexedDB, service workers...) of every visited origin is
+    dropped before the remaining tab goes back to about:blank.
+    """
+    handles = driver.window_handles
+    for handle in handles[1:]:
+        driver.switch_to.window(handle)
+        driver.close()
+    driver.switch_to.window(handles[0])
+    driver.get('about:blank')
+    driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+    driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+    for origin in origins:
+        driver.execute_cdp_cmd('Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
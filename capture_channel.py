@@ -0,0 +1,185 @@
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import os
+import ssl
+import threading
+
+import websockets
+
+# Control channel between the web app and a running main.py.
+#
+# The capture process already serves a WebSocket on localhost:8765 for the
+# injected click listener. The web app connects to the same server as a
+# control client. Every control message carries a "type"; requests also carry
+# an "id" that the capture process echoes back in its response, so several
+# requests can be in flight at once:
+#
+#   -> {"type": "validate", "id": "3", "xpaths": ["//a", ...]}
+#   <- {"type": "response", "id": "3",
+#       "result": {"results": {"//a": true},
+#                  "details": {"//a": {"count": 2, "visible": true, "error": null}}}}
+#   <- {"type": "response", "id": "4", "error": "message"}
+#
+# A "metrics" request returns the timing histograms recorded since the last
+# one (see metrics.py).
+#
+# The capture process pushes events to every control client without being asked:
+#
+#   <- {"type": "event", "event": "current_url", "url": "https://..."}
+#   <- {"type": "event", "event": "state", "state": "active", "ready_seconds": 1.9}
+
+
+class ChannelError(Exception):
+    """Raised when the capture process rejects a request or the channel is down"""
+
+
+class ChannelTimeout(ChannelError):
+    """Raised when the capture process does not answer in time"""
+
+
+def default_uri(port=8765):
+    """Build the channel URI, matching the SSL choice made by main.py"""
+    scheme = 'wss' if os.path.exists('cert.pem') and os.path.exists('key.pem') else 'ws'
+    return f'{scheme}://localhost:{port}'
+
+
+class CaptureChannel:
+    """Request/response client for the control channel of one capture process"""
+
+    def __init__(self, uri=None, reconnect_delay=0.2):
+        self.uri = uri or default_uri()
+        self.reconnect_delay = reconnect_delay
+        self.current_url = None
+        self.state = None  # starting/standby/activating/active/resetting/stopping
+        self.connected = False
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._listeners = []
+        self._closed = False
+        self._websocket = None
+        self._loop = asyncio.new_event_loop()
+        self._ready = None
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+
+    def start(self):
+        """Start connecting in the background; returns immediately"""
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Disconnect and fail every request still waiting for an answer"""
+        self._closed = True
+        if self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._disconnect(), self._loop)
+        self._thread.join(timeout=2)
+        self._fail_pending(ChannelError('Channel closed'))
+
+    def add_listener(self, callback):
+        """Register callback(event, payload) for events pushed by the capture process"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def request(self, request_type, timeout=5, **payload):
+        """Send one request and block until its response arrives"""
+        if self._closed:
+            raise ChannelError('Channel closed')
+        request_id = str(next(self._ids))
+        future = concurrent.futures.Future()
+        with self._pending_lock:
+            self._pending[request_id] = future
+        message = json.dumps({'type': request_type, 'id': request_id, **payload})
+        asyncio.run_coroutine_threadsafe(self._send(message), self._loop)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            raise ChannelTimeout(f'No response to {request_type} within {timeout}s')
+        finally:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._ready = asyncio.Event()
+        try:
+            self._loop.run_until_complete(self._connect_forever())
+        finally:
+            self._loop.close()
+
+    async def _connect_forever(self):
+        ssl_context = None
+        if self.uri.startswith('wss://'):
+            # main.py uses a self-signed certificate for localhost
+            ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+        while not self._closed:
+            try:
+                async with websockets.connect(self.uri, ssl=ssl_context) as websocket:
+                    self._websocket = websocket
+                    await websocket.send(json.dumps({'type': 'hello', 'id': 'hello'}))
+                    async for message in websocket:
+                        self._dispatch(json.loads(message))
+            except (OSError, websockets.exceptions.WebSocketException, asyncio.TimeoutError):
+                pass  # Capture process not up yet or gone; retry below
+            finally:
+                was_connected = self.connected
+                self._websocket = None
+                self.connected = False
+                self._ready.clear()
+                if was_connected:
+                    self._fail_pending(ChannelError('Capture process disconnected'))
+            if not self._closed:
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def _disconnect(self):
+        if self._websocket is not None:
+            await self._websocket.close()
+
+    async def _send(self, message):
+        await self._ready.wait()
+        try:
+            await self._websocket.send(message)
+        except (AttributeError, websockets.exceptions.ConnectionClosed):
+            pass  # The disconnect path fails the pending future
+
+    def _dispatch(self, message):
+        msg_type = message.get('type')
+        if msg_type == 'response':
+            if message.get('id') == 'hello':
+                self.current_url = message.get('result', {}).get('current_url')
+                self.state = message.get('result', {}).get('state')
+                self.connected = True
+                self._ready.set()
+                return
+            with self._pending_lock:
+                future = self._pending.get(message.get('id'))
+            if future is None or future.done():
+                return  # Caller already gave up
+            if 'error' in message:
+                future.set_exception(ChannelError(message['error']))
+            else:
+                future.set_result(message.get('result', {}))
+        elif msg_type == 'event':
+            event = message.get('event')
+            if event == 'current_url':
+                self.current_url = message.get('url')
+            elif event == 'state':
+                self.state = message.get('state')
+            for callback in list(self._listeners):
+                try:
+                    callback(event, message)
+                except Exception as e:
+                    print(f"Channel listener error: {e}")
+
+    def _fail_pending(self, error):
+        with self._pending_lock:
+            pending = list(self._pending.values())
+        for future in pending:
+            if not future.done():
+                future.set_exception(error)
@@ -0,0 +1,186 @@
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import threading
+import urllib.request
+
+import websockets
+
+# Registers the collector script with the browser through the Chrome DevTools
+# protocol, so every document gets it at load time without WebDriver polling.
+#
+# We open our own browser-level DevTools connection next to msedgedriver's
+# (the address comes from the "ms:edgeOptions" capability) and:
+#
+#   Target.setAutoAttach {autoAttach, waitForDebuggerOnStart, flatten}
+#       new tabs and popups are attached and paused before their first script
+#   Target.attachedToTarget (event)
+#       for each page session: Page.addScriptToEvaluateOnNewDocument, then
+#       Runtime.runIfWaitingForDebugger (or Runtime.evaluate for a page that
+#       was already loaded when we attached)
+#
+# Events from every session are forwarded to listeners as
+# callback(method, params, session_id).
+
+
+class DevToolsError(Exception):
+    """Raised when the DevTools connection fails or a command returns an error"""
+
+
+def debugger_address(driver):
+    """host:port of the browser's DevTools endpoint for a Selenium Edge/Chrome session"""
+    for key in ('ms:edgeOptions', 'goog:chromeOptions'):
+        address = driver.capabilities.get(key, {}).get('debuggerAddress')
+        if address:
+            return address
+    raise DevToolsError('Browser did not report a DevTools debuggerAddress')
+
+
+def browser_websocket_url(address, timeout=5):
+    with urllib.request.urlopen(f'http://{address}/json/version', timeout=timeout) as response:
+        return json.loads(response.read())['webSocketDebuggerUrl']
+
+
+class DevToolsInjector:
+    """Browser-level DevTools client that installs a script in every page target"""
+
+    def __init__(self, address, source):
+        self.address = address
+        self.source = source
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._listeners = []
+        self._sessions = {}  # session id -> target info
+        self._websocket = None
+        self._loop = asyncio.new_event_loop()
+        self._ready = concurrent.futures.Future()
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+
+    def start(self, timeout=10):
+        """Connect, register the script with every open tab and wait until done"""
+        self._thread.start()
+        try:
+            self._ready.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            raise DevToolsError(f'DevTools setup did not finish within {timeout}s')
+        return self
+
+    def close(self):
+        if self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._disconnect(), self._loop)
+        self._thread.join(timeout=2)
+
+    def add_listener(self, callback):
+        """Register callback(method, params, session_id) for DevTools events"""
+        self._listeners.append(callback)
+
+    def call(self, method, params=None, session_id=None, timeout=5):
+        """Send one DevTools command from another thread and wait for its result"""
+        future = asyncio.run_coroutine_threadsafe(self._command(method, params, session_id), self._loop)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            raise DevToolsError(f'No response to {method} within {timeout}s')
+
+    @property
+    def sessions(self):
+        return dict(self._sessions)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._run())
+        except Exception as e:
+            if not self._ready.done():
+                self._ready.set_exception(DevToolsError(str(e)))
+            else:
+                print(f"DevTools connection lost: {e}", flush=True)
+        finally:
+            self._loop.close()
+
+    async def _run(self):
+        url = await self._loop.run_in_executor(None, browser_websocket_url, self.address)
+        async with websockets.connect(url, max_size=None) as websocket:
+            self._websocket = websocket
+            reader = asyncio.create_task(self._read())
+            await self._command('Target.setAutoAttach',
+                                {'autoAttach': True, 'waitForDebuggerOnStart': True, 'flatten': True})
+            # Tabs that existed before auto-attach was switched on
+            targets = await self._command('Target.getTargets')
+            for info in targets['targetInfos']:
+                if info['type'] == 'page' and info['targetId'] not in {t['targetId'] for t in self._sessions.values()}:
+                    await self._command('Target.attachToTarget', {'targetId': info['targetId'], 'flatten': True})
+            self._ready.set_result(True)
+            await reader
+
+    async def _disconnect(self):
+        if self._websocket is not None:
+            await self._websocket.close()
+
+    async def _command(self, method, params=None, session_id=None):
+        message_id = next(self._ids)
+        future = self._loop.create_future()
+        self._pending[message_id] = future
+        message = {'id': message_id, 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+        try:
+            await self._websocket.send(json.dumps(message))
+            return await future
+        finally:
+            self._pending.pop(message_id, None)
+
+    async def _read(self):
+        try:
+            async for raw in self._websocket:
+                message = json.loads(raw)
+                if 'id' in message:
+                    future = self._pending.get(message['id'])
+                    if future is None or future.done():
+                        continue
+                    if 'error' in message:
+                        future.set_exception(DevToolsError(message['error'].get('message', 'DevTools error')))
+                    else:
+                        future.set_result(message.get('result', {}))
+                else:
+                    self._dispatch(message.get('method'), message.get('params', {}), message.get('sessionId'))
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(DevToolsError('DevTools connection closed'))
+
+    def _dispatch(self, method, params, session_id):
+        if method == 'Target.attachedToTarget':
+            self._sessions[params['sessionId']] = params['targetInfo']
+            asyncio.create_task(self._prepare_session(params['sessionId'], params['targetInfo'],
+                                                      params.get('waitingForDebugger', False)))
+        elif method == 'Target.detachedFromTarget':
+            self._sessions.pop(params.get('sessionId'), None)
+        for callback in list(self._listeners):
+            try:
+                callback(method, params, session_id)
+            except Exception as e:
+                print(f"DevTools listener error: {e}")
+
+    async def _prepare_session(self, session_id, info, waiting):
+        """Install the script in a newly attached target, then let it run"""
+        try:
+            if info['type'] == 'page':
+                await self._command('Page.enable', session_id=session_id)
+                await self._command('Page.addScriptToEvaluateOnNewDocument', {'source': self.source}, session_id)
+                # Popups opened by this tab are attached (and paused) the same way
+                await self._command('Target.setAutoAttach',
+                                    {'autoAttach': True, 'waitForDebuggerOnStart': True, 'flatten': True}, session_id)
+                if not waiting:
+                    # Already loaded before we attached: install into the current document too
+                    await self._command('Runtime.evaluate', {'expression': self.source}, session_id)
+                print(f"Collector registered for tab: {info.get('url')}", flush=True)
+        except DevToolsError as e:
+            print(f"Could not register collector for {info.get('url')}: {e}", flush=True)
+        finally:
+            if waiting:
+                try:
+                    await self._command('Runtime.runIfWaitingForDebugger', session_id=session_id)
+                except DevToolsError:
+                    pass  # Target went away
@@ -0,0 +1,43 @@
+import gzip
+import hashlib
+import os
+
+# DOM snapshots taken at capture time. Each snapshot is the page's outerHTML,
+# gzip-compressed and stored once per distinct content under
+# output_folder/snapshots/<domain>/<sha1>.html.gz. Bank entries reference
+# theirs with a "snapshot" field holding the sha1, which keeps the bank JSON
+# small and lets identical DOMs be shared between entries.
+
+SNAPSHOT_FOLDER = os.path.join('output_folder', 'snapshots')
+
+
+def snapshot_dir(bank_name, root=SNAPSHOT_FOLDER):
+    base = bank_name[:-len('.json')] if bank_name.endswith('.json') else bank_name
+    return os.path.join(root, base)
+
+
+def snapshot_path(bank_name, snapshot_id, root=SNAPSHOT_FOLDER):
+    return os.path.join(snapshot_dir(bank_name, root), f'{snapshot_id}.html.gz')
+
+
+def save_snapshot(bank_name, html, root=SNAPSHOT_FOLDER):
+    """Store a page's HTML once and return its snapshot id"""
+    data = html.encode('utf-8')
+    snapshot_id = hashlib.sha1(data).hexdigest()
+    path = snapshot_path(bank_name, snapshot_id, root)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(gzip.compress(data, 6))
+        os.replace(tmp_path, path)
+    return snapshot_id
+
+
+def load_snapshot(bank_name, snapshot_id, root=SNAPSHOT_FOLDER):
+    """Return the HTML of a snapshot, or None if it is missing"""
+    try:
+        with open(snapshot_path(bank_name, snapshot_id, root), 'rb') as f:
+            return gzip.decompress(f.read()).decode('utf-8')
+    except FileNotFoundError:
+        return None
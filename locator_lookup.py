@@ -0,0 +1,246 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from datetime import datetime
+
+import bank_journal
+
+# Locator lookup for test runners. Instead of parsing a whole
+# output_folder/<domain>.json in every worker, a bank is compiled once into
+# output_folder/<domain>.locators and memory-mapped read-only, so all workers
+# share the same pages of the OS cache and a lookup reads one hash slot and
+# one small record:
+#
+#   header   magic, meta length, slot count        (HEADER)
+#   meta     JSON: the source files' state, entry count, build time
+#   slots    open-addressing hash table             (SLOT: key hash, offset, length)
+#   records  one compact JSON record per entry: {"page", "page_name", "page_urls", "entry"}
+#
+# Entries are keyed by ("u", page URL, name), ("n", page name, name) and
+# ("i", entry id); the first entry captured wins for a repeated page and name.
+# The compiled file records the (mtime, size) of the snapshot and journal it
+# was built from and is rebuilt when they change.
+#
+#     from locator_lookup import open_bank
+#     bank = open_bank('output_folder/example.com.json')
+#     bank.final_xpath('https://example.com/login', 'Sign in')
+
+MAGIC = b'XPBLOC01'
+HEADER = struct.Struct('<8sII')
+SLOT = struct.Struct('<QQI')
+SUFFIX = '.locators'
+
+
+def compiled_path(json_path):
+    base = json_path[:-len('.json')] if json_path.endswith('.json') else json_path
+    return base + SUFFIX
+
+
+def source_state(json_path):
+    """[mtime_ns, size] of the snapshot and of the journal (None if missing)"""
+    state = []
+    for path in (json_path, bank_journal.journal_path(json_path)):
+        try:
+            st = os.stat(path)
+            state.append([st.st_mtime_ns, st.st_size])
+        except FileNotFoundError:
+            state.append(None)
+    return state
+
+
+def key_hash(kind, page, name):
+    digest = hashlib.blake2b(f'{kind}\0{page}\0{name}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1  # 0 marks an empty slot
+
+
+def compile_bank(json_path, output_path=None):
+    """Write the compiled form of a bank (snapshot plus journal); returns its path"""
+    output_path = output_path or compiled_path(json_path)
+    state = source_state(json_path)
+    bank = bank_journal.load_bank(json_path)
+
+    records = []
+    keys = {}  # key -> record index; the first entry captured wins
+    for page_key, page_data in bank.pages.items():
+        urls = [page_key] + [u for u in (page_data.get('page_url'), page_data.get('page_full_url'))
+                             if u and u != page_key]
+        page_name = page_data.get('page_name')
+        for entry in bank.entries(page_key):
+            index = len(records)
+            records.append(json.dumps({'page': page_key, 'page_name': page_name, 'page_urls': urls, 'entry': entry},
+                                      ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+            name = entry.get('name')
+            for url in dict.fromkeys(urls):
+                keys.setdefault(('u', url, name), index)
+            if page_name:
+                keys.setdefault(('n', page_name, name), index)
+            keys.setdefault(('i', entry['id'], ''), index)
+
+    slot_count = 8
+    while slot_count < len(keys) * 2:
+        slot_count *= 2
+    meta = json.dumps({'source': state, 'entries': len(records),
+                       'built_on': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}).encode('utf-8')
+    records_start = HEADER.size + len(meta) + slot_count * SLOT.size
+    offsets = []
+    position = records_start
+    for record in records:
+        offsets.append(position)
+        position += len(record)
+
+    slots = bytearray(slot_count * SLOT.size)
+    mask = slot_count - 1
+    for key, index in keys.items():
+        h = key_hash(*key)
+        slot = h & mask
+        while SLOT.unpack_from(slots, slot * SLOT.size)[0]:
+            slot = (slot + 1) & mask
+        SLOT.pack_into(slots, slot * SLOT.size, h, offsets[index], len(records[index]))
+
+    # Written aside and renamed, so workers that have the old file mapped keep reading it
+    tmp_path = f'{output_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(meta), slot_count))
+        f.write(meta)
+        f.write(slots)
+        for record in records:
+            f.write(record)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def read_meta(path):
+    """The meta block of a compiled bank, or None if it is missing or not one"""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return None
+            magic, meta_length, _ = HEADER.unpack(header)
+            if magic != MAGIC:
+                return None
+            return json.loads(f.read(meta_length))
+    except (OSError, ValueError):
+        return None
+
+
+def ensure_compiled(json_path, output_path=None):
+    """Compile the bank unless its compiled file was built from the current JSON; returns (path, rebuilt)"""
+    output_path = output_path or compiled_path(json_path)
+    if is_current(json_path, output_path):
+        return output_path, False
+    # Under the bank's lock no write lands mid-compile, and workers that raced
+    # here find the file another one just built
+    with bank_journal.bank_lock(json_path):
+        if is_current(json_path, output_path):
+            return output_path, False
+        return compile_bank(json_path, output_path), True
+
+
+def is_current(json_path, output_path):
+    meta = read_meta(output_path)
+    return meta is not None and meta.get('source') == source_state(json_path)
+
+
+class CompiledBank:
+    """Read-only, memory-mapped view of a compiled bank"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, meta_length, self.slot_count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f'{path} is not a compiled bank')
+        self.meta = json.loads(self._map[HEADER.size:HEADER.size + meta_length])
+        self._slots_start = HEADER.size + meta_length
+        self._mask = self.slot_count - 1
+
+    def __len__(self):
+        return self.meta['entries']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._map.close()
+
+    def _find(self, kind, page, name, matches):
+        h = key_hash(kind, page, name)
+        slot = h & self._mask
+        while True:
+            slot_hash, offset, length = SLOT.unpack_from(self._map, self._slots_start + slot * SLOT.size)
+            if not slot_hash:
+                return None
+            if slot_hash == h:
+                record = json.loads(self._map[offset:offset + length])
+                if matches(record):
+                    return record
+            slot = (slot + 1) & self._mask
+
+    def get(self, page, name):
+        """The entry named `name` on a page given by URL or page name, or None"""
+        record = self._find('u', page, name, lambda r: page in r['page_urls'] and r['entry'].get('name') == name) \
+            or self._find('n', page, name, lambda r: r['page_name'] == page and r['entry'].get('name') == name)
+        return record['entry'] if record else None
+
+    def by_id(self, entry_id):
+        record = self._find('i', entry_id, '', lambda r: r['entry']['id'] == entry_id)
+        return record['entry'] if record else None
+
+    def final_xpath(self, page, name):
+        entry = self.get(page, name)
+        return entry.get('final_xpath') if entry else None
+
+
+def open_bank(json_path, rebuild=True):
+    """Map the compiled form of a bank, compiling it first if the JSON changed"""
+    if rebuild:
+        path, _ = ensure_compiled(json_path)
+    else:
+        path = compiled_path(json_path)
+    return CompiledBank(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile banks for fast locator lookups and query them')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build_cmd = sub.add_parser('build', help='Compile banks whose JSON changed (default: all in output_folder)')
+    build_cmd.add_argument('banks', nargs='*', help='Bank JSON files')
+    build_cmd.add_argument('--force', action='store_true', help='Rebuild even if up to date')
+    get_cmd = sub.add_parser('get', help='Print the final xpath of an element')
+    get_cmd.add_argument('bank', help='Bank JSON file')
+    get_cmd.add_argument('page', help='Page URL or page name')
+    get_cmd.add_argument('name', help='Element name')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        banks = args.banks or [os.path.join('output_folder', name) for name in bank_journal.list_banks('output_folder')]
+        for json_path in banks:
+            if args.force:
+                with bank_journal.bank_lock(json_path):
+                    path, rebuilt = compile_bank(json_path), True
+            else:
+                path, rebuilt = ensure_compiled(json_path)
+            print(f"{path}: {'compiled' if rebuilt else 'up to date'}")
+    elif args.command == 'get':
+        with open_bank(args.bank) as bank:
+            entry = bank.get(args.page, args.name)
+        if entry is None:
+            print(f"No element named {args.name!r} on {args.page}", file=sys.stderr)
+            sys.exit(1)
+        print(entry.get('final_xpath', ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,25 +2,50 @@ import json
 import os
 import ssl
 from urllib.parse import urlparse
-from selenium import webdriver
-from selenium.webdriver.edge.service import Service
-from selenium.webdriver.edge.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 import time
 import websockets
 import asyncio
 import threading
 import signal
-import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from xpath_evaluator import evaluate_xpaths, existence_map
+from bank_journal import quarantine_snapshot
+import metrics
+from bank_store import get_store
+from browser import create_driver, reset_browser
+from devtools_injector import DevToolsError, DevToolsInjector, debugger_address
+from dom_snapshots import save_snapshot
+from offline_validate import is_valid_locator, locator_kind
 
 stop_flag = False
 recheck_mode = False
-
-injected_urls = set()
+snapshot_mode = False
+ws_port = 8765
+
+# Warm pool: a --standby process starts its browser up front and waits for an
+# "activate" request; "release" ends the capture/recheck and resets the browser
+# for the next one (see session_manager.py)
+standby_mode = False
+session_state = 'starting'
+release_flag = False
+pending_activation = None
+activation_event = threading.Event()
+visited_origins = set()
+collector_script_id = None
+
+# Control channel state (see capture_channel.py for the protocol)
+ws_loop = None
+control_clients = set()
+control_tasks = set()
+current_url = None
+main_frames = {}  # DevTools session id -> id of its top-level frame
+driver = None
+driver_lock = threading.Lock()
+# Clicks are handled one at a time on this thread, so the fsync'd journal write
+# does not hold up control requests served by the event loop
+click_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='click')
 
 def signal_handler(sig, frame):
     global stop_flag
@@ -35,106 +60,186 @@ def get_domain(url):
     parsed = urlparse(url)
     return parsed.netloc
 
-def get_xpath(element):
-    # Get relative xpath
-    relative_xpath = element.get_attribute('data-relative-xpath') or ''
-    # Get full xpath
-    full_xpath = element.get_attribute('data-full-xpath') or ''
-    # Get css selector
-    css_selector = element.get_attribute('data-css-selector') or ''
-    return {
-        'relative_xpath': relative_xpath,
-        'full_xpath': full_xpath,
-        'css_selector': css_selector
-    }
-
-def get_final_xpath(visual):
-    for key in ['tag_text', 'tag_contains', 'text', 'placeholder', 'value', 'accessibility', 'name', 'href', 'src', 'alt', 'title']:
-        if visual.get(key):
-            return visual[key]
-    return ''
-
 async def ws_handler(websocket):
-    global data, output_file, check_event, stop_event, driver
     try:
         async for message in websocket:
+            received = time.time()
             click_data = json.loads(message)
-            page_url = click_data.get('page_url')
-            page_name = click_data.get('page_name')
-            page_key = page_url
-            if page_key not in data:
-                # Calculate next display_order
-                max_order = 0
-                for page_data in data.values():
-                    if 'display_order' in page_data:
-                        max_order = max(max_order, page_data['display_order'])
-                
-                data[page_key] = {
-                    'page_url': page_url,
-                    'page_full_url': page_url,
-                    'page_name': page_name,
-                    'display_order': max_order + 1,
-                    'xpaths': []
-                }
-            # Prepare all xpaths with counts from JavaScript
-            xpath_types = ['visual_xpath', 'relative_xpath', 'full_xpath', 'css_selector']
-            xpath_counts = {}
-            
-            # Process visual xpaths with counts from JS
-            if 'visual_xpath_counts' in click_data:
-                for vkey, xpath in click_data['visual_xpath'].items():
-                    if xpath:
-                        count = click_data['visual_xpath_counts'].get(vkey, 0)
-                        xpath_counts[vkey] = {'xpath': xpath, 'count': count}
-            
-            # Process relative xpath with count from JS
-            if click_data.get('relative_xpath'):
-                count = click_data.get('relative_xpath_count', 0)
-                xpath_counts['relative_xpath'] = {'xpath': click_data['relative_xpath'], 'count': count}
-            
-            # Process full xpath with count from JS
-            if click_data.get('full_xpath'):
-                count = click_data.get('full_xpath_count', 0)
-                xpath_counts['full_xpath'] = {'xpath': click_data['full_xpath'], 'count': count}
-            
-            # Process css selector with count from JS
-            if click_data.get('css_selector'):
-                count = click_data.get('css_selector_count', 0)
-                xpath_counts['css_selector'] = {'xpath': click_data['css_selector'], 'count': count}
-
-            # Determine final_xpath: prefer any valid xpath with count==1, else blank
-            final_xpath = ''
-            for k, v in xpath_counts.items():
-                xpath_val = v['xpath']
-                # Only consider non-empty, valid xpaths (skip incomplete ones)
-                if v['count'] == 1 and xpath_val and not xpath_val.strip().endswith('=') and not xpath_val.strip().endswith('[]'):
-                    final_xpath = xpath_val
-                    break
-
-            xpath_entry = {
-                'name': click_data['name'],
-                'visual_xpath': {vk: {'xpath': vv['xpath'], 'count': vv['count']} for vk, vv in xpath_counts.items() if vk in click_data['visual_xpath']},
-                'relative_xpath': {'xpath': xpath_counts.get('relative_xpath', {}).get('xpath', ''), 'count': xpath_counts.get('relative_xpath', {}).get('count', 0)},
-                'full_xpath': {'xpath': xpath_counts.get('full_xpath', {}).get('xpath', ''), 'count': xpath_counts.get('full_xpath', {}).get('count', 0)},
-                'css_selector': {'xpath': xpath_counts.get('css_selector', {}).get('xpath', ''), 'count': xpath_counts.get('css_selector', {}).get('count', 0)},
-                'custom_xpath': '',
-                'final_xpath': final_xpath,
-                'created_on': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
-            # Only add if not duplicate (by name and all xpaths)
-            if not any(entry.get('name') == xpath_entry['name'] and entry.get('final_xpath') == xpath_entry['final_xpath'] for entry in data[page_key]['xpaths']):
-                data[page_key]['xpaths'].append(xpath_entry)
-                with open(output_file, 'w') as f:
-                    json.dump(data, f, indent=4)
-                print(f"Captured xpath for element: {click_data['name']} on {page_name}")
-                check_event.set()  # Trigger monitoring
+            if 'type' in click_data:
+                # Control request from the web app; answer concurrently so
+                # a slow validation does not hold up the next request
+                task = asyncio.create_task(handle_control_message(websocket, click_data))
+                control_tasks.add(task)
+                task.add_done_callback(control_tasks.discard)
+                continue
+            await asyncio.get_running_loop().run_in_executor(click_executor, timed_click, click_data, received)
     except websockets.exceptions.ConnectionClosed:
         pass  # Expected when browser closes
     except Exception as e:
         print(f"WebSocket error: {e}")
+    finally:
+        control_clients.discard(websocket)
+
+def record_page_timing(timing, received):
+    """Spans measured in the page by the collector (epoch milliseconds)"""
+    if not timing:
+        return
+    count_ms = timing.get('count_ms') or 0
+    if timing.get('clicked_at') and timing.get('sent_at'):
+        # Click to start of the idle-time flush
+        metrics.observe_span('collector_wait', (timing['sent_at'] - timing['clicked_at'] - count_ms) / 1000)
+    metrics.observe_span('collector_count', count_ms / 1000)
+    if timing.get('sent_at'):
+        metrics.observe_span('ws_hop', received - timing['sent_at'] / 1000)
+
+def timed_click(click_data, received):
+    with metrics.span('ws_handler'):
+        handle_click(click_data, received)
+
+def handle_click(click_data, received):
+    """Turn one click message from the collector into a bank entry"""
+    record_page_timing(click_data.get('timing'), received)
+    page_url = click_data.get('page_url')
+    page_name = click_data.get('page_name')
+    page_key = page_url
+    # Prepare all xpaths with counts from JavaScript
+    xpath_counts = {}
+    
+    # Process visual xpaths with counts from JS
+    if 'visual_xpath_counts' in click_data:
+        for vkey, xpath in click_data['visual_xpath'].items():
+            if xpath:
+                count = click_data['visual_xpath_counts'].get(vkey, 0)
+                xpath_counts[vkey] = {'xpath': xpath, 'count': count}
+    
+    # Process relative xpath with count from JS
+    if click_data.get('relative_xpath'):
+        count = click_data.get('relative_xpath_count', 0)
+        xpath_counts['relative_xpath'] = {'xpath': click_data['relative_xpath'], 'count': count}
+    
+    # Process full xpath with count from JS
+    if click_data.get('full_xpath'):
+        count = click_data.get('full_xpath_count', 0)
+        xpath_counts['full_xpath'] = {'xpath': click_data['full_xpath'], 'count': count}
+    
+    # Process css selector with count from JS
+    if click_data.get('css_selector'):
+        count = click_data.get('css_selector_count', 0)
+        xpath_counts['css_selector'] = {'xpath': click_data['css_selector'], 'count': count}
+
+    # Determine final_xpath: prefer any valid xpath with count==1, else blank
+    final_xpath = ''
+    with metrics.span('select_final'):
+        for k, v in xpath_counts.items():
+            xpath_val = v['xpath']
+            # Only consider locators that actually compile (skip incomplete ones)
+            if v['count'] == 1 and is_valid_locator(xpath_val, locator_kind(k)):
+                final_xpath = xpath_val
+                break
+
+    xpath_entry = {
+        'name': click_data['name'],
+        'visual_xpath': {vk: {'xpath': vv['xpath'], 'count': vv['count']} for vk, vv in xpath_counts.items() if vk in click_data['visual_xpath']},
+        'relative_xpath': {'xpath': xpath_counts.get('relative_xpath', {}).get('xpath', ''), 'count': xpath_counts.get('relative_xpath', {}).get('count', 0)},
+        'full_xpath': {'xpath': xpath_counts.get('full_xpath', {}).get('xpath', ''), 'count': xpath_counts.get('full_xpath', {}).get('count', 0)},
+        'css_selector': {'xpath': xpath_counts.get('css_selector', {}).get('xpath', ''), 'count': xpath_counts.get('css_selector', {}).get('count', 0)},
+        'custom_xpath': '',
+        'final_xpath': final_xpath,
+        'created_on': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+    if click_data.get('dom_snapshot'):
+        # Snapshots are stored by content hash, so a duplicate click adds no file
+        with metrics.span('snapshot_save'):
+            xpath_entry['snapshot'] = save_snapshot(bank_name, click_data['dom_snapshot'])
+    # Only add if not duplicate (by name and final xpath). The store checks and
+    # appends to the journal as the bank's only writer, so edits made in the
+    # web app meanwhile are seen and never overwritten.
+    with metrics.span('persist'):
+        added = store.add_entry(bank_name, page_key, xpath_entry, page_name=page_name)
+    if added:
+        print(f"Captured xpath for element: {click_data['name']} on {page_name}")
+
+async def handle_control_message(websocket, message):
+    """Answer one control-channel request, echoing its correlation id"""
+    global stop_flag
+    request_id = message.get('id')
+    msg_type = message.get('type')
+    try:
+        if msg_type == 'hello':
+            control_clients.add(websocket)
+            result = {'current_url': current_url, 'recheck': recheck_mode, 'state': session_state}
+        elif msg_type == 'activate':
+            result = activate(message)
+        elif msg_type == 'release':
+            result = release()
+        elif msg_type == 'validate':
+            loop = asyncio.get_running_loop()
+            details = await loop.run_in_executor(None, validate_xpaths, message.get('xpaths', []))
+            result = {'results': existence_map(details), 'details': details}
+        elif msg_type == 'metrics':
+            result = {'metrics': metrics.drain()}
+        elif msg_type == 'get_current_url':
+            result = {'url': current_url}
+        elif msg_type == 'stop':
+            stop_flag = True
+            activation_event.set()  # Wake a standby process
+            result = {'stopping': True}
+        else:
+            raise ValueError(f"Unknown request type: {msg_type}")
+        reply = {'type': 'response', 'id': request_id, 'result': result}
+    except Exception as e:
+        reply = {'type': 'response', 'id': request_id, 'error': str(e)}
+    try:
+        await websocket.send(json.dumps(reply))
+    except websockets.exceptions.ConnectionClosed:
+        pass  # Web app went away before the answer was ready
+
+def activate(message):
+    """Hand a standby browser to a capture or recheck (runs in main())"""
+    global pending_activation
+    if not standby_mode or session_state != 'standby':
+        raise ValueError(f"Session is not on standby (state: {session_state})")
+    if not message.get('url'):
+        raise ValueError('URL is required')
+    pending_activation = {'url': message['url'], 'recheck': bool(message.get('recheck')),
+                          'snapshots': message.get('snapshots'), 'received': time.perf_counter()}
+    set_state('activating')
+    activation_event.set()
+    return {'activating': True}
+
+def release():
+    """End the active capture/recheck and go back to standby"""
+    global release_flag
+    if not standby_mode:
+        raise ValueError('Only standby sessions can be released')
+    if session_state != 'active':
+        raise ValueError(f"Session is not active (state: {session_state})")
+    release_flag = True
+    return {'releasing': True}
+
+def set_state(state, **payload):
+    """Record the process state and push it to the web app"""
+    global session_state
+    session_state = state
+    publish_event('state', state=state, **payload)
+
+async def broadcast(message):
+    for client in list(control_clients):
+        try:
+            await client.send(message)
+        except websockets.exceptions.ConnectionClosed:
+            control_clients.discard(client)
+
+def publish_event(event, **payload):
+    """Push an event to every connected control client (thread-safe)"""
+    if ws_loop is None or ws_loop.is_closed():
+        return
+    message = json.dumps({'type': 'event', 'event': event, **payload})
+    asyncio.run_coroutine_threadsafe(broadcast(message), ws_loop)
 
 async def start_ws_server():
-    global stop_event
+    global ws_loop
+    ws_loop = asyncio.get_running_loop()
     print("Starting WebSocket server", flush=True)
     ssl_context = None
     if os.path.exists('cert.pem') and os.path.exists('key.pem'):
@@ -147,7 +252,8 @@ async def start_ws_server():
             ssl_context = None
     else:
         print("SSL cert not found, using plain WebSocket", flush=True)
-    server = await websockets.serve(ws_handler, "localhost", 8765, ssl=ssl_context)
+    # DOM snapshots make click messages much larger than the 1 MiB default
+    server = await websockets.serve(ws_handler, "localhost", ws_port, ssl=ssl_context, max_size=64 * 2**20)
     print("WebSocket server started", flush=True)
     while not stop_event.is_set():
         await asyncio.sleep(0.1)
@@ -158,245 +264,239 @@ async def start_ws_server():
 def start_ws_server_thread():
     asyncio.run(start_ws_server())
 
+def set_current_url(url):
+    """Record the page the tester is on and push it to the web app if it changed"""
+    global current_url
+    if url and url != current_url:
+        current_url = url
+        parsed = urlparse(url)
+        if parsed.scheme in ('http', 'https'):
+            visited_origins.add(f'{parsed.scheme}://{parsed.netloc}')
+        publish_event('current_url', url=url)
+
+def on_devtools_event(method, params, session_id):
+    """Turn DevTools navigation events of top-level frames into current_url events"""
+    if method == 'Page.frameNavigated':
+        frame = params.get('frame', {})
+        if not frame.get('parentId'):
+            main_frames[session_id] = frame.get('id')
+            set_current_url(frame.get('url', '') + frame.get('urlFragment', ''))
+    elif method == 'Page.navigatedWithinDocument':
+        # pushState/hash changes of single-page apps
+        if main_frames.get(session_id) == params.get('frameId'):
+            set_current_url(params.get('url'))
+
 def monitor_url_thread(driver, stop_event):
-    """Monitor current URL and write to file for recheck page synchronization"""
-    url_file = 'current_url.txt'
+    """Fallback when DevTools is unavailable: poll the driver for URL changes"""
     while not stop_event.is_set():
         try:
-            current_url = driver.current_url
-            with open(url_file, 'w') as f:
-                f.write(current_url)
+            set_current_url(driver.current_url)
         except:
             pass  # Ignore errors if driver is closed
         time.sleep(0.5)  # Update every 500ms
-    # Clean up file on exit
-    if os.path.exists(url_file):
-        os.remove(url_file)
-
-def validate_xpaths_thread(driver, stop_event):
-    """Monitor for XPath validation requests and validate them"""
-    request_file = 'xpath_validation_request.json'
-    result_file = 'xpath_validation_result.json'
-    
-    while not stop_event.is_set():
+
+def compaction_thread(store, bank_name, stop_event, interval=15):
+    """Periodically fold the journal into the readable <domain>.json snapshot"""
+    while not stop_event.wait(interval):
         try:
-            if os.path.exists(request_file):
-                # Read validation request
-                with open(request_file, 'r') as f:
-                    request_data = json.load(f)
-                
-                xpaths = request_data.get('xpaths', [])
-                results = {}
-                
-                # Validate each XPath
-                for xpath in xpaths:
-                    try:
-                        elements = driver.find_elements(By.XPATH, xpath)
-                        results[xpath] = len(elements) > 0
-                    except:
-                        results[xpath] = False
-                
-                # Write results
-                with open(result_file, 'w') as f:
-                    json.dump(results, f)
-                
-                # Remove request file
-                os.remove(request_file)
-        except:
-            pass  # Ignore errors
-        time.sleep(0.2)  # Check every 200ms
-    
-    # Clean up files on exit
-    if os.path.exists(request_file):
-        os.remove(request_file)
-    if os.path.exists(result_file):
-        os.remove(result_file)
-
-def inject_click_listener(driver):
-    recheck_flag = 'true' if recheck_mode else 'false'
-    script = f"""
-    console.log('[XPath Collector] Injection script running');
-    window.recheckMode = {recheck_flag};
-    if (!window.clickListenerInjected) {{
-        console.log('[XPath Collector] Listener not yet injected, setting up...');
-        if (!window.ws && !window.recheckMode) {{
-            console.log('[XPath Collector] Creating WebSocket connection');
-            window.ws = new WebSocket('ws://localhost:8765');
-            window.ws.onopen = () => console.log('[XPath Collector] WebSocket CONNECTED');
-            window.ws.onmessage = (e) => console.log('[XPath Collector] Server message:', e.data);
-            window.ws.onerror = (e) => console.error('[XPath Collector] WebSocket ERROR:', e);
-            window.ws.onclose = () => console.log('[XPath Collector] WebSocket CLOSED');
-        }} else {{
-            console.log('[XPath Collector] WebSocket already exists or recheck mode, state:', window.ws ? window.ws.readyState : 'N/A');
-        }}
-        document.addEventListener('click', function(event) {{
-            console.log('[XPath Collector] Click detected on:', event.target.tagName);
-            var element = event.target;
-            var relativeXpath = getRelativeXPath(element);
-            var fullXpath = getFullXPath(element);
-            var cssSelector = getCSSSelector(element);
-            element.setAttribute('data-relative-xpath', relativeXpath);
-            element.setAttribute('data-full-xpath', fullXpath);
-            element.setAttribute('data-css-selector', cssSelector);
-            
-            var tagName = element.tagName.toLowerCase();
-            var elementText = element.textContent ? element.textContent.trim() : '';
-            var innerText = element.innerText ? element.innerText.trim() : '';
-            var displayText = innerText || elementText;
-            
-            var clickData = {{
-                name: displayText || element.getAttribute('aria-label') || element.getAttribute('name') || element.getAttribute('placeholder') || element.getAttribute('value') || element.getAttribute('title') || element.getAttribute('alt') || tagName,
-                visual_xpath: {{
-                    text: displayText ? "//*[text()='" + displayText.replace(/'/g, "\\\\'") + "']" : '',
-                    tag_text: displayText ? "//" + tagName + "[text()='" + displayText.replace(/'/g, "\\\\'") + "']" : '',
-                    tag_contains: displayText ? "//" + tagName + "[contains(text(),'" + displayText.substring(0, 50).replace(/'/g, "\\\\'") + "')]" : '',
-                    placeholder: element.getAttribute('placeholder') ? "//*[@placeholder='" + element.getAttribute('placeholder').replace(/'/g, "\\\\'") + "']" : '',
-                    value: element.getAttribute('value') ? "//*[@value='" + element.getAttribute('value').replace(/'/g, "\\\\'") + "']" : '',
-                    accessibility: element.getAttribute('aria-label') ? "//*[@aria-label='" + element.getAttribute('aria-label').replace(/'/g, "\\\\'") + "']" : '',
-                    name: element.getAttribute('name') ? "//*[@name='" + element.getAttribute('name').replace(/'/g, "\\\\'") + "']" : '',
-                    href: element.getAttribute('href') ? "//*[@href='" + element.getAttribute('href').replace(/'/g, "\\\\'") + "']" : '',
-                    src: element.getAttribute('src') ? "//*[@src='" + element.getAttribute('src').replace(/'/g, "\\\\'") + "']" : '',
-                    alt: element.getAttribute('alt') ? "//*[@alt='" + element.getAttribute('alt').replace(/'/g, "\\\\'") + "']" : '',
-                    title: element.getAttribute('title') ? "//*[@title='" + element.getAttribute('title').replace(/'/g, "\\\\'") + "']" : ''
-                }},
-                relative_xpath: relativeXpath,
-                full_xpath: fullXpath,
-                css_selector: cssSelector,
-                page_url: window.location.href,
-                page_name: document.title
-            }};
-            
-            // Count elements BEFORE navigation happens
-            function countXPath(xpath) {{
-                try {{
-                    var result = document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
-                    return result.snapshotLength;
-                }} catch(e) {{
-                    return 0;
-                }}
-            }}
-            
-            function countCSS(selector) {{
-                try {{
-                    return document.querySelectorAll(selector).length;
-                }} catch(e) {{
-                    return 0;
-                }}
-            }}
-            
-            // Add counts to visual xpaths
-            clickData.visual_xpath_counts = {{}};
-            for (var key in clickData.visual_xpath) {{
-                if (clickData.visual_xpath[key]) {{
-                    clickData.visual_xpath_counts[key] = countXPath(clickData.visual_xpath[key]);
-                }}
-            }}
-            
-            // Add counts for relative, full xpath, and css
-            clickData.relative_xpath_count = countXPath(clickData.relative_xpath);
-            clickData.full_xpath_count = countXPath(clickData.full_xpath);
-            clickData.css_selector_count = countCSS(clickData.css_selector);
-            
-            if (window.recheckMode) {{
-                console.log('[XPath Collector] Recheck mode - click ignored');
-                return;
-            }}
-            
-            if (window.ws && window.ws.readyState === WebSocket.OPEN) {{
-                console.log('[XPath Collector] Sending data to server:', clickData.name);
-                window.ws.send(JSON.stringify(clickData));
-            }} else {{
-                console.error('[XPath Collector] WebSocket not ready. State:', window.ws ? window.ws.readyState : 'null');
-            }}
-        }}, true);
-        window.clickListenerInjected = true;
-        console.log('[XPath Collector] Click listener INSTALLED');
-    }} else {{
-        console.log('[XPath Collector] Listener already installed, skipping');
-    }}
-
-    function getRelativeXPath(element) {{
-        if (element.id) return '//*[@id="' + element.id + '"]';
-        if (element.className) return '//' + element.tagName.toLowerCase() + '[@class="' + element.className + '"]';
-        var path = [];
-        while (element.nodeType === Node.ELEMENT_NODE) {{
-            var selector = element.nodeName.toLowerCase();
-            if (element.id) {{
-                selector += '[@id="' + element.id + '"]';
-                path.unshift(selector);
-                break;
-            }} else {{
-                var sibling = element.previousSibling;
-                var nth = 1;
-                while (sibling) {{
-                    if (sibling.nodeType === Node.ELEMENT_NODE && sibling.nodeName.toLowerCase() === selector) nth++;
-                    sibling = sibling.previousSibling;
-                }}
-                if (nth !== 1) selector += '[' + nth + ']';
-            }}
-            path.unshift(selector);
-            element = element.parentNode;
-        }}
-        return path.length ? '//' + path.join('/') : '';
-    }}
-
-    function getFullXPath(element) {{
-        var path = [];
-        while (element && element.nodeType === Node.ELEMENT_NODE) {{
-            var selector = element.nodeName.toLowerCase();
-            if (element.id) {{
-                selector += '[@id="' + element.id + '"]';
-            }} else {{
-                var sibling = element.previousSibling;
-                var nth = 1;
-                while (sibling) {{
-                    if (sibling.nodeType === Node.ELEMENT_NODE && sibling.nodeName.toLowerCase() === selector) nth++;
-                    sibling = sibling.previousSibling;
-                }}
-                if (nth !== 1) selector += '[' + nth + ']';
-            }}
-            path.unshift(selector);
-            element = element.parentNode;
-        }}
-        return '//' + path.join('/');
-    }}
-
-    function getCSSSelector(element) {{
-        if (element.id) return '#' + element.id;
-        if (element.className) return element.tagName.toLowerCase() + '.' + element.className.split(' ').join('.');
-        return element.tagName.toLowerCase();
-    }}
+            with metrics.span('compact'):
+                store.compact(bank_name)
+        except Exception as e:
+            print(f"Compaction failed: {e}", flush=True)
+
+def validate_xpaths(xpaths):
+    """Evaluate XPaths in the current page with one batched browser round trip"""
+    with driver_lock, metrics.span('validate_batch'):
+        try:
+            return evaluate_xpaths(driver, xpaths)
+        except Exception as e:
+            # Page is navigating or the driver is gone: fail the whole request so
+            # the locators are reported unavailable, not broken
+            raise RuntimeError(f'Page unavailable: {e}') from e
+
+COLLECTOR_JS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'collector.js')
+
+def collector_script():
+    """The click listener (static/collector.js) with this session's settings"""
+    config = {'recheckMode': recheck_mode, 'captureSnapshots': snapshot_mode, 'wsUrl': f'ws://localhost:{ws_port}'}
+    with open(COLLECTOR_JS, 'r', encoding='utf-8') as f:
+        return f'window.xpathCollectorConfig = {json.dumps(config)};\n' + f.read()
+
+def install_collector(driver):
+    """Register the collector for every document and tab before anything loads
+
+    Falls back to registering it for the first tab only when the DevTools
+    endpoint cannot be reached.
+    """
+    global collector_script_id
+    source = collector_script()
+    with metrics.span('inject'):
+        try:
+            return DevToolsInjector(debugger_address(driver), source).start()
+        except (DevToolsError, OSError) as e:
+            print(f"WARNING: DevTools injection unavailable ({e}); new tabs will not be captured", flush=True)
+            collector_script_id = driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': source})['identifier']
+            return None
+
+def uninstall_collector(injector):
+    """Undo install_collector so a reused browser starts clean"""
+    global collector_script_id
+    if injector:
+        # Scripts registered by the DevTools connection go away with it
+        injector.close()
+    elif collector_script_id:
+        try:
+            driver.execute_cdp_cmd('Page.removeScriptToEvaluateOnNewDocument', {'identifier': collector_script_id})
+        except Exception as e:
+            print(f"Could not remove collector script: {e}", flush=True)
+        collector_script_id = None
+
+def write_session_file(state_dir, url):
+    os.makedirs(state_dir, exist_ok=True)
+    with open(os.path.join(state_dir, 'session.json'), 'w') as f:
+        json.dump({'pid': os.getpid(), 'ws_port': ws_port, 'url': url, 'recheck': recheck_mode,
+                   'standby': standby_mode, 'state': session_state,
+                   'started_on': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}, f, indent=4)
+
+def load_bank(config, load_url):
+    """Open the bank for a URL's domain (snapshot plus any journal left behind)"""
+    global store, bank_name
+    store = get_store(config)
+    bank_name = f'{get_domain(load_url)}.json'
+    output_file = os.path.join('output_folder', bank_name)
+    try:
+        store.check(bank_name)
+    except json.JSONDecodeError as e:
+        corrupt_file = quarantine_snapshot(output_file)
+        print(f"WARNING: {output_file} is unreadable ({e}); moved to {corrupt_file}", flush=True)
+
+def run_session(load_url, started):
+    """Capture or recheck load_url until a stop or release request
+
+    started is the perf_counter() value the time-to-first-interaction is
+    measured from.
     """
-    driver.execute_script(script)
+    global release_flag
+    session_done = threading.Event()
+
+    injector = install_collector(driver)
+    if injector:
+        injector.add_listener(on_devtools_event)
+    with metrics.span('page_load'):
+        driver.get(load_url)
+    
+    # Start background compaction of the bank journal
+    compactor = threading.Thread(target=compaction_thread, args=(store, bank_name, session_done))
+    compactor.daemon = True
+    compactor.start()
+
+    if injector:
+        # Navigation is pushed by the browser; nothing polls the driver
+        set_current_url(driver.current_url)
+    else:
+        url_monitor_thread = threading.Thread(target=monitor_url_thread, args=(driver, session_done))
+        url_monitor_thread.daemon = True
+        url_monitor_thread.start()
+    
+    page_url = driver.current_url
+    page_name = driver.title
+    ready_seconds = round(time.perf_counter() - started, 3)
+    set_state('active', url=page_url, ready_seconds=ready_seconds)
+
+    if recheck_mode:
+        print(f"RECHECK MODE: Page loaded: {page_name} - {page_url}")
+        print("RECHECK MODE: XPath capture is DISABLED. Navigate to validate existing XPaths.")
+    else:
+        print(f"Page loaded: {page_name} - {page_url}")
+        print("Click on elements to capture xpaths. Press Ctrl+C to stop.")
+    print(f"Ready for interaction after {ready_seconds:.2f}s", flush=True)
+
+    # The collector is installed by the browser itself on every load, so the
+    # main thread only waits for a stop (or release) request
+    while not stop_flag and not release_flag:
+        time.sleep(0.1)
+    release_flag = False
+
+    print("Loop exited", flush=True)
+    session_done.set()
+    uninstall_collector(injector)
+
+    # Fold the journal into the readable snapshot
+    try:
+        with metrics.span('compact'):
+            compacted = store.compact(bank_name)
+        if compacted:
+            print("Bank compacted", flush=True)
+    except Exception as e:
+        print(f"Compaction failed: {e}", flush=True)
+
+def run_standby(config, state_dir):
+    """Keep a started browser and serve one activation after another"""
+    global recheck_mode, snapshot_mode, pending_activation, current_url
+    driver.get('about:blank')
+    uses = 0
+    while not stop_flag:
+        set_state('standby', uses=uses)
+        print("Browser on standby", flush=True)
+        activation_event.wait()
+        activation_event.clear()
+        if stop_flag:
+            break
+        activation, pending_activation = pending_activation, None
+        recheck_mode = activation['recheck']
+        snapshot_mode = activation['snapshots'] if activation['snapshots'] is not None else config.get('capture_dom_snapshots', False)
+        load_bank(config, activation['url'])
+        if state_dir:
+            write_session_file(state_dir, activation['url'])
+        run_session(activation['url'], activation['received'])
+        uses += 1
+        if stop_flag:
+            break
+        set_state('resetting')
+        try:
+            reset_browser(driver, visited_origins)
+        except Exception as e:
+            # A browser that cannot be reset is not reused
+            print(f"Browser reset failed: {e}", flush=True)
+            break
+        visited_origins.clear()
+        main_frames.clear()
+        current_url = None
 
 def main():
     import os
-    global data, output_file, check_event, stop_event, driver
+    global driver
+    started = time.perf_counter()
     parser = argparse.ArgumentParser()
     parser.add_argument('--url', help='URL to load')
     parser.add_argument('--recheck', action='store_true', help='Recheck mode - disable XPath capture')
+    parser.add_argument('--snapshots', action='store_true', help='Save a DOM snapshot with every captured xpath')
+    parser.add_argument('--ws-port', type=int, default=8765, help='Port of the WebSocket server (collector and control channel)')
+    parser.add_argument('--state-dir', help='Per-session state directory (used by the session manager)')
+    parser.add_argument('--standby', action='store_true', help='Start the browser and wait for activate requests (warm pool)')
+    parser.add_argument('--trace', action='store_true', help='Append timing spans to trace.jsonl in the state directory')
+    parser.add_argument('--profile', action='store_true', help='Write a sampling profile (profile.folded) to the state directory')
     args = parser.parse_args()
     
-    global recheck_mode
+    global recheck_mode, snapshot_mode, ws_port, standby_mode, stop_event
     recheck_mode = args.recheck
+    ws_port = args.ws_port
+    standby_mode = args.standby
+    metrics.process = 'capture'
+    output_dir = args.state_dir or '.'
+    if args.trace:
+        metrics.start_trace(os.path.join(output_dir, 'trace.jsonl'))
+    profiler = metrics.Profiler(os.path.join(output_dir, 'profile.folded')).start() if args.profile else None
 
     with open('config.json', 'r') as f:
         config = json.load(f)
-    load_url = args.url if args.url else config['load_url']
-    domain = get_domain(load_url)
-    output_file = os.path.join('output_folder', f'{domain}.json')
+    snapshot_mode = args.snapshots or config.get('capture_dom_snapshots', False)
+    load_url = None if standby_mode else (args.url if args.url else config['load_url'])
+    if args.state_dir:
+        write_session_file(args.state_dir, load_url)
+    if load_url:
+        load_bank(config, load_url)
 
-    # Load existing data if file exists
-    if os.path.exists(output_file):
-        try:
-            with open(output_file, 'r') as f:
-                data = json.load(f)
-        except json.JSONDecodeError:
-            data = {}
-    else:
-        data = {}
-
-    check_event = threading.Event()
     stop_event = threading.Event()
 
     # Start WebSocket server
@@ -406,87 +506,16 @@ def main():
     time.sleep(0.1)  # Give server time to start
 
     # Setup Edge driver
-    edge_options = Options()
-    edge_options.add_argument("--disable-web-security")
-    edge_options.add_argument("--disable-features=VizDisplayCompositor")
-    service = Service(executable_path=os.path.join('driver', 'msedgedriver.exe'))
-    driver = webdriver.Edge(service=service, options=edge_options)
-
-    driver.get(load_url)
-    inject_click_listener(driver)
-    injected_urls.add(load_url)
-    
-    # Start URL monitoring thread now that driver is ready
-    url_monitor_thread = threading.Thread(target=monitor_url_thread, args=(driver, stop_event))
-    url_monitor_thread.daemon = True
-    url_monitor_thread.start()
-    
-    # Start XPath validation thread
-    validation_thread = threading.Thread(target=validate_xpaths_thread, args=(driver, stop_event))
-    validation_thread.daemon = True
-    validation_thread.start()
+    driver = create_driver()
 
-    page_url = driver.current_url
-    page_name = driver.title
-
-    if recheck_mode:
-        print(f"RECHECK MODE: Page loaded: {page_name} - {page_url}")
-        print("RECHECK MODE: XPath capture is DISABLED. Navigate to validate existing XPaths.")
+    if standby_mode:
+        run_standby(config, args.state_dir)
     else:
-        print(f"Page loaded: {page_name} - {page_url}")
-        print("Click on elements to capture xpaths. Press Ctrl+C to stop.")
-
-    handled_windows = [driver.current_window_handle]
+        run_session(load_url, started)
 
-    last_check_time = time.time()
-    stop_file = 'stop_capture.flag'
-    # Remove stop file if exists from previous run
-    if os.path.exists(stop_file):
-        os.remove(stop_file)
-    
-    while True:
-        # Check for stop flag from signal or file
-        if stop_flag or os.path.exists(stop_file):
-            if os.path.exists(stop_file):
-                os.remove(stop_file)
-            break
-        if check_event.wait(0.1):
-            check_event.clear()
-            # Re-inject listener on every click to handle page refreshes
-            current_url = driver.current_url
-            inject_click_listener(driver)
-            if current_url not in injected_urls:
-                injected_urls.add(current_url)
-                print(f"New URL detected: {driver.title} - {current_url}")
-        
-        # Lightweight check every 3 seconds for page refresh (no window switching)
-        current_time = time.time()
-        if current_time - last_check_time >= 3:
-            last_check_time = current_time
-            try:
-                current_window = driver.current_window_handle
-                handles = driver.window_handles
-                
-                # Check for new tabs
-                for handle in handles:
-                    if handle not in handled_windows:
-                        driver.switch_to.window(handle)
-                        inject_click_listener(driver)
-                        handled_windows.append(handle)
-                        print(f"New tab detected and injected: {driver.title}")
-                        driver.switch_to.window(current_window)
-                
-                # Check if listener exists in current window
-                has_listener = driver.execute_script("return window.clickListenerInjected === true;")
-                if not has_listener:
-                    inject_click_listener(driver)
-                    print(f"Re-injected after page refresh: {driver.title}")
-            except:
-                pass  # Ignore errors during navigation
-
-    print("Loop exited", flush=True)
     # Shutdown sequence
     print("Stopping...", flush=True)
+    set_state('stopping')
     
     # Close driver first
     try:
@@ -505,6 +534,10 @@ def main():
         print("Thread did not join within timeout", flush=True)
     else:
         print("Thread joined", flush=True)
+
+    metrics.stop_trace()
+    if profiler:
+        print(f"Profile written to {profiler.stop()}", flush=True)
     
     print("Stopped.", flush=True)
     sys.exit(0)
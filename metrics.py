@@ -0,0 +1,225 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import Blueprint, Response, g, request
+
+# Timing spans across the capture and recheck pipeline, kept as histograms
+# and served in the Prometheus text format at GET /metrics.
+#
+# Every process records into its own registry. main.py labels its spans
+# process="capture" and hands them to the web app when asked for them over
+# the control channel (the "metrics" request drains them), so the web app's
+# counters stay monotonic while sessions come and go. Spans can also be
+# appended to a JSON-lines trace file (main.py --trace), and main.py --profile
+# records a sampling profile of the session in collapsed-stack format (one
+# "frame;frame;frame count" line per stack, readable by flamegraph tools).
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PREFIX = 'xpath_bank_'
+HELP = {
+    'span_seconds': 'Time spent in one stage of the capture/recheck pipeline',
+    'http_request_seconds': 'Flask endpoint latency',
+}
+
+process = 'web'
+_histograms = {}  # (family, sorted label items) -> [bucket counts..., +Inf count, sum]
+_lock = threading.Lock()
+_trace_file = None
+_trace_lock = threading.Lock()
+_collectors = []
+
+
+def observe(family, seconds, **labels):
+    """Record one duration in the histogram family with these labels"""
+    labels.setdefault('process', process)
+    key = (family, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        values = _histograms.get(key)
+        if values is None:
+            values = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                values[i] += 1
+                break
+        else:
+            values[len(BUCKETS)] += 1
+        values[-1] += seconds
+
+
+@contextmanager
+def span(name, **labels):
+    """Time the block as span `name` (and trace it when tracing is on)"""
+    start = time.perf_counter()
+    wall = time.time()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        observe('span_seconds', seconds, span=name, **labels)
+        trace(name, wall, seconds, **labels)
+
+
+def observe_span(name, seconds, **labels):
+    """Record a span measured elsewhere (e.g. in the page)"""
+    if seconds is None or seconds < 0:
+        return
+    observe('span_seconds', seconds, span=name, **labels)
+    trace(name, time.time() - seconds, seconds, **labels)
+
+
+def start_trace(path):
+    global _trace_file
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    _trace_file = open(path, 'a', encoding='utf-8')
+
+
+def stop_trace():
+    global _trace_file
+    with _trace_lock:
+        if _trace_file:
+            _trace_file.close()
+            _trace_file = None
+
+
+def trace(name, start, seconds, **labels):
+    if _trace_file is None:
+        return
+    line = json.dumps({'span': name, 'start': round(start, 6), 'ms': round(seconds * 1000, 3),
+                       'thread': threading.current_thread().name, **labels})
+    with _trace_lock:
+        if _trace_file:
+            _trace_file.write(line + '\n')
+            _trace_file.flush()
+
+
+def drain():
+    """Return the recorded histograms and start over (for hand-off to the web app)"""
+    global _histograms
+    with _lock:
+        histograms, _histograms = _histograms, {}
+    return [{'family': family, 'labels': dict(labels), 'values': values}
+            for (family, labels), values in histograms.items()]
+
+
+def merge(snapshot):
+    """Add histograms returned by drain() in another process"""
+    with _lock:
+        for item in snapshot:
+            key = (item['family'], tuple(sorted(item['labels'].items())))
+            values = _histograms.get(key)
+            if values is None:
+                values = _histograms[key] = [0] * (len(BUCKETS) + 2)
+            for i, value in enumerate(item['values']):
+                values[i] += value
+
+
+def add_collector(callback):
+    """Run callback() before every /metrics render (to pull other processes' spans)"""
+    _collectors.append(callback)
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    escaped = (k + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+               for k, v in items)
+    return '{' + ','.join(escaped) + '}'
+
+
+def render():
+    """All histograms in the Prometheus text exposition format"""
+    with _lock:
+        histograms = {key: list(values) for key, values in _histograms.items()}
+    lines = []
+    for family in sorted({family for family, _ in histograms}):
+        name = PREFIX + family
+        lines.append(f'# HELP {name} {HELP.get(family, family)}')
+        lines.append(f'# TYPE {name} histogram')
+        for (key_family, labels), values in sorted(histograms.items()):
+            if key_family != family:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, values):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            cumulative += values[len(BUCKETS)]
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {values[-1]:.6f}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+class Profiler:
+    """Sampling profiler: records every thread's stack every `interval` seconds"""
+
+    def __init__(self, path, interval=0.01):
+        self.path = path
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        """Stop sampling and write the collapsed stacks"""
+        self._stop.set()
+        self._thread.join(timeout=2)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        return self.path
+
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@metrics_bp.after_app_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    # Streamed responses (SSE, exports) are timed until their headers are ready
+    if started is not None and request.endpoint != 'metrics.get_metrics':
+        observe('http_request_seconds', time.perf_counter() - started,
+                endpoint=request.endpoint or 'unknown', method=request.method, status=response.status_code)
+    return response
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    for callback in _collectors:
+        try:
+            callback()
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+    return Response(render(), mimetype='text/plain; version=0.0.4')
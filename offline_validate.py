@@ -0,0 +1,205 @@
+import argparse
+import csv
+import gzip
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from cssselect import HTMLTranslator, SelectorError
+from lxml import etree, html as lxml_html
+
+from bank_store import get_store, read_config
+from dom_snapshots import SNAPSHOT_FOLDER, snapshot_path
+
+# Offline validation: every stored locator is evaluated with lxml against the
+# DOM snapshot saved when it was captured, so a bank can be linted and
+# regression-checked in CI without a browser. Locators are compiled once per
+# process (CSS selectors through cssselect) and snapshots are parsed once
+# each; snapshots are spread over a process pool.
+
+XPATH_FIELDS = ['relative_xpath', 'full_xpath']
+CSS_FIELDS = ['css_selector']
+REPORT_FIELDS = ['page_url', 'entry_id', 'element_name', 'field', 'locator',
+                 'expected_count', 'count', 'status', 'error']
+
+_translator = HTMLTranslator()
+_compiled = {}
+
+
+class LocatorError(ValueError):
+    pass
+
+
+def locator_kind(field):
+    """'css' for CSS selector fields, 'xpath' for everything else"""
+    return 'css' if field in CSS_FIELDS else 'xpath'
+
+
+def compile_locator(locator, kind='xpath'):
+    """Compile an XPath or CSS selector into an lxml XPath, caching per process"""
+    key = (kind, locator)
+    compiled = _compiled.get(key)
+    if compiled is None:
+        try:
+            expression = _translator.css_to_xpath(locator) if kind == 'css' else locator
+            compiled = etree.XPath(expression)
+        except (etree.XPathSyntaxError, SelectorError) as e:
+            raise LocatorError(str(e)) from e
+        _compiled[key] = compiled
+    return compiled
+
+
+def is_valid_locator(locator, kind='xpath'):
+    """True if the locator is non-empty and compiles"""
+    if not locator or not locator.strip():
+        return False
+    try:
+        compile_locator(locator.strip(), kind)
+        return True
+    except LocatorError:
+        return False
+
+
+def count_matches(document, locator, kind='xpath'):
+    result = compile_locator(locator, kind)(document)
+    if isinstance(result, list):
+        return len(result)
+    # Non node-set expressions (count(), boolean()...) match if truthy
+    return 1 if result else 0
+
+
+def evaluate_snapshot(job):
+    """Worker: evaluate [(key, locator, kind)] against one snapshot file
+
+    Returns [(key, count, error)]; count is None when evaluation failed.
+    """
+    path, locators = job
+    with open(path, 'rb') as f:
+        document = lxml_html.document_fromstring(gzip.decompress(f.read()))
+    results = []
+    for key, locator, kind in locators:
+        try:
+            results.append((key, count_matches(document, locator, kind), None))
+        except (LocatorError, etree.XPathEvalError) as e:
+            results.append((key, None, str(e)))
+    return results
+
+
+def entry_locators(entry, all_candidates=False):
+    """[(field, locator, expected_count)] to check for one entry"""
+    locators = []
+    if entry.get('final_xpath'):
+        locators.append(('final_xpath', entry['final_xpath'], 1))
+    if all_candidates:
+        candidates = [(field, entry.get(field)) for field in XPATH_FIELDS + CSS_FIELDS]
+        candidates += [(f'visual_{key}', value) for key, value in (entry.get('visual_xpath') or {}).items()]
+        for field, value in candidates:
+            if isinstance(value, dict):
+                locator, expected = value.get('xpath'), value.get('count')
+            else:
+                locator, expected = value, None
+            if locator:
+                locators.append((field, locator, expected))
+    return locators
+
+
+def classify(count, expected, error):
+    if error is not None:
+        return 'invalid'
+    if count is None:
+        return 'no_snapshot'
+    if count == 0:
+        return 'missing'
+    if expected is not None and count != expected:
+        return 'changed'
+    return 'unique' if count == 1 else 'multiple'
+
+
+def validate_bank(store, bank_name, all_candidates=False, workers=None, snapshot_root=SNAPSHOT_FOLDER):
+    """Evaluate a bank's stored locators against its snapshots; returns report rows"""
+    rows = []
+    jobs = {}
+    for page_key, page_data, entry in store.iter_rows(bank_name):
+        if entry is None:
+            continue
+        snapshot_id = entry.get('snapshot')
+        path = snapshot_path(bank_name, snapshot_id, snapshot_root) if snapshot_id else None
+        if path and not os.path.exists(path):
+            path = None
+        for field, locator, expected in entry_locators(entry, all_candidates):
+            row = {'page_url': page_key, 'entry_id': entry.get('id'), 'element_name': entry.get('name', ''),
+                   'field': field, 'locator': locator, 'expected_count': expected, 'count': None, 'error': None}
+            rows.append(row)
+            kind = locator_kind(field)
+            if path:
+                jobs.setdefault(path, []).append((len(rows) - 1, locator, kind))
+            else:
+                # No snapshot: still lint the syntax
+                try:
+                    compile_locator(locator, kind)
+                except LocatorError as e:
+                    row['error'] = str(e)
+
+    job_list = list(jobs.items())
+    if workers == 1 or len(job_list) <= 1:
+        batches = [evaluate_snapshot(job) for job in job_list]
+    else:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            batches = list(executor.map(evaluate_snapshot, job_list,
+                                        chunksize=max(1, len(job_list) // (workers * 4))))
+    for batch in batches:
+        for index, count, error in batch:
+            rows[index]['count'] = count
+            rows[index]['error'] = error
+
+    for row in rows:
+        row['status'] = classify(row['count'], row['expected_count'], row['error'])
+    return rows
+
+
+def write_report(rows, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: ('' if row[k] is None else row[k]) for k in REPORT_FIELDS})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate stored locators against capture-time DOM snapshots')
+    parser.add_argument('banks', nargs='*', help='Bank names, e.g. google.com.json (default: all banks)')
+    parser.add_argument('--all-candidates', action='store_true', help='Check every candidate locator, not only final_xpath')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--report', help='CSV report path (default: reports/offline-<timestamp>.csv)')
+    parser.add_argument('--strict', action='store_true', help='Exit with status 1 on invalid, changed or lost locators')
+    args = parser.parse_args()
+
+    store = get_store(read_config())
+    started = time.perf_counter()
+    rows = []
+    for bank_name in args.banks or store.list_banks():
+        rows.extend(validate_bank(store, bank_name, args.all_candidates, args.workers))
+    elapsed = time.perf_counter() - started
+
+    report = args.report or os.path.join('reports', f"offline-{datetime.now().strftime('%Y-%m-%d_%H%M%S')}.csv")
+    write_report(rows, report)
+    totals = {}
+    for row in rows:
+        totals[row['status']] = totals.get(row['status'], 0) + 1
+    rate = len(rows) / elapsed if elapsed > 0 else 0
+    print(f"Checked {len(rows)} locators in {elapsed:.2f}s ({rate:.0f}/s): "
+          + ', '.join(f'{status} {count}' for status, count in sorted(totals.items())))
+    print(f"Report written to {report}")
+    # A locator that matched when captured and now matches nothing is missing,
+    # and fails --strict like a changed count
+    lost = any(row['status'] == 'missing' and row['expected_count'] for row in rows)
+    if args.strict and (totals.get('invalid') or totals.get('changed') or lost):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
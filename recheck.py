@@ -1,16 +1,57 @@
-from flask import Blueprint, render_template, request, jsonify
-import subprocess
-import sys
+from flask import Blueprint, Response, render_template, request, jsonify, stream_with_context
 import os
-import time
-import signal
 import csv
+import json
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from capture_channel import ChannelError, ChannelTimeout
+from session_manager import manager, session_or_latest
+from bank_store import read_config
+import metrics
+from validation_history import record_reports
 
 recheck_bp = Blueprint('recheck', __name__)
 
-# Global variable to store the recheck process
-recheck_process = None
+# Unattended batch rechecks started through the API, by job id
+batch_jobs = {}
+
+# Validation jobs, by job id. A job is evaluated in batches on a bounded
+# worker pool and every locator's outcome is appended to the job's event list
+# as soon as it is known, for /validate_xpaths/<job_id>/events to stream.
+# Outcomes: found, not_found, invalid (the XPath does not compile), timeout
+# (the browser did not answer in time) and unavailable (no recheck browser, or
+# the page could not be evaluated).
+VALIDATION_WORKERS = 4
+VALIDATION_BATCH = 10
+VALIDATION_TIMEOUT = 5  # Seconds to wait for the browser per batch
+VALIDATION_RETRY_DELAY = 2  # Seconds before not found / timed out locators are tried again
+VALIDATION_JOB_TTL = 600  # Seconds a finished job is kept
+validation_jobs = {}
+validation_jobs_lock = threading.Lock()
+validation_pool = ThreadPoolExecutor(max_workers=VALIDATION_WORKERS, thread_name_prefix='validate')
+
+# is_exist column of the CSV report for each outcome
+REPORT_VALUES = {True: 'yes', False: 'no', 'found': 'yes', 'not_found': 'no', 'invalid': 'no', 'timeout': 'timeout'}
+# Columns of reports/<date>.csv; entry_id keys the validation history (validation_history.py)
+REPORT_FIELDS = ['page_url', 'element_name', 'element_xpath', 'is_exist', 'checked_date_time', 'entry_id']
+
+# One queue per open /recheck_events stream
+event_subscribers = set()
+event_subscribers_lock = threading.Lock()
+
+def forward_event(event, message):
+    """Channel listener: fan a capture-process event out to every event stream"""
+    with event_subscribers_lock:
+        subscribers = list(event_subscribers)
+    for subscriber in subscribers:
+        subscriber.put(message)
+
+# However a recheck session is started (here or from the Sessions panel)
+manager.listen('recheck', forward_event)
 
 @recheck_bp.route('/recheck', methods=['GET'])
 def recheck_page():
@@ -19,9 +60,7 @@ def recheck_page():
 
 @recheck_bp.route('/launch_recheck', methods=['POST'])
 def launch_recheck():
-    """Launch Selenium browser with the first page URL"""
-    global recheck_process
-    
+    """Launch Selenium browser with the first page URL in a new recheck session"""
     try:
         data = request.json
         url = data.get('url')
@@ -31,54 +70,34 @@ def launch_recheck():
         
         # Update config.json with the URL
         config_path = 'config.json'
-        import json
-        config = {'load_url': url}
+        config = read_config(config_path)
+        config['load_url'] = url
         with open(config_path, 'w') as f:
             json.dump(config, f, indent=4)
         
         # Start main.py with the URL in recheck mode
-        python_path = '.venv/Scripts/python.exe' if os.path.exists('.venv/Scripts/python.exe') else sys.executable
-        recheck_process = subprocess.Popen(
-            [python_path, 'main.py', '--url', url, '--recheck'],
-            creationflags=subprocess.CREATE_NEW_CONSOLE if sys.platform == 'win32' else 0
-        )
+        session = manager.start('recheck', url)
         
-        return jsonify({'status': 'success', 'message': f'Browser launched with URL: {url}'})
+        return jsonify({'status': 'success', 'message': f'Browser launched with URL: {url}',
+                        'session_id': session.id})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def recheck_session(session_id=None):
+    """The addressed recheck session, or the latest live one"""
+    return session_or_latest('recheck', session_id)
+
 @recheck_bp.route('/stop_recheck', methods=['POST'])
 def stop_recheck():
-    """Stop the recheck process by sending Ctrl+C twice"""
-    global recheck_process
-    
+    """Stop the recheck process with a stop request on its control channel"""
     try:
-        if not recheck_process or recheck_process.poll() is not None:
+        data = request.get_json(silent=True) or {}
+        session = recheck_session(data.get('session_id'))
+        if not session or not session.alive:
             return jsonify({'status': 'error', 'message': 'No recheck process running'}), 400
         
-        # Create stop file flag
-        stop_file = 'stop_capture.flag'
-        with open(stop_file, 'w') as f:
-            f.write('stop')
-        
-        # Wait for graceful shutdown
-        try:
-            recheck_process.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            # Force terminate if graceful shutdown fails
-            if sys.platform == 'win32':
-                # On Windows, use taskkill to terminate process tree
-                subprocess.run(['taskkill', '/F', '/T', '/PID', str(recheck_process.pid)], 
-                             capture_output=True)
-            else:
-                recheck_process.kill()
-            recheck_process.wait()
-        
-        # Clean up stop file
-        if os.path.exists(stop_file):
-            os.remove(stop_file)
-        
-        recheck_process = None
+        manager.stop(session.id)
+        forward_event('stopped', {'type': 'event', 'event': 'stopped', 'session_id': session.id})
         return jsonify({'status': 'success', 'message': 'Recheck stopped'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -87,79 +106,277 @@ def stop_recheck():
 def get_current_url():
     """Get the current URL from the Selenium browser"""
     try:
-        url_file = 'current_url.txt'
-        if os.path.exists(url_file):
-            with open(url_file, 'r') as f:
-                current_url = f.read().strip()
-            return jsonify({'status': 'success', 'url': current_url})
+        session = recheck_session(request.args.get('session'))
+        if session and session.channel.connected and session.channel.current_url:
+            return jsonify({'status': 'success', 'url': session.channel.current_url})
         else:
             return jsonify({'status': 'error', 'message': 'No active browser session'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@recheck_bp.route('/recheck_events', methods=['GET'])
+def recheck_events():
+    """Server-Sent Events stream of navigation events from recheck browsers
+
+    ?session=<id> limits the stream to one session.
+    """
+    session_id = request.args.get('session')
+    subscriber = queue.Queue()
+    with event_subscribers_lock:
+        event_subscribers.add(subscriber)
+    
+    def stream():
+        try:
+            # Start from the page the browser is on right now
+            session = recheck_session(session_id)
+            if session and session.channel.connected and session.channel.current_url:
+                payload = {'url': session.channel.current_url, 'session_id': session.id}
+                yield f"event: current_url\ndata: {json.dumps(payload)}\n\n"
+            while True:
+                try:
+                    message = subscriber.get(timeout=15)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'  # Lets the server notice closed connections
+                    continue
+                if session_id and message.get('session_id') != session_id:
+                    continue
+                payload = {k: v for k, v in message.items() if k not in ('type', 'event')}
+                yield f"event: {message.get('event')}\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            with event_subscribers_lock:
+                event_subscribers.discard(subscriber)
+    
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @recheck_bp.route('/validate_xpaths', methods=['POST'])
 def validate_xpaths():
-    """Validate if XPaths exist in the current page and log to CSV report"""
+    """Start validating XPaths in the recheck browser; returns a job id at once
+
+    Optional: delay (seconds to let the page settle first) and retry_missing
+    (try not found and timed out locators once more after a short wait).
+    """
     try:
         data = request.json
-        xpaths_data = data.get('xpaths_data', [])  # List of {xpath, name, page_url}
+        xpaths_data = data.get('xpaths_data', [])  # List of {xpath, name, page_url, entry_id}
         
         if not xpaths_data:
             return jsonify({'status': 'error', 'message': 'No xpaths provided'}), 400
         
-        # Extract just the xpaths for validation
-        xpaths = [item['xpath'] for item in xpaths_data]
-        
-        # Create a validation request file
-        validation_file = 'xpath_validation_request.json'
-        result_file = 'xpath_validation_result.json'
-        
-        # Check if browser is running by checking if current_url.txt exists
-        if not os.path.exists('current_url.txt'):
-            # Browser not launched yet, return all as invalid without error
-            result = {xpath: False for xpath in xpaths}
-            return jsonify({'status': 'success', 'results': result})
-        
-        # Clean up old result file
-        if os.path.exists(result_file):
-            os.remove(result_file)
-        
-        # Write validation request
-        import json
-        with open(validation_file, 'w') as f:
-            json.dump({'xpaths': xpaths}, f)
-        
-        # Wait for result file to be created (with timeout)
-        timeout = 5
-        start_time = time.time()
-        while not os.path.exists(result_file):
-            if time.time() - start_time > timeout:
-                # Timeout - browser might be busy, return all as invalid
-                result = {xpath: False for xpath in xpaths}
-                if os.path.exists(validation_file):
-                    os.remove(validation_file)
-                return jsonify({'status': 'success', 'results': result})
-            time.sleep(0.1)
+        session = recheck_session(data.get('session_id'))
+        job = create_validation_job(xpaths_data, session.id if session else None)
+        submit_validation(job, job['xpaths'], float(data.get('delay', 0)),
+                          final=not data.get('retry_missing', False))
+        return jsonify({'status': 'success', 'job_id': job['id'], 'total': job['total']}), 202
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@recheck_bp.route('/validate_xpaths/<job_id>', methods=['GET'])
+def validation_job_status(job_id):
+    """Progress and per-locator results of a validation job"""
+    job = validation_jobs.get(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+    with job['condition']:
+        return jsonify({'status': 'success', 'job_id': job_id, 'state': job['state'],
+                        'total': job['total'], 'done': len(job['results']), 'results': dict(job['results'])})
+
+@recheck_bp.route('/validate_xpaths/<job_id>/events', methods=['GET'])
+def validation_job_events(job_id):
+    """Server-sent events: one "result" per locator as it finishes, then "done" """
+    job = validation_jobs.get(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+    # A reconnecting EventSource resumes after the last event it saw
+    try:
+        start = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        start = 0  # Malformed header: replay from the first event
+
+    def stream():
+        index = start
+        while True:
+            with job['condition']:
+                while index >= len(job['events']):
+                    if not job['condition'].wait(timeout=15):
+                        break
+                events = job['events'][index:]
+            if not events:
+                yield ': keep-alive\n\n'
+                continue
+            for event in events:
+                yield f"id: {index}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+                index += 1
+                if event['event'] == 'done':
+                    return
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def create_validation_job(xpaths_data, session_id):
+    prune_validation_jobs()
+    # Several entries may share an XPath; it is evaluated once
+    xpaths = list(dict.fromkeys(item['xpath'] for item in xpaths_data))
+    job = {'id': uuid.uuid4().hex[:12], 'session_id': session_id, 'state': 'queued',
+           'xpaths_data': xpaths_data, 'xpaths': xpaths, 'total': len(xpaths),
+           'results': {}, 'events': [], 'condition': threading.Condition(), 'finished': None}
+    with validation_jobs_lock:
+        validation_jobs[job['id']] = job
+    return job
+
+def prune_validation_jobs():
+    now = time.time()
+    with validation_jobs_lock:
+        for job_id in [j for j, job in validation_jobs.items()
+                       if job['finished'] and now - job['finished'] > VALIDATION_JOB_TTL]:
+            del validation_jobs[job_id]
+
+def submit_validation(job, xpaths, delay=0, final=True):
+    if delay > 0:
+        # Wait on a timer rather than in a pool worker
+        threading.Timer(delay, validation_pool.submit, args=(run_validation, job, xpaths, final)).start()
+    else:
+        validation_pool.submit(run_validation, job, xpaths, final)
+
+def locator_outcome(detail):
+    if detail is None:
+        return {'status': 'unavailable', 'count': None, 'visible': None, 'error': 'No result'}
+    # Per-XPath errors are syntax errors; a failing page fails the whole request
+    if detail.get('error'):
+        return {'status': 'invalid', 'count': 0, 'visible': False, 'error': detail['error']}
+    status = 'found' if detail['count'] > 0 else 'not_found'
+    return {'status': status, 'count': detail['count'], 'visible': detail['visible'], 'error': None}
+
+def run_validation(job, xpaths, final):
+    """Evaluate one pass of a job, batch by batch, recording outcomes as they arrive"""
+    try:
+        job['state'] = 'running'
+        session = manager.get(job['session_id']) if job['session_id'] else None
+        retry = []
+        for i in range(0, len(xpaths), VALIDATION_BATCH):
+            batch = xpaths[i:i + VALIDATION_BATCH]
+            if not session or not session.alive or not session.channel.connected:
+                outcomes = {x: {'status': 'unavailable', 'count': None, 'visible': None,
+                                'error': 'Recheck browser not running'} for x in batch}
+            else:
+                try:
+                    with metrics.span('recheck_validate_batch'):
+                        details = session.channel.request('validate', timeout=VALIDATION_TIMEOUT, xpaths=batch)['details']
+                    outcomes = {x: locator_outcome(details.get(x)) for x in batch}
+                except ChannelTimeout:
+                    outcomes = {x: {'status': 'timeout', 'count': None, 'visible': None,
+                                    'error': f'No answer within {VALIDATION_TIMEOUT}s'} for x in batch}
+                except ChannelError as e:
+                    outcomes = {x: {'status': 'unavailable', 'count': None, 'visible': None, 'error': str(e)}
+                                for x in batch}
+            for xpath, outcome in outcomes.items():
+                if not final and outcome['status'] in ('not_found', 'timeout'):
+                    retry.append(xpath)  # Page may still be rendering
+                else:
+                    record_outcome(job, xpath, outcome)
+        if retry:
+            submit_validation(job, retry, VALIDATION_RETRY_DELAY, final=True)
+        else:
+            finish_validation(job)
+    except Exception as e:
+        print(f"Validation job {job['id']} failed: {e}")
+        for xpath in xpaths:
+            if xpath not in job['results']:
+                record_outcome(job, xpath, {'status': 'unavailable', 'count': None, 'visible': None, 'error': str(e)})
+        finish_validation(job)
+
+def record_outcome(job, xpath, outcome):
+    with job['condition']:
+        job['results'][xpath] = outcome
+        job['events'].append({'event': 'result', 'xpath': xpath, **outcome})
+        job['condition'].notify_all()
+
+def finish_validation(job):
+    # Locators that could not be checked at all are left out of the report
+    checked = [item for item in job['xpaths_data']
+               if job['results'].get(item['xpath'], {}).get('status', 'unavailable') != 'unavailable']
+    if checked:
+        write_validation_report(checked, {x: r['status'] for x, r in job['results'].items()})
+    with job['condition']:
+        job['state'] = 'done'
+        job['finished'] = time.time()
+        counts = {}
+        for outcome in job['results'].values():
+            counts[outcome['status']] = counts.get(outcome['status'], 0) + 1
+        job['events'].append({'event': 'done', 'total': job['total'], 'counts': counts})
+        job['condition'].notify_all()
+
+@recheck_bp.route('/batch_recheck', methods=['POST'])
+def start_batch_recheck():
+    """Start a headless recheck of every page of a bank in the background"""
+    import batch_recheck
+    from bank_store import get_store
+    
+    try:
+        data = request.json or {}
+        filename = data.get('filename')
+        if not filename:
+            return jsonify({'status': 'error', 'message': 'filename is required'}), 400
+        store = get_store()
+        if not store.exists(filename):
+            return jsonify({'status': 'error', 'message': 'File not found'}), 404
         
-        # Read result
-        with open(result_file, 'r') as f:
-            result = json.load(f)
+        job_id = uuid.uuid4().hex[:12]
+        job = {'state': 'running', 'bank': filename, 'pages_done': 0, 'pages': None,
+               'summary': None, 'error': None, 'stop_event': threading.Event()}
+        batch_jobs[job_id] = job
         
-        # Clean up files
-        if os.path.exists(validation_file):
-            os.remove(validation_file)
-        if os.path.exists(result_file):
-            os.remove(result_file)
+        def on_page(result):
+            job['pages_done'] += 1
         
-        # Write to CSV report
-        write_validation_report(xpaths_data, result)
+        def run():
+            try:
+                job['pages'] = len(batch_recheck.collect_pages(store, filename))
+                summary = batch_recheck.run_batch(
+                    filename,
+                    workers=int(data.get('workers', 4)),
+                    headless=data.get('headless', True),
+                    page_timeout=float(data.get('timeout', 30)),
+                    store=store,
+                    progress=on_page,
+                    stop_event=job['stop_event']
+                )
+                summary['summary_file'] = batch_recheck.write_summary(summary)
+                job['summary'] = summary
+                job['state'] = 'stopped' if job['stop_event'].is_set() else 'done'
+            except Exception as e:
+                job['error'] = str(e)
+                job['state'] = 'error'
         
-        return jsonify({'status': 'success', 'results': result})
+        threading.Thread(target=run, daemon=True).start()
+        return jsonify({'status': 'success', 'job_id': job_id, 'message': f'Batch recheck started for {filename}'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@recheck_bp.route('/batch_recheck/<job_id>', methods=['GET'])
+def batch_recheck_status(job_id):
+    """Progress of a batch recheck, with its summary once finished"""
+    job = batch_jobs.get(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+    return jsonify({'status': 'success', 'job_id': job_id,
+                    **{k: v for k, v in job.items() if k != 'stop_event'}})
+
+@recheck_bp.route('/batch_recheck/<job_id>/stop', methods=['POST'])
+def stop_batch_recheck(job_id):
+    """Stop a batch recheck after the pages currently open"""
+    job = batch_jobs.get(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+    job['stop_event'].set()
+    return jsonify({'status': 'success', 'message': 'Batch recheck stopping'})
+
 def write_validation_report(xpaths_data, results):
-    """Write validation results to date-wise CSV report"""
+    """Write validation results to date-wise CSV report
+
+    results maps each XPath to True/False or to a validation outcome status;
+    a timed out check is reported as "timeout", not as "no".
+    """
     try:
         # Create reports folder if not exists
         reports_folder = 'reports'
@@ -172,11 +389,15 @@ def write_validation_report(xpaths_data, results):
         
         # Check if file exists to determine if we need headers
         file_exists = os.path.exists(csv_filename)
+        fieldnames = REPORT_FIELDS
+        if file_exists:
+            # Keep the columns of a file started before entry_id was added
+            with open(csv_filename, 'r', newline='', encoding='utf-8') as f:
+                fieldnames = next(csv.reader(f), None) or REPORT_FIELDS
         
         # Open CSV file in append mode
         with open(csv_filename, 'a', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['page_url', 'element_name', 'element_xpath', 'is_exist', 'checked_date_time']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
             
             # Write header if file is new
             if not file_exists:
@@ -188,14 +409,17 @@ def write_validation_report(xpaths_data, results):
             # Write each validation result
             for item in xpaths_data:
                 xpath = item['xpath']
-                is_exist = 'yes' if results.get(xpath, False) else 'no'
+                is_exist = REPORT_VALUES.get(results.get(xpath, False), 'no')
                 
                 writer.writerow({
                     'page_url': item.get('page_url', ''),
                     'element_name': item.get('name', ''),
                     'element_xpath': xpath,
                     'is_exist': is_exist,
-                    'checked_date_time': checked_datetime
+                    'checked_date_time': checked_datetime,
+                    'entry_id': item.get('entry_id', '')
                 })
     except Exception as e:
         print(f"Error writing validation report: {e}")
+        return
+    record_reports()
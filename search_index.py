@@ -0,0 +1,314 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from flask import Blueprint, jsonify, request
+
+from bank_store import OUTPUT_FOLDER, get_store, read_config
+from xpath_bank import CANDIDATE_FIELDS
+
+# Search across every bank: element names, page names/URLs and all stored
+# locators (final, custom, candidate and visual XPaths, CSS selectors). The
+# banks stay the record; a search brings this SQLite index in step with them
+# at most every search_refresh_seconds (config.json, default REFRESH_SECONDS).
+# Banks whose signature changed are re-read and only their added, changed or
+# deleted entries are rewritten (each entry's indexed text is kept with a
+# digest).
+#
+# The text lives in an FTS5 table with the trigram tokenizer, so substring
+# queries of three or more characters are answered from the index. Shorter
+# queries, and SQLite builds without trigram support, fall back to LIKE over
+# the same table. Prefix queries are substring matches narrowed to values
+# that start with the query.
+
+SEARCH_PATH = os.path.join(OUTPUT_FOLDER, 'search.sqlite3')
+# Query field -> FTS column
+COLUMNS = {'name': 'name', 'page': 'page', 'xpath': 'xpaths'}
+MODES = ['substring', 'prefix']
+REFRESH_SECONDS = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS banks (
+    name TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    entries INTEGER NOT NULL,
+    indexed_at TEXT
+);
+CREATE TABLE IF NOT EXISTS entries (
+    doc INTEGER PRIMARY KEY,
+    bank TEXT NOT NULL,
+    entry_id TEXT NOT NULL,
+    page_key TEXT,
+    page_name TEXT,
+    name TEXT,
+    final_xpath TEXT,
+    fields TEXT NOT NULL,
+    digest TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS entries_by_bank ON entries (bank, entry_id);
+"""
+
+_indexes = {}
+
+
+def entry_fields(page_key, page_data, entry):
+    """[(field, value)] of everything searchable about one entry"""
+    fields = [('name', entry.get('name'))]
+    for field in ('page_url', 'page_full_url', 'page_name'):
+        fields.append((field, page_data.get(field)))
+    if page_key not in (page_data.get('page_url'), page_data.get('page_full_url')):
+        fields.append(('page_key', page_key))
+    for field in ['final_xpath', 'custom_xpath'] + CANDIDATE_FIELDS:
+        value = entry.get(field)
+        fields.append((field, value.get('xpath') if isinstance(value, dict) else value))
+    for kind, value in (entry.get('visual_xpath') or {}).items():
+        fields.append((f'visual_xpath.{kind}', value.get('xpath') if isinstance(value, dict) else value))
+    return [(field, value) for field, value in fields if isinstance(value, str) and value]
+
+
+def field_column(field):
+    if field == 'name':
+        return 'name'
+    return 'page' if field.startswith('page') else 'xpaths'
+
+
+def like_pattern(text, prefix=False):
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%' if prefix else '%' + escaped + '%'
+
+
+class SearchIndex:
+    """Inverted index over all banks of the configured store, in one SQLite database"""
+
+    def __init__(self, db_path=SEARCH_PATH, store=None, refresh_seconds=REFRESH_SECONDS):
+        self.db_path = db_path
+        self.store = store
+        self.refresh_seconds = refresh_seconds
+        self._refreshed_at = None  # time.monotonic() of the last refresh
+        self._local = threading.local()
+        self._refresh_lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        try:
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(name, page, xpaths, tokenize='trigram')")
+        except sqlite3.OperationalError:
+            print(f"SQLite {sqlite3.sqlite_version} has no FTS5 trigram tokenizer; searches will scan")
+            conn.execute('CREATE TABLE IF NOT EXISTS search (name TEXT, page TEXT, xpaths TEXT)')
+        # Ask the schema: IF NOT EXISTS keeps a plain table built by an older SQLite
+        sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'search'").fetchone()[0]
+        self.trigram = 'trigram' in sql.lower()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    # --- Indexing ---
+
+    def refresh(self):
+        """Bring the index in step with the banks; returns {bank: entries changed}"""
+        store = self.store or get_store()
+        changed = {}
+        with self._refresh_lock:
+            conn = self._connect()
+            indexed = dict(conn.execute('SELECT name, signature FROM banks'))
+            names = store.list_banks()
+            for name in names:
+                signature = store.signature(name)[0]
+                if indexed.get(name) != signature:
+                    changed[name] = self._index_bank(conn, store, name, signature)
+            for name in set(indexed) - set(names):
+                changed[name] = self._drop_bank(conn, name)
+            self._refreshed_at = time.monotonic()
+        return changed
+
+    def refresh_if_due(self):
+        """Refresh unless the last refresh was less than refresh_seconds ago; returns refresh() or None"""
+        if self._refreshed_at is not None and time.monotonic() - self._refreshed_at < self.refresh_seconds:
+            return None
+        return self.refresh()
+
+    def _index_bank(self, conn, store, name, signature):
+        current = {}
+        # Past the bank cache, so a reindex does not evict the banks in use
+        for page_key, page_data, entry in store.iter_rows(name, cached=False):
+            if entry is not None:
+                current[entry['id']] = (page_key, page_data.get('page_name'), entry.get('name'),
+                                        entry.get('final_xpath'), entry_fields(page_key, page_data, entry))
+        known = {row[0]: (row[1], row[2]) for row in
+                 conn.execute('SELECT entry_id, doc, digest FROM entries WHERE bank = ?', (name,))}
+        changes = 0
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for entry_id, (doc, digest) in known.items():
+                if entry_id not in current:
+                    self._delete_doc(conn, doc)
+                    changes += 1
+            for entry_id, (page_key, page_name, entry_name, final_xpath, fields) in current.items():
+                digest = hashlib.sha1(json.dumps([page_key, fields]).encode('utf-8')).hexdigest()
+                if entry_id in known:
+                    if known[entry_id][1] == digest:
+                        continue
+                    self._delete_doc(conn, known[entry_id][0])
+                doc = conn.execute("""
+                    INSERT INTO entries (bank, entry_id, page_key, page_name, name, final_xpath, fields, digest)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (name, entry_id, page_key, page_name, entry_name, final_xpath, json.dumps(fields),
+                      digest)).lastrowid
+                columns = {'name': [], 'page': [], 'xpaths': []}
+                for field, value in fields:
+                    columns[field_column(field)].append(value)
+                conn.execute('INSERT INTO search (rowid, name, page, xpaths) VALUES (?, ?, ?, ?)',
+                             (doc, *['\n'.join(columns[c]) for c in ('name', 'page', 'xpaths')]))
+                changes += 1
+            conn.execute('INSERT OR REPLACE INTO banks (name, signature, entries, indexed_at) VALUES (?, ?, ?, ?)',
+                         (name, signature, len(current), time.strftime('%Y-%m-%d %H:%M:%S')))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return changes
+
+    def _drop_bank(self, conn, name):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM search WHERE rowid IN (SELECT doc FROM entries WHERE bank = ?)', (name,))
+            dropped = conn.execute('DELETE FROM entries WHERE bank = ?', (name,)).rowcount
+            conn.execute('DELETE FROM banks WHERE name = ?', (name,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return dropped
+
+    def _delete_doc(self, conn, doc):
+        conn.execute('DELETE FROM search WHERE rowid = ?', (doc,))
+        conn.execute('DELETE FROM entries WHERE doc = ?', (doc,))
+
+    # --- Queries ---
+
+    def search(self, text, mode='substring', fields=None, bank=None, limit=50):
+        """Entries with a value containing (or, in prefix mode, starting with) text, case-insensitively
+
+        fields limits the search to some of 'name', 'page' and 'xpath'.
+        Returns (results, has_more).
+        """
+        columns = [COLUMNS[f] for f in fields] if fields else list(COLUMNS.values())
+        needle = text.lower()
+        if self.trigram and len(text) >= 3:
+            phrase = '"' + text.replace('"', '""') + '"'
+            where = 'search MATCH ?'
+            params = [f"{{{' '.join(columns)}}} : {phrase}"]
+            order = 'ORDER BY search.rank'
+        else:
+            where = '(' + ' OR '.join(f"search.{c} LIKE ? ESCAPE '\\'" for c in columns) + ')'
+            params = [like_pattern(text)] * len(columns)
+            order = ''
+        if bank:
+            where += ' AND e.bank = ?'
+            params.append(bank)
+        cursor = self._connect().execute(f"""
+            SELECT e.bank, e.entry_id, e.page_key, e.page_name, e.name, e.final_xpath, e.fields
+            FROM search JOIN entries e ON e.doc = search.rowid
+            WHERE {where} {order}
+        """, params)
+        results = []
+        for row in cursor:
+            matches = []
+            for field, value in json.loads(row[6]):
+                if field_column(field) not in columns:
+                    continue
+                position = value.lower().find(needle)
+                if position == 0 or (position > 0 and mode != 'prefix'):
+                    matches.append({'field': field, 'value': value})
+            if not matches:
+                continue
+            if len(results) == limit:
+                return results, True
+            results.append({'bank': row[0], 'entry_id': row[1], 'page_key': row[2], 'page_name': row[3],
+                            'name': row[4], 'final_xpath': row[5], 'matches': matches})
+        return results, False
+
+    def info(self):
+        conn = self._connect()
+        banks, entries = conn.execute('SELECT COUNT(*), COALESCE(SUM(entries), 0) FROM banks').fetchone()
+        return {'banks': banks, 'entries': entries, 'trigram': self.trigram}
+
+
+def get_search_index(config=None):
+    """Return the search index selected by config.json ("search_index_path")"""
+    if config is None:
+        config = read_config()
+    path = config.get('search_index_path', SEARCH_PATH)
+    if path not in _indexes:
+        _indexes[path] = SearchIndex(path, get_store(config), config.get('search_refresh_seconds', REFRESH_SECONDS))
+    return _indexes[path]
+
+
+search_bp = Blueprint('search', __name__)
+
+
+@search_bp.route('/search', methods=['GET'])
+def search():
+    """Entries of all banks matching ?q= (mode=substring|prefix, fields=name,page,xpath, bank=, limit=50)"""
+    text = request.args.get('q', '')
+    mode = request.args.get('mode', 'substring')
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    if not text:
+        return jsonify({'status': 'error', 'message': 'q is required'}), 400
+    if mode not in MODES:
+        return jsonify({'status': 'error', 'message': f"mode must be one of {', '.join(MODES)}"}), 400
+    unknown = [f for f in fields if f not in COLUMNS]
+    if unknown:
+        return jsonify({'status': 'error', 'message': f"Unknown fields: {', '.join(unknown)}"}), 400
+    try:
+        start = time.perf_counter()
+        index = get_search_index()
+        index.refresh_if_due()
+        results, has_more = index.search(text, mode, fields, request.args.get('bank'),
+                                         request.args.get('limit', 50, type=int))
+        return jsonify({'status': 'success', 'results': results, 'has_more': has_more,
+                        'took_ms': round((time.perf_counter() - start) * 1000, 2)})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index all banks and search their names, pages and locators')
+    parser.add_argument('--db', default=None, help=f'Index database (default: config search_index_path or {SEARCH_PATH})')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('refresh', help='Re-index the banks that changed since the last run')
+    query_cmd = sub.add_parser('query', help='Print the entries matching a query')
+    query_cmd.add_argument('text')
+    query_cmd.add_argument('--mode', choices=MODES, default='substring')
+    query_cmd.add_argument('--fields', default='', help='Comma-separated: name, page, xpath')
+    query_cmd.add_argument('--bank')
+    query_cmd.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    index = SearchIndex(args.db, get_store()) if args.db else get_search_index()
+    changed = index.refresh()
+    if args.command == 'refresh':
+        print(f"Re-indexed {len(changed)} banks ({sum(changed.values())} entries changed); {index.info()}")
+    elif args.command == 'query':
+        fields = [f.strip() for f in args.fields.split(',') if f.strip()]
+        results, has_more = index.search(args.text, args.mode, fields, args.bank, args.limit)
+        for item in results:
+            for match in item['matches']:
+                print(f"{item['bank']}  {item['page_name'] or item['page_key']}  {item['name']}  "
+                      f"{match['field']}: {match['value']}")
+        if has_more:
+            print(f"(more than {args.limit} entries; raise --limit)")
+
+
+if __name__ == '__main__':
+    main()
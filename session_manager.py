@@ -0,0 +1,490 @@
+import atexit
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import urlparse
+
+from flask import Blueprint, jsonify, request
+
+import metrics
+from bank_store import read_config
+from capture_channel import CaptureChannel, ChannelError, default_uri
+
+# Isolated capture and recheck sessions. Every session is its own main.py
+# process with a WebSocket port picked at start, its own state directory
+# (sessions/<id>/ with session.log and session.json) and its own control
+# channel, so several testers can capture and recheck in parallel on one host.
+# Sessions writing to the same bank are serialized by the bank's write lock
+# (see bank_journal.bank_lock). A supervisor thread tracks each session's
+# health from its process and channel state.
+#
+# Warm pool (opt-in): "warm_pool_size" processes (config.json, default 0) are
+# started with --standby when the web app starts, so Python, msedgedriver and
+# Edge are already up when a capture or recheck is requested. A standby session is handed over with an
+# "activate" request and, when stopped, goes back to standby with a "release"
+# request that resets its browser. It is recycled after "warm_pool_max_uses"
+# hand-offs (default 20) or when it crashes; while every pool member is in use
+# new sessions are started cold. Time to first interaction (start
+# request until the page is loaded and the collector installed) is recorded
+# for warm and cold starts.
+
+SESSIONS_FOLDER = 'sessions'
+START_GRACE = 60  # Seconds a session may take to bring its channel up
+POOL_SIZE = 0
+POOL_MAX_USES = 20
+POOL_MAX_FAILURES = 3  # Standbys dying before they are ready; stop refilling after this many
+TIMING_SAMPLES = 50
+
+sessions_bp = Blueprint('sessions', __name__)
+
+
+def free_port():
+    """Ask the OS for a free localhost port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def bank_name_for_url(url):
+    return f'{urlparse(url).netloc}.json' if url else None
+
+
+def timing_summary(samples):
+    if not samples:
+        return {'count': 0, 'mean': None, 'last': None}
+    return {'count': len(samples), 'mean': round(sum(samples) / len(samples), 3), 'last': samples[-1]}
+
+
+class Session:
+    """One main.py process and its control channel"""
+
+    def __init__(self, kind, url, port, state_dir):
+        self.id = uuid.uuid4().hex[:8]
+        self.kind = kind
+        self.url = url
+        self.bank = bank_name_for_url(url)
+        self.port = port
+        self.state_dir = state_dir
+        self.process = None
+        self.channel = None
+        self.status = 'starting'
+        self.returncode = None
+        self.started = time.time()
+        self.started_on = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.pooled = kind == 'standby'
+        self.uses = 0
+        self.requested = None if self.pooled else self.started
+        self.warm = False
+        self.ready_seconds = None
+        self.listeners = []
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'url': self.url,
+            'bank': self.bank,
+            'port': self.port,
+            'pid': self.process.pid if self.process else None,
+            'state_dir': self.state_dir,
+            'status': self.status,
+            'returncode': self.returncode,
+            'current_url': self.channel.current_url if self.channel else None,
+            'started_on': self.started_on,
+            'uptime': round(time.time() - self.started, 1),
+            'pooled': self.pooled,
+            'uses': self.uses,
+            'warm': self.warm,
+            'ready_seconds': self.ready_seconds
+        }
+
+
+class SessionManager:
+    """Starts, supervises and stops sessions"""
+
+    def __init__(self, folder=SESSIONS_FOLDER, supervise_interval=1.0, pool_size=0, max_uses=POOL_MAX_USES):
+        self.folder = folder
+        self.supervise_interval = supervise_interval
+        self.pool_size = pool_size
+        self.max_uses = max_uses
+        self.pool_configured = False
+        self.timings = {'warm': [], 'cold': []}
+        self.kind_listeners = {}  # kind -> event listeners every session of that kind gets
+        self._pool_failures = 0
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._pool_lock = threading.RLock()
+        self._supervisor = None
+
+    def configure_pool(self, size, max_uses=POOL_MAX_USES):
+        """Set the number of standby sessions to keep and start any missing"""
+        with self._pool_lock:
+            self.pool_size = max(0, int(size))
+            self.max_uses = max(1, int(max_uses))
+            self.pool_configured = True
+            self._pool_failures = 0
+            for session in self.standbys()[:max(0, len(self.pooled()) - self.pool_size)]:
+                self.stop(session.id, release=False)
+            self._fill_pool()
+        self._ensure_supervisor()
+
+    def pooled(self):
+        """Live pool members, on standby or handed out"""
+        return [s for s in self.list() if s.pooled and s.alive and s.status not in ('stopping', 'stopped', 'exited')]
+
+    def standbys(self):
+        """Pool members waiting for a hand-off"""
+        return [s for s in self.pooled() if s.kind == 'standby']
+
+    def pool_status(self):
+        return {
+            'size': self.pool_size,
+            'max_uses': self.max_uses,
+            'members': len(self.pooled()),
+            'standby': len(self.standbys()),
+            'ready': len([s for s in self.standbys() if s.status == 'standby']),
+            'failures': self._pool_failures,
+            'time_to_first_interaction': {mode: timing_summary(samples) for mode, samples in self.timings.items()}
+        }
+
+    def listen(self, kind, listener):
+        """Subscribe listener(event, message) to the events of every future session of a kind"""
+        self.kind_listeners.setdefault(kind, []).append(listener)
+
+    def start(self, kind, url, extra_args=(), listeners=()):
+        """Hand a standby session to a capture ('capture') or recheck ('recheck'),
+        or spawn a new one when none is ready"""
+        if kind not in ('capture', 'recheck'):
+            raise ValueError(f"Unknown session kind: {kind}")
+        listeners = list(listeners) + self.kind_listeners.get(kind, [])
+        session = None if extra_args else self._take_standby(kind)
+        if session is not None:
+            try:
+                self._activate(session, kind, url, listeners)
+            except ChannelError as e:
+                print(f"Standby session {session.id} could not be activated ({e}); starting a new one")
+                self.stop(session.id, release=False)
+                session = None
+        if session is None:
+            session = self._spawn(kind, url, extra_args, listeners)
+        return session
+
+    def _take_standby(self, kind):
+        with self._lock:
+            for session in self._sessions.values():
+                if session.kind == 'standby' and session.status == 'standby' and session.alive:
+                    session.kind = kind  # Claimed; no other request can take it
+                    session.status = 'activating'
+                    return session
+        return None
+
+    def _activate(self, session, kind, url, listeners):
+        session.url = url
+        session.bank = bank_name_for_url(url)
+        session.requested = time.time()
+        session.ready_seconds = None
+        session.warm = True
+        session.uses += 1
+        self._add_listeners(session, listeners)
+        session.channel.request('activate', url=url, recheck=kind == 'recheck')
+        print(f"Handed standby session {session.id} to {kind} for {url} (use {session.uses})")
+
+    def _add_listeners(self, session, listeners):
+        for listener in listeners:
+            callback = lambda event, message, sid=session.id, cb=listener: cb(event, dict(message, session_id=sid))
+            session.listeners.append(callback)
+            session.channel.add_listener(callback)
+
+    def _on_event(self, session, event, message):
+        """Record time to first interaction when a session reports it is active"""
+        if event != 'state':
+            return
+        if message.get('state') == 'standby' and session.pooled:
+            self._pool_failures = 0
+        elif message.get('state') == 'active' and session.requested and session.ready_seconds is None:
+            session.ready_seconds = round(time.time() - session.requested, 3)
+            samples = self.timings['warm' if session.warm else 'cold']
+            samples.append(session.ready_seconds)
+            del samples[:-TIMING_SAMPLES]
+            print(f"Session {session.id} ready for interaction after {session.ready_seconds:.2f}s "
+                  f"({'warm' if session.warm else 'cold'} start)")
+
+    def _fill_pool(self):
+        if not self.pool_configured or self._pool_failures >= POOL_MAX_FAILURES:
+            return
+        with self._pool_lock:
+            for _ in range(self.pool_size - len(self.pooled())):
+                try:
+                    self._spawn('standby', None)
+                except Exception as e:
+                    self._pool_failures += 1
+                    print(f"Could not start standby session: {e}")
+                    return
+
+    def _spawn(self, kind, url, extra_args=(), listeners=()):
+        port = free_port()
+        session = Session(kind, url, port, None)
+        session.state_dir = os.path.join(self.folder, session.id)
+        os.makedirs(session.state_dir, exist_ok=True)
+
+        python_path = '.venv/Scripts/python.exe' if os.path.exists('.venv/Scripts/python.exe') else sys.executable
+        command = [python_path, 'main.py', '--ws-port', str(port), '--state-dir', session.state_dir]
+        if kind == 'standby':
+            command.append('--standby')
+        else:
+            command.extend(['--url', url])
+        if kind == 'recheck':
+            command.append('--recheck')
+        config = read_config()
+        if config.get('trace_sessions'):
+            command.append('--trace')
+        if config.get('profile_sessions'):
+            command.append('--profile')
+        command.extend(extra_args)
+        log = open(os.path.join(session.state_dir, 'session.log'), 'a', encoding='utf-8')
+        try:
+            session.process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+        finally:
+            log.close()  # The child keeps its own handle
+
+        session.channel = CaptureChannel(default_uri(port))
+        session.channel.add_listener(lambda event, message, s=session: self._on_event(s, event, message))
+        self._add_listeners(session, listeners)
+        session.channel.start()
+        with self._lock:
+            self._sessions[session.id] = session
+        self._ensure_supervisor()
+        print(f"Started {kind} session {session.id} on port {port} for {url}")
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def list(self, kind=None):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return [s for s in sessions if kind is None or s.kind == kind]
+
+    def latest(self, kind):
+        """Most recently started live session of a kind, for single-session callers"""
+        live = [s for s in self.list(kind) if s.alive]
+        return max(live, key=lambda s: s.started) if live else None
+
+    def stop(self, session_id, timeout=5, release=True):
+        """Ask a session to stop over its channel; kill it if it does not exit
+
+        A pooled session with uses left is released back to standby instead,
+        unless release is False.
+        """
+        session = self.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        self._collect_metrics(session)  # Before the process and its histograms go away
+        if release and session.pooled and session.kind != 'standby' and session.alive \
+                and session.uses < self.max_uses and len(self.pooled()) <= self.pool_size:
+            try:
+                return self._release(session)
+            except ChannelError as e:
+                print(f"Could not release session {session.id} ({e}); stopping it")
+        session.status = 'stopping'
+        if session.alive:
+            try:
+                session.channel.request('stop', timeout=2)
+            except ChannelError:
+                pass  # Not connected; fall back to terminating below
+            try:
+                session.process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                if sys.platform == 'win32':
+                    # On Windows, use taskkill to terminate process tree
+                    subprocess.run(['taskkill', '/F', '/T', '/PID', str(session.process.pid)],
+                                   capture_output=True)
+                else:
+                    session.process.kill()
+                session.process.wait()
+        session.channel.close()
+        session.returncode = session.process.returncode
+        session.status = 'stopped'
+        if session.pooled:
+            # Recycled: a fresh process takes its place in the pool
+            if session.kind == 'standby':
+                self.remove(session.id)
+            self._fill_pool()
+        return session
+
+    def collect_metrics(self):
+        """Pull the timing histograms of every connected session into this process"""
+        for session in self.list():
+            self._collect_metrics(session)
+
+    def _collect_metrics(self, session, timeout=1):
+        if not session.alive or not session.channel.connected:
+            return
+        try:
+            metrics.merge(session.channel.request('metrics', timeout=timeout)['metrics'])
+        except ChannelError:
+            pass  # Busy or gone; its spans are picked up on the next pull
+
+    def _release(self, session):
+        session.channel.request('release', timeout=5)
+        for callback in session.listeners:
+            session.channel.remove_listener(callback)
+        session.listeners = []
+        print(f"Released session {session.id} back to the pool")
+        session.kind = 'standby'
+        session.url = None
+        session.bank = None
+        session.status = 'resetting'
+        session.requested = None
+        return session
+
+    def remove(self, session_id):
+        """Forget a finished session"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session and not session.alive:
+                del self._sessions[session_id]
+                return True
+        return False
+
+    def stop_all(self):
+        self.pool_size = 0
+        for session in self.list():
+            if session.alive:
+                self.stop(session.id, release=False)
+
+    def _ensure_supervisor(self):
+        if self._supervisor is None or not self._supervisor.is_alive():
+            self._supervisor = threading.Thread(target=self._supervise, daemon=True)
+            self._supervisor.start()
+
+    def _supervise(self):
+        while True:
+            for session in self.list():
+                self._check(session)
+            time.sleep(self.supervise_interval)
+
+    def _check(self, session):
+        if session.status in ('stopping', 'stopped', 'exited'):
+            return
+        returncode = session.process.poll()
+        if returncode is not None:
+            session.returncode = returncode
+            session.status = 'exited'
+            session.channel.close()
+            print(f"Session {session.id} exited with code {returncode}")
+            if session.pooled:
+                if session.kind == 'standby':
+                    if session.uses == 0 and session.channel.state in (None, 'starting'):
+                        self._pool_failures += 1  # Died before its browser was ready
+                    self.remove(session.id)
+                self._fill_pool()
+        elif session.channel.connected:
+            state = session.channel.state
+            if session.kind == 'standby':
+                session.status = state if state in ('standby', 'resetting') else 'starting'
+            elif session.status != 'activating' or state == 'active':
+                session.status = 'running'
+                if state == 'active' and session.ready_seconds is None:
+                    # Connected after the state event went out
+                    self._on_event(session, 'state', {'state': state})
+        elif session.status == 'running':
+            session.status = 'unhealthy'  # Process alive but its channel went away
+        elif session.status == 'starting' and time.time() - session.started > START_GRACE:
+            session.status = 'unhealthy'
+
+
+manager = SessionManager()
+atexit.register(manager.stop_all)
+metrics.add_collector(manager.collect_metrics)
+
+
+def session_or_latest(kind, session_id=None):
+    """The addressed session, or the latest live one of that kind"""
+    if not session_id:
+        return manager.latest(kind)
+    session = manager.get(session_id)
+    # A pooled process may have been handed to something else since
+    return session if session and session.kind == kind else None
+
+
+def start_pool(config=None):
+    """Start the warm pool configured in config.json (called once by the serving web app)"""
+    if config is None:
+        config = read_config()
+    manager.configure_pool(config.get('warm_pool_size', POOL_SIZE),
+                           config.get('warm_pool_max_uses', POOL_MAX_USES))
+
+
+@sessions_bp.route('/sessions/pool', methods=['GET'])
+def get_pool():
+    return jsonify({'status': 'success', 'pool': manager.pool_status()})
+
+
+@sessions_bp.route('/sessions/pool', methods=['POST'])
+def resize_pool():
+    data = request.json or {}
+    try:
+        manager.configure_pool(data.get('size', manager.pool_size), data.get('max_uses', manager.max_uses))
+        return jsonify({'status': 'success', 'pool': manager.pool_status()})
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+
+@sessions_bp.route('/sessions', methods=['GET'])
+def list_sessions():
+    kind = request.args.get('kind')
+    return jsonify({'status': 'success', 'sessions': [s.to_dict() for s in manager.list(kind)]})
+
+
+@sessions_bp.route('/sessions', methods=['POST'])
+def start_session():
+    data = request.json or {}
+    url = data.get('url')
+    if not url:
+        return jsonify({'status': 'error', 'message': 'URL is required'}), 400
+    try:
+        session = manager.start(data.get('kind', 'capture'), url)
+        return jsonify({'status': 'success', 'session': session.to_dict()})
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@sessions_bp.route('/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    session = manager.get(session_id)
+    if session is None:
+        return jsonify({'status': 'error', 'message': 'Session not found'}), 404
+    return jsonify({'status': 'success', 'session': session.to_dict()})
+
+
+@sessions_bp.route('/sessions/<session_id>/stop', methods=['POST'])
+def stop_session(session_id):
+    try:
+        session = manager.stop(session_id)
+        return jsonify({'status': 'success', 'message': f'Session {session_id} stopped', 'session': session.to_dict()})
+    except KeyError:
+        return jsonify({'status': 'error', 'message': 'Session not found'}), 404
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@sessions_bp.route('/sessions/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    if manager.get(session_id) is None:
+        return jsonify({'status': 'error', 'message': 'Session not found'}), 404
+    if not manager.remove(session_id):
+        return jsonify({'status': 'error', 'message': 'Session is still running'}), 400
+    return jsonify({'status': 'success', 'message': f'Session {session_id} removed'})
@@ -0,0 +1,487 @@
+// XPath Collector: the click listener injected into every document by main.py.
+//
+// main.py prepends `window.xpathCollectorConfig = {...}` (recheckMode,
+// captureSnapshots, wsUrl). A click only records the element and its
+// candidate locators; counting the matches of each candidate and sending the
+// result to the capture process happens afterwards, in an idle callback (or
+// when the page is being left), so the page's own click handling is never
+// held up. Counting stops at the second match since only 0, 1 or "more than
+// one" matters, and counts are cached until the DOM changes.
+//
+// Once per page load a frequency index of (tag, attribute, value) and
+// (tag, text) is built in an idle callback and kept current from the
+// MutationObserver, so the visual candidates are counted with a lookup, and a
+// time-boxed search can try combinations of attributes for elements that have
+// no unique simple candidate.
+(function(config) {
+    if (window !== window.top) return;
+    console.log('[XPath Collector] Injection script running');
+    window.recheckMode = !!config.recheckMode;
+    window.captureSnapshots = !!config.captureSnapshots;
+    if (window.clickListenerInjected) {
+        console.log('[XPath Collector] Listener already installed, skipping');
+        return;
+    }
+    console.log('[XPath Collector] Listener not yet injected, setting up...');
+    if (!window.ws && !window.recheckMode && config.wsUrl) {
+        console.log('[XPath Collector] Creating WebSocket connection');
+        window.ws = new WebSocket(config.wsUrl);
+        window.ws.onopen = () => console.log('[XPath Collector] WebSocket CONNECTED');
+        window.ws.onmessage = (e) => console.log('[XPath Collector] Server message:', e.data);
+        window.ws.onerror = (e) => console.error('[XPath Collector] WebSocket ERROR:', e);
+        window.ws.onclose = () => console.log('[XPath Collector] WebSocket CLOSED');
+    } else {
+        console.log('[XPath Collector] WebSocket already exists or recheck mode, state:', window.ws ? window.ws.readyState : 'N/A');
+    }
+
+    var COUNT_LIMIT = 2;  // 0, 1 or "more than one"
+    var countCache = new Map();  // locator -> count, valid until the DOM changes
+    var pending = [];  // Clicks waiting to be counted and sent
+    var flushScheduled = false;
+    var stats = {clicks: 0, flushes: 0, cacheHits: 0, cacheMisses: 0, indexLookups: 0, lastFlushMs: 0,
+                 indexBuildMs: null, indexKeys: 0, combinationsTried: 0, combinationsFound: 0};
+
+    // Attributes in the frequency index; the visual candidates plus the usual
+    // stable hooks for attribute combinations
+    var INDEXED_ATTRIBUTES = ['id', 'name', 'placeholder', 'value', 'aria-label', 'href', 'src', 'alt', 'title',
+                              'type', 'role', 'class', 'for', 'data-testid', 'data-test', 'data-qa'];
+    // Visual candidate -> attribute it tests
+    var VISUAL_ATTRIBUTES = {placeholder: 'placeholder', value: 'value', accessibility: 'aria-label', name: 'name',
+                             href: 'href', src: 'src', alt: 'alt', title: 'title'};
+    var COMBINATION_BUDGET_MS = 15;
+    var COMBINATION_MAX_SIZE = 3;
+    var frequency = new Map();  // 'a|tag|attribute|value' or 't|tag|text' (tag or '*') -> element count
+    var indexedKeys = new WeakMap();  // element -> the keys it added
+    var indexReady = false;
+
+    var OWN_ATTRIBUTES = ['data-relative-xpath', 'data-full-xpath', 'data-css-selector'];
+    new MutationObserver(function(mutations) {
+        // The attributes a click stamps on its element do not change any count
+        var changed = mutations.some(function(mutation) {
+            return mutation.type !== 'attributes' || OWN_ATTRIBUTES.indexOf(mutation.attributeName) === -1;
+        });
+        if (changed) countCache.clear();
+        if (indexReady) mutations.forEach(updateIndex);
+    }).observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+
+    function elementKeys(element) {
+        var tag = element.tagName.toLowerCase();
+        var keys = [];
+        INDEXED_ATTRIBUTES.forEach(function(attribute) {
+            var value = element.getAttribute(attribute);
+            if (value) keys.push('a|' + tag + '|' + attribute + '|' + value, 'a|*|' + attribute + '|' + value);
+        });
+        // text()='X' matches when any direct text node equals X
+        var texts = [];
+        for (var child = element.firstChild; child; child = child.nextSibling) {
+            if (child.nodeType === Node.TEXT_NODE && child.data.trim() && texts.indexOf(child.data) === -1) {
+                texts.push(child.data);
+                keys.push('t|' + tag + '|' + child.data, 't|*|' + child.data);
+            }
+        }
+        return keys;
+    }
+
+    function adjustFrequency(keys, delta) {
+        keys.forEach(function(key) {
+            var count = (frequency.get(key) || 0) + delta;
+            if (count > 0) {
+                frequency.set(key, count);
+            } else {
+                frequency.delete(key);
+            }
+        });
+    }
+
+    function indexElement(element) {
+        if (indexedKeys.has(element)) return;
+        var keys = elementKeys(element);
+        indexedKeys.set(element, keys);
+        adjustFrequency(keys, 1);
+    }
+
+    function unindexElement(element) {
+        var keys = indexedKeys.get(element);
+        if (!keys) return;
+        indexedKeys.delete(element);
+        adjustFrequency(keys, -1);
+    }
+
+    function reindexElement(element) {
+        if (!element || !indexedKeys.has(element)) return;
+        unindexElement(element);
+        indexElement(element);
+    }
+
+    function forEachElement(root, callback) {
+        if (root.nodeType !== Node.ELEMENT_NODE) return;
+        callback(root);
+        var descendants = root.getElementsByTagName('*');
+        for (var i = 0; i < descendants.length; i++) callback(descendants[i]);
+    }
+
+    function updateIndex(mutation) {
+        if (mutation.type === 'childList') {
+            // Nodes may have moved again since the record was queued; trust isConnected
+            mutation.removedNodes.forEach(function(node) {
+                if (!node.isConnected) forEachElement(node, unindexElement);
+            });
+            mutation.addedNodes.forEach(function(node) {
+                if (node.isConnected) forEachElement(node, indexElement);
+            });
+            reindexElement(mutation.target);  // Its direct text nodes may have changed
+        } else if (mutation.type === 'attributes') {
+            if (INDEXED_ATTRIBUTES.indexOf(mutation.attributeName) !== -1) reindexElement(mutation.target);
+        } else {
+            reindexElement(mutation.target.parentNode);
+        }
+    }
+
+    function buildIndex() {
+        if (indexReady) return;
+        var start = performance.now();
+        forEachElement(document.documentElement, indexElement);
+        indexReady = true;
+        stats.indexBuildMs = performance.now() - start;
+        stats.indexKeys = frequency.size;
+    }
+
+    function scheduleIndexBuild() {
+        if (window.requestIdleCallback) {
+            requestIdleCallback(buildIndex, {timeout: 1000});
+        } else {
+            setTimeout(buildIndex, 0);
+        }
+    }
+
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', scheduleIndexBuild);
+    } else {
+        scheduleIndexBuild();
+    }
+
+    function indexCount(key) {
+        stats.indexLookups++;
+        return Math.min(frequency.get(key) || 0, COUNT_LIMIT);
+    }
+
+    function countXPath(xpath) {
+        if (!xpath) return 0;
+        var key = 'x:' + xpath;
+        if (countCache.has(key)) {
+            stats.cacheHits++;
+            return countCache.get(key);
+        }
+        stats.cacheMisses++;
+        var count = 0;
+        try {
+            // An unordered iterator needs no snapshot of every match in document order
+            var result = document.evaluate(xpath, document, null, XPathResult.UNORDERED_NODE_ITERATOR_TYPE, null);
+            while (count < COUNT_LIMIT && result.iterateNext()) count++;
+        } catch (e) {
+            count = 0;
+        }
+        countCache.set(key, count);
+        return count;
+    }
+
+    function countCSS(selector) {
+        if (!selector) return 0;
+        var key = 'c:' + selector;
+        if (countCache.has(key)) {
+            stats.cacheHits++;
+            return countCache.get(key);
+        }
+        stats.cacheMisses++;
+        var count = 0;
+        try {
+            // querySelectorAll would list every match; only a second one matters
+            var first = document.querySelector(selector);
+            count = first ? (hasLaterMatch(first, selector) ? COUNT_LIMIT : 1) : 0;
+        } catch (e) {
+            count = 0;
+        }
+        countCache.set(key, count);
+        return count;
+    }
+
+    function hasLaterMatch(first, selector) {
+        // Matches after the first one in document order are its descendants or
+        // lie in the subtrees following it or one of its ancestors; each
+        // querySelector call stops at the first match
+        if (first.querySelector(selector)) return true;
+        for (var node = first; node && node !== document; node = node.parentNode) {
+            for (var sibling = node.nextElementSibling; sibling; sibling = sibling.nextElementSibling) {
+                if (sibling.matches(selector) || sibling.querySelector(selector)) return true;
+            }
+        }
+        return false;
+    }
+
+    function quote(text) {
+        return text.replace(/'/g, "\\'");
+    }
+
+    function buildClickData(element) {
+        var relativeXpath = getRelativeXPath(element);
+        var fullXpath = getFullXPath(element);
+        var cssSelector = getCSSSelector(element);
+        element.setAttribute('data-relative-xpath', relativeXpath);
+        element.setAttribute('data-full-xpath', fullXpath);
+        element.setAttribute('data-css-selector', cssSelector);
+
+        var tagName = element.tagName.toLowerCase();
+        var elementText = element.textContent ? element.textContent.trim() : '';
+        var innerText = element.innerText ? element.innerText.trim() : '';
+        var displayText = innerText || elementText;
+
+        function attributeXPath(attribute) {
+            var value = element.getAttribute(attribute);
+            return value ? "//*[@" + attribute + "='" + quote(value) + "']" : '';
+        }
+
+        var data = {
+            name: displayText || element.getAttribute('aria-label') || element.getAttribute('name') || element.getAttribute('placeholder') || element.getAttribute('value') || element.getAttribute('title') || element.getAttribute('alt') || tagName,
+            visual_xpath: {
+                text: displayText ? "//*[text()='" + quote(displayText) + "']" : '',
+                tag_text: displayText ? "//" + tagName + "[text()='" + quote(displayText) + "']" : '',
+                tag_contains: displayText ? "//" + tagName + "[contains(text(),'" + quote(displayText.substring(0, 50)) + "')]" : '',
+                placeholder: attributeXPath('placeholder'),
+                value: attributeXPath('value'),
+                accessibility: attributeXPath('aria-label'),
+                name: attributeXPath('name'),
+                href: attributeXPath('href'),
+                src: attributeXPath('src'),
+                alt: attributeXPath('alt'),
+                title: attributeXPath('title')
+            },
+            relative_xpath: relativeXpath,
+            full_xpath: fullXpath,
+            css_selector: cssSelector,
+            page_url: window.location.href,
+            page_name: document.title
+        };
+        // Kept off the JSON sent to the capture process
+        Object.defineProperty(data, 'lookup', {value: {element: element, tag: tagName, text: displayText}});
+        return data;
+    }
+
+    function usableValue(value) {
+        // Values with a quote produce an XPath the index would not describe faithfully
+        return !!value && value.indexOf("'") === -1;
+    }
+
+    function visualIndexKey(key, lookup) {
+        if (key === 'text' || key === 'tag_text') {
+            return usableValue(lookup.text) ? 't|' + (key === 'text' ? '*' : lookup.tag) + '|' + lookup.text : null;
+        }
+        var attribute = VISUAL_ATTRIBUTES[key];
+        if (!attribute) return null;  // tag_contains needs a scan
+        var value = lookup.element.getAttribute(attribute);
+        return usableValue(value) ? 'a|*|' + attribute + '|' + value : null;
+    }
+
+    function hasText(element, text) {
+        for (var child = element.firstChild; child; child = child.nextSibling) {
+            if (child.nodeType === Node.TEXT_NODE && child.data === text) return true;
+        }
+        return false;
+    }
+
+    function attributeCombination(lookup) {
+        // Smallest set of the element's own attributes (and text) that is
+        // unique for its tag, found within COMBINATION_BUDGET_MS
+        var element = lookup.element;
+        var deadline = performance.now() + COMBINATION_BUDGET_MS;
+        var conditions = [];
+        INDEXED_ATTRIBUTES.forEach(function(attribute) {
+            var value = element.getAttribute(attribute);
+            if (usableValue(value)) {
+                conditions.push({test: '@' + attribute + "='" + value + "'", attribute: attribute, value: value,
+                                 count: frequency.get('a|' + lookup.tag + '|' + attribute + '|' + value) || 0});
+            }
+        });
+        if (usableValue(lookup.text)) {
+            conditions.push({test: "text()='" + lookup.text + "'", text: lookup.text,
+                             count: frequency.get('t|' + lookup.tag + '|' + lookup.text) || 0});
+        }
+        conditions = conditions.filter(function(condition) { return condition.count > 0; });
+        if (!conditions.length) return '';
+        conditions.sort(function(a, b) { return a.count - b.count; });
+
+        function xpath(combination) {
+            return '//' + lookup.tag + '[' + combination.map(function(c) { return c.test; }).join(' and ') + ']';
+        }
+        function matches(candidate, condition) {
+            return condition.text !== undefined ? hasText(candidate, condition.text)
+                                                : candidate.getAttribute(condition.attribute) === condition.value;
+        }
+        if (conditions[0].count === 1) return xpath([conditions[0]]);
+
+        // The rarest attribute condition narrows the search; the others filter it
+        var anchor = conditions.filter(function(condition) { return condition.attribute; })[0];
+        if (!anchor) return '';
+        var others = conditions.filter(function(condition) { return condition !== anchor; });
+        var pool = document.querySelectorAll(lookup.tag + '[' + anchor.attribute + '="' + CSS.escape(anchor.value) + '"]');
+
+        function unique(combination) {
+            stats.combinationsTried++;
+            var found = 0;
+            for (var i = 0; i < pool.length && found < COUNT_LIMIT; i++) {
+                if (combination.every(function(condition) { return matches(pool[i], condition); })) found++;
+            }
+            return found === 1;
+        }
+        function search(combination, start) {
+            if (combination.length === COMBINATION_MAX_SIZE) return null;
+            for (var i = start; i < others.length; i++) {
+                if (performance.now() > deadline) return null;
+                var next = combination.concat([others[i]]);
+                if (unique(next)) return next;
+            }
+            for (var j = start; j < others.length; j++) {
+                var found = search(combination.concat([others[j]]), j + 1);
+                if (found) return found;
+            }
+            return null;
+        }
+        var found = search([anchor], 0);
+        if (found) stats.combinationsFound++;
+        return found ? xpath(found) : '';
+    }
+
+    function countClickData(clickData) {
+        var lookup = clickData.lookup;
+        clickData.visual_xpath_counts = {};
+        for (var key in clickData.visual_xpath) {
+            if (clickData.visual_xpath[key]) {
+                var indexKey = indexReady && lookup ? visualIndexKey(key, lookup) : null;
+                clickData.visual_xpath_counts[key] = indexKey ? indexCount(indexKey) : countXPath(clickData.visual_xpath[key]);
+            }
+        }
+        var uniqueVisual = Object.keys(clickData.visual_xpath_counts).some(function(key) {
+            return clickData.visual_xpath_counts[key] === 1;
+        });
+        if (!uniqueVisual && indexReady && lookup && !('attributes' in clickData.visual_xpath)) {
+            clickData.visual_xpath.attributes = attributeCombination(lookup);
+            if (clickData.visual_xpath.attributes) clickData.visual_xpath_counts.attributes = 1;
+        }
+        clickData.relative_xpath_count = countXPath(clickData.relative_xpath);
+        clickData.full_xpath_count = countXPath(clickData.full_xpath);
+        clickData.css_selector_count = countCSS(clickData.css_selector);
+        return clickData;
+    }
+
+    function send(clickData) {
+        if (window.ws && window.ws.readyState === WebSocket.OPEN) {
+            console.log('[XPath Collector] Sending data to server:', clickData.name);
+            window.ws.send(JSON.stringify(clickData));
+        } else {
+            console.error('[XPath Collector] WebSocket not ready. State:', window.ws ? window.ws.readyState : 'null');
+        }
+    }
+
+    function flush() {
+        flushScheduled = false;
+        if (!pending.length) return;
+        var start = performance.now();
+        var clicks = pending;
+        pending = [];
+        var snapshot = window.captureSnapshots ? document.documentElement.outerHTML : null;
+        clicks.forEach(function(clickData) {
+            var countStart = performance.now();
+            countClickData(clickData);
+            // Epoch milliseconds, so the capture process can time the rest of the pipeline
+            clickData.timing.count_ms = performance.now() - countStart;
+            clickData.timing.sent_at = Date.now();
+            if (snapshot) {
+                // The DOM the counts were taken against, for offline validation
+                clickData.dom_snapshot = snapshot;
+            }
+            send(clickData);
+        });
+        stats.flushes++;
+        stats.lastFlushMs = performance.now() - start;
+    }
+
+    function scheduleFlush() {
+        if (flushScheduled) return;
+        flushScheduled = true;
+        if (window.requestIdleCallback) {
+            requestIdleCallback(flush, {timeout: 150});
+        } else {
+            setTimeout(flush, 0);
+        }
+    }
+
+    document.addEventListener('click', function(event) {
+        console.log('[XPath Collector] Click detected on:', event.target.tagName);
+        if (window.recheckMode) {
+            console.log('[XPath Collector] Recheck mode - click ignored');
+            return;
+        }
+        stats.clicks++;
+        var clickData = buildClickData(event.target);
+        clickData.timing = {clicked_at: Date.now()};
+        pending.push(clickData);
+        scheduleFlush();
+    }, true);
+    // A click that navigates away must still be counted and sent
+    window.addEventListener('pagehide', flush);
+    window.clickListenerInjected = true;
+    window.xpathCollector = {buildClickData: buildClickData, countClickData: countClickData, flush: flush, stats: stats,
+                             buildIndex: buildIndex, frequency: frequency};
+    console.log('[XPath Collector] Click listener INSTALLED');
+
+    function getRelativeXPath(element) {
+        if (element.id) return '//*[@id="' + element.id + '"]';
+        if (element.className) return '//' + element.tagName.toLowerCase() + '[@class="' + element.className + '"]';
+        var path = [];
+        while (element.nodeType === Node.ELEMENT_NODE) {
+            var selector = element.nodeName.toLowerCase();
+            if (element.id) {
+                selector += '[@id="' + element.id + '"]';
+                path.unshift(selector);
+                break;
+            } else {
+                var sibling = element.previousSibling;
+                var nth = 1;
+                while (sibling) {
+                    if (sibling.nodeType === Node.ELEMENT_NODE && sibling.nodeName.toLowerCase() === selector) nth++;
+                    sibling = sibling.previousSibling;
+                }
+                if (nth !== 1) selector += '[' + nth + ']';
+            }
+            path.unshift(selector);
+            element = element.parentNode;
+        }
+        return path.length ? '//' + path.join('/') : '';
+    }
+
+    function getFullXPath(element) {
+        var path = [];
+        while (element && element.nodeType === Node.ELEMENT_NODE) {
+            var selector = element.nodeName.toLowerCase();
+            if (element.id) {
+                selector += '[@id="' + element.id + '"]';
+            } else {
+                var sibling = element.previousSibling;
+                var nth = 1;
+                while (sibling) {
+                    if (sibling.nodeType === Node.ELEMENT_NODE && sibling.nodeName.toLowerCase() === selector) nth++;
+                    sibling = sibling.previousSibling;
+                }
+                if (nth !== 1) selector += '[' + nth + ']';
+            }
+            path.unshift(selector);
+            element = element.parentNode;
+        }
+        return '//' + path.join('/');
+    }
+
+    function getCSSSelector(element) {
+        if (element.id) return '#' + element.id;
+        if (element.className) return element.tagName.toLowerCase() + '.' + element.className.split(' ').join('.');
+        return element.tagName.toLowerCase();
+    }
+})(window.xpathCollectorConfig || {});
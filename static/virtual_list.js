@@ -0,0 +1,118 @@
+// Virtualized list shared by the bank viewer (index.html) and recheck page.
+// Only rows that intersect the scroll container's viewport, plus a small
+// overscan, are in the DOM. Row heights are estimated until a row has been
+// rendered once and are measured from then on.
+class VirtualList {
+    constructor(container, options) {
+        this.container = container;
+        this.renderRow = options.renderRow;                  // (row, index) => HTML string
+        this.rowClass = options.rowClass || (() => '');      // (row) => extra wrapper classes
+        this.keyOf = options.keyOf || ((row, index) => index);
+        this.estimateHeight = options.estimateHeight || (() => 60);
+        this.onNearEnd = options.onNearEnd || null;
+        this.overscan = options.overscan || 6;
+        this.rows = [];
+        this.heights = new Map();
+        this.offsets = [0];
+        this.frame = null;
+
+        container.innerHTML = '<div class="vl-spacer" style="position: relative;">'
+            + '<div class="vl-window" style="position: absolute; left: 0; right: 0; top: 0;"></div></div>';
+        this.spacer = container.firstChild;
+        this.window = this.spacer.firstChild;
+        container.addEventListener('scroll', () => this.schedule());
+        window.addEventListener('resize', () => this.schedule());
+    }
+
+    setRows(rows) {
+        this.rows = rows;
+        this.refresh();
+    }
+
+    refresh() {
+        this.recompute();
+        this.render();
+    }
+
+    schedule() {
+        if (this.frame !== null) return;
+        this.frame = requestAnimationFrame(() => {
+            this.frame = null;
+            this.render();
+        });
+    }
+
+    heightOf(index) {
+        const key = this.keyOf(this.rows[index], index);
+        return this.heights.has(key) ? this.heights.get(key) : this.estimateHeight(this.rows[index]);
+    }
+
+    recompute() {
+        const offsets = new Array(this.rows.length + 1);
+        offsets[0] = 0;
+        for (let i = 0; i < this.rows.length; i++) {
+            offsets[i + 1] = offsets[i] + this.heightOf(i);
+        }
+        this.offsets = offsets;
+        this.spacer.style.height = offsets[this.rows.length] + 'px';
+    }
+
+    indexAt(y) {
+        // Last row whose top offset is <= y
+        let low = 0;
+        let high = this.rows.length - 1;
+        while (low < high) {
+            const mid = (low + high + 1) >> 1;
+            if (this.offsets[mid] <= y) low = mid; else high = mid - 1;
+        }
+        return Math.max(low, 0);
+    }
+
+    render() {
+        if (this.rows.length === 0) {
+            this.window.innerHTML = '';
+            return;
+        }
+        const top = this.container.scrollTop;
+        const bottom = top + this.container.clientHeight;
+        const start = Math.max(0, this.indexAt(top) - this.overscan);
+        const end = Math.min(this.rows.length, this.indexAt(bottom) + 1 + this.overscan);
+
+        let html = '';
+        for (let i = start; i < end; i++) {
+            html += `<div class="vl-row ${this.rowClass(this.rows[i])}" data-vl-index="${i}">${this.renderRow(this.rows[i], i)}</div>`;
+        }
+        this.window.style.transform = `translateY(${this.offsets[start]}px)`;
+        this.window.innerHTML = html;
+
+        // Measure what was just rendered; only the spacer and offsets move
+        let changed = false;
+        for (const element of this.window.children) {
+            const index = Number(element.dataset.vlIndex);
+            const key = this.keyOf(this.rows[index], index);
+            const height = element.offsetHeight;
+            if (this.heights.get(key) !== height) {
+                this.heights.set(key, height);
+                changed = true;
+            }
+        }
+        if (changed) {
+            this.recompute();
+            this.window.style.transform = `translateY(${this.offsets[start]}px)`;
+        }
+
+        if (this.onNearEnd && end >= this.rows.length - this.overscan) {
+            this.onNearEnd();
+        }
+    }
+
+    scrollToIndex(index) {
+        if (index < 0 || index >= this.rows.length) return;
+        this.container.scrollTop = this.offsets[index];
+        this.render();
+    }
+
+    findIndex(predicate) {
+        return this.rows.findIndex(predicate);
+    }
+}
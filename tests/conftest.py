@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# The modules live flat at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_entry(name, final_xpath, **fields):
+    """A captured entry in the shape main.handle_click stores"""
+    return {'name': name, 'final_xpath': final_xpath, 'custom_xpath': '',
+            'relative_xpath': {'xpath': final_xpath, 'count': 1},
+            'full_xpath': {'xpath': '', 'count': 0},
+            'css_selector': {'xpath': '', 'count': 0},
+            'visual_xpath': {}, 'created_on': '2024-01-01 00:00:00', **fields}
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory with an output_folder, as the app does"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'output_folder').mkdir()
+    return tmp_path
@@ -0,0 +1,89 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+import bank_export
+import bank_store
+from bank_cache import BankCache
+from bank_store import JsonBankStore
+
+from conftest import make_entry
+
+
+@pytest.fixture
+def store(workdir):
+    store = JsonBankStore(str(workdir / 'output_folder'), cache=BankCache(2**20))
+    store.add_entry('a.com.json', 'https://a.com/', make_entry('Login', '//button'), page_name='A')
+    store.add_entry('a.com.json', 'https://a.com/', make_entry('Search', '//input'))
+    store.add_entry('b.com.json', 'https://b.com/', make_entry('Logo', '//img',
+                                                                 visual_xpath={'alt': {'xpath': "//img[@alt='b']", 'count': 1}}))
+    # Start the exports with an empty cache
+    store.cache.invalidate('a.com.json')
+    store.cache.invalidate('b.com.json')
+    return store
+
+
+def export(store, names, fmt='csv', columns=None, gzip_it=False):
+    return b''.join(bank_export.export_stream(store, names, fmt, columns, gzip_it))
+
+
+def test_parse_columns():
+    assert bank_export.parse_columns(None) == bank_export.DEFAULT_COLUMNS
+    assert bank_export.parse_columns('name, final_xpath') == ['name', 'final_xpath']
+    assert bank_export.parse_columns('name', all_banks=True) == ['bank', 'name']
+    assert bank_export.parse_columns('all') == list(bank_export.COLUMNS)
+    with pytest.raises(ValueError, match='nope'):
+        bank_export.parse_columns('name,nope')
+
+
+def test_csv(store):
+    columns = ['bank', 'page_name', 'name', 'final_xpath', 'relative_xpath_count', 'visual_alt']
+    rows = list(csv.reader(io.StringIO(export(store, ['a.com.json', 'b.com.json'], columns=columns).decode('utf-8'))))
+    assert rows == [
+        ['Bank', 'Page Name', 'Element Name', 'Final XPath', 'Relative XPath Count', 'Visual XPath (Alt)'],
+        ['a.com.json', 'A', 'Login', '//button', '1', ''],
+        ['a.com.json', 'A', 'Search', '//input', '1', ''],
+        ['b.com.json', '', 'Logo', '//img', '1', "//img[@alt='b']"],
+    ]
+
+
+def test_jsonl_with_and_without_columns(store):
+    lines = [json.loads(line) for line in export(store, ['a.com.json'], 'jsonl').splitlines()]
+    assert [(line['bank'], line['page_url'], line['name']) for line in lines] == \
+        [('a.com.json', 'https://a.com/', 'Login'), ('a.com.json', 'https://a.com/', 'Search')]
+    assert lines[0]['relative_xpath'] == {'xpath': '//button', 'count': 1}
+
+    lines = [json.loads(line) for line in export(store, ['a.com.json'], 'jsonl', ['name']).splitlines()]
+    assert lines == [{'name': 'Login'}, {'name': 'Search'}]
+
+
+def test_gzip_matches_plain(store):
+    plain = export(store, ['a.com.json', 'b.com.json'])
+    assert gzip.decompress(export(store, ['a.com.json', 'b.com.json'], gzip_it=True)) == plain
+
+
+def test_export_leaves_the_cache_alone(store):
+    export(store, ['a.com.json', 'b.com.json'])
+    assert store.cache.info()['banks'] == 0
+
+
+def test_unknown_format(store):
+    with pytest.raises(ValueError):
+        export(store, ['a.com.json'], 'xml')
+
+
+def test_download_headers(store, monkeypatch):
+    import web_app
+
+    monkeypatch.setitem(bank_store._stores, 'json', store)
+    client = web_app.app.test_client()
+    response = client.get('/export/a.com.json?format=jsonl&gzip=1')
+    assert response.status_code == 200
+    assert response.headers['Content-Disposition'] == 'attachment; filename=a.com.jsonl.gz'
+    assert len(gzip.decompress(response.data).splitlines()) == 2
+    assert client.get('/export/a.com.json?columns=nope').status_code == 400
+    assert web_app.attachment_header('bü"x.csv') == \
+        'attachment; filename="bu\\"x.csv"; filename*=UTF-8\'\'b%C3%BC%22x.csv'
@@ -0,0 +1,60 @@
+import json
+
+import bank_journal
+from xpath_bank import XPathBank
+
+from conftest import make_entry
+
+
+def write_ops(path, build):
+    """Apply build(bank) -> [ops] to the bank at path and journal them"""
+    bank = bank_journal.load_bank(path)
+    return bank_journal.append_ops(path, build(bank))
+
+
+def test_replay_rebuilds_bank_from_snapshot_and_journal(workdir):
+    path = str(workdir / 'output_folder' / 'example.com.json')
+    seed = XPathBank()
+    seed.add('https://example.com/', make_entry('Login', '//button'), page_name='Home')
+    bank_journal.write_snapshot(path, seed.to_dict())
+
+    write_ops(path, lambda bank: [bank.add('https://example.com/', make_entry('Search', '//input'))])
+    entry_id = bank_journal.load_bank(path).find_by_name('Login')[0][1]['id']
+    write_ops(path, lambda bank: [bank.update(entry_id, {'custom_xpath': '//button[1]'})])
+
+    bank = bank_journal.load_bank(path)
+    assert bank.version == 2
+    assert [e['name'] for e in bank.entries('https://example.com/')] == ['Login', 'Search']
+    assert bank.get(entry_id)[1]['custom_xpath'] == '//button[1]'
+    assert bank_journal.current_version(path) == 2
+
+
+def test_replay_drops_torn_final_line(workdir):
+    path = str(workdir / 'output_folder' / 'example.com.json')
+    write_ops(path, lambda bank: [bank.add('https://example.com/', make_entry('Login', '//button'))])
+    with open(bank_journal.journal_path(path), 'a', encoding='utf-8') as f:
+        f.write('{"op": "add", "page": "https://exa')
+
+    bank = bank_journal.load_bank(path)
+    assert len(bank) == 1
+    assert bank_journal.current_version(path) == 1
+
+
+def test_compaction_folds_journal_and_keeps_version(workdir):
+    path = str(workdir / 'output_folder' / 'example.com.json')
+    write_ops(path, lambda bank: [bank.add('https://example.com/', make_entry('Login', '//button')),
+                                  bank.add('https://example.com/', make_entry('Search', '//input'))])
+    before = bank_journal.load_bank(path)
+
+    assert bank_journal.compact(path) is True
+    with open(bank_journal.journal_path(path), encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == [{'op': 'base', 'v': 2}]
+    after = bank_journal.load_bank(path)
+    assert after.to_dict() == before.to_dict()
+    assert after.version == 2
+    # Nothing left to fold
+    assert bank_journal.compact(path) is False
+
+    version = write_ops(path, lambda bank: [bank.delete(bank.find_by_name('Login')[0][1]['id'])])
+    assert version == 3
+    assert [e['name'] for e in bank_journal.load_bank(path).entries('https://example.com/')] == ['Search']
@@ -0,0 +1,101 @@
+import pytest
+
+import bank_store
+from bank_query import query_bank
+from bank_store import JsonBankStore
+
+from conftest import make_entry
+
+
+def rows():
+    """Three pages given out of display order, like iter_rows after a re-order"""
+    return [
+        ('https://example.com/b', {'page_name': 'B', 'display_order': 2},
+         make_entry('Search', '//input', id='b1')),
+        ('https://example.com/a', {'page_name': 'A', 'display_order': 1},
+         make_entry('Login', '//button', id='a1')),
+        ('https://example.com/a', {'page_name': 'A', 'display_order': 1},
+         make_entry('Logout', '//a[@id="out"]', id='a2')),
+        ('https://example.com/c', {'page_name': 'C', 'display_order': 3}, None),
+    ]
+
+
+def test_pages_are_paginated_in_display_order():
+    data, pagination = query_bank(rows(), page=1, page_size=2)
+    assert list(data) == ['https://example.com/a', 'https://example.com/b']
+    assert pagination == {'page': 1, 'page_size': 2, 'total_pages': 3, 'has_more': True,
+                          'entry_offset': 0, 'entry_limit': None}
+
+    data, pagination = query_bank(rows(), page=2, page_size=2)
+    assert list(data) == ['https://example.com/c']
+    assert data['https://example.com/c']['xpaths'] == []
+    assert pagination['has_more'] is False
+
+
+def test_entries_are_paginated_inside_a_page():
+    data, _ = query_bank(rows(), page_key='https://example.com/a', entry_offset=1, entry_limit=1)
+    page = data['https://example.com/a']
+    assert page['xpath_total'] == 2
+    assert [e['id'] for e in page['xpaths']] == ['a2']
+
+
+def test_filters_and_projection():
+    data, _ = query_bank(rows(), name='LOG', fields=['final_xpath'])
+    assert list(data) == ['https://example.com/a']
+    assert data['https://example.com/a']['xpaths'] == [{'id': 'a1', 'final_xpath': '//button'},
+                                                       {'id': 'a2', 'final_xpath': '//a[@id="out"]'}]
+
+    data, _ = query_bank(rows(), xpath='@ID="OUT"')
+    assert [e['id'] for e in data['https://example.com/a']['xpaths']] == ['a2']
+
+    data, _ = query_bank(rows(), entry_id='b1')
+    assert list(data) == ['https://example.com/b']
+
+    # A page filter alone keeps pages without entries
+    data, _ = query_bank(rows(), page_url='example.com/c')
+    assert list(data) == ['https://example.com/c']
+
+
+@pytest.mark.parametrize('arguments', [{'page': 0}, {'page_size': 0}, {'entry_offset': -1}, {'entry_limit': -1}])
+def test_out_of_range_values_are_rejected(arguments):
+    with pytest.raises(ValueError):
+        query_bank(rows(), **arguments)
+
+
+@pytest.fixture
+def client(workdir, monkeypatch):
+    import web_app
+
+    store = JsonBankStore(str(workdir / 'output_folder'))
+    monkeypatch.setitem(bank_store._stores, 'json', store)
+    for name, xpath in [('Login', '//button'), ('Search', '//input')]:
+        store.add_entry('example.com.json', 'https://example.com/', make_entry(name, xpath), page_name='Home')
+    return web_app.app.test_client(), store
+
+
+def test_load_json_revalidates_with_etag(client):
+    client, store = client
+    response = client.get('/load_json/example.com.json?page=1&page_size=1')
+    assert response.status_code == 200
+    assert response.get_json()['version'] == 2
+    etag = response.headers['ETag']
+
+    # The same query in another order is the same resource
+    response = client.get('/load_json/example.com.json?page_size=1&page=1', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    # Another query is not
+    response = client.get('/load_json/example.com.json?page_size=2', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+    store.add_entry('example.com.json', 'https://example.com/', make_entry('Logo', '//img'))
+    response = client.get('/load_json/example.com.json?page=1&page_size=1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['version'] == 3
+
+
+@pytest.mark.parametrize('query', ['page=0', 'page=abc', 'page_size=1.5', 'entry_offset=x', 'entry_limit=-1'])
+def test_load_json_rejects_bad_values(client, query):
+    client, _ = client
+    response = client.get(f'/load_json/example.com.json?{query}')
+    assert response.status_code == 400
+    assert response.get_json()['status'] == 'error'
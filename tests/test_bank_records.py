@@ -0,0 +1,37 @@
+import json
+
+from bank_records import EntryRecord
+
+from conftest import make_entry
+
+
+def test_round_trip_keeps_values_and_key_order():
+    entry = make_entry('Login', '//button', id='a1', snapshot=None, tags=['smoke'],
+                       visual_xpath={'text': {'xpath': "//*[text()='Login']", 'count': 1},
+                                     'alt': {'xpath': '', 'count': 0},
+                                     'title': ''},
+                       full_xpath={'xpath': '/html/body/button', 'count': 1})
+    entry['extra'] = {'xpath': '//x', 'count': 1, 'note': 'not a candidate'}
+    record = EntryRecord.from_dict(entry)
+    restored = record.to_dict()
+    assert restored == entry
+    assert json.dumps(restored) == json.dumps(entry)
+
+
+def test_empty_candidates_store_nothing():
+    record = EntryRecord.from_dict(make_entry('Login', '//button'))
+    # name, final_xpath, the relative xpath and its count, created_on
+    assert record.values == ('Login', '//button', '//button', 1, '2024-01-01 00:00:00')
+
+
+def test_entries_captured_alike_share_a_shape():
+    first = EntryRecord.from_dict(make_entry('Login', '//button'))
+    second = EntryRecord.from_dict(make_entry('Search', '//input'))
+    assert first.shape is second.shape
+    assert EntryRecord.from_dict(make_entry('Logo', '//img', id='x')).shape is not first.shape
+
+
+def test_unusual_values_are_kept_as_is():
+    entry = {'name': 'Odd', 'count_only': {'count': 1}, 'flag': False, 'zero': 0, 'none': None,
+             'relative_xpath': {'count': 1, 'xpath': '//b'}}
+    assert EntryRecord.from_dict(entry).to_dict() == entry
@@ -0,0 +1,59 @@
+import bank_journal
+from bank_sqlite import SqliteBankStore
+from xpath_bank import XPathBank
+
+from conftest import make_entry
+
+
+def write_bank(path, entries):
+    bank = XPathBank()
+    for page_key, entry in entries:
+        bank.add(page_key, entry, page_name='Home')
+    bank_journal.write_snapshot(str(path), bank.to_dict())
+    return bank
+
+
+def test_import_keeps_banks_with_the_same_ids_apart(workdir):
+    folder = workdir / 'output_folder'
+    # Copies of one bank share entry ids and page keys
+    entries = [('https://example.com/', make_entry('Login', '//button', id='a1')),
+               ('https://example.com/', make_entry('Search', '//input', id='a2'))]
+    source = write_bank(folder / 'example.com.json', entries)
+    write_bank(folder / 'staging.example.com.json', entries)
+
+    store = SqliteBankStore(str(folder / 'banks.sqlite3'), migrate_from=str(folder))
+
+    assert store.list_banks() == ['example.com.json', 'staging.example.com.json']
+    for name in store.list_banks():
+        assert store.export_dict(name) == source.to_dict()
+
+    store.delete_entry('staging.example.com.json', 'a1')
+    assert [e['id'] for e in store.export_dict('staging.example.com.json')['https://example.com/']['xpaths']] == ['a2']
+    assert store.export_dict('example.com.json') == source.to_dict()
+    assert store.version('example.com.json') == 1
+    assert store.version('staging.example.com.json') == 2
+
+
+def test_import_replays_journal(workdir):
+    folder = workdir / 'output_folder'
+    path = str(folder / 'example.com.json')
+    write_bank(path, [('https://example.com/', make_entry('Login', '//button', id='a1'))])
+    bank = bank_journal.load_bank(path)
+    bank_journal.append_ops(path, [bank.update('a1', {'custom_xpath': '//button[1]'})])
+
+    store = SqliteBankStore(str(folder / 'banks.sqlite3'), migrate_from=None)
+    assert store.import_json(path) == 1
+    entry = store.export_dict('example.com.json')['https://example.com/']['xpaths'][0]
+    assert entry['custom_xpath'] == '//button[1]'
+
+
+def test_migration_runs_once(workdir):
+    folder = workdir / 'output_folder'
+    write_bank(folder / 'example.com.json', [('https://example.com/', make_entry('Login', '//button'))])
+    db_path = str(folder / 'banks.sqlite3')
+    store = SqliteBankStore(db_path, migrate_from=str(folder))
+    store.delete_entry('example.com.json', store.export_dict('example.com.json')['https://example.com/']['xpaths'][0]['id'])
+
+    # Reopening must not import the JSON bank over the edit again
+    reopened = SqliteBankStore(db_path, migrate_from=str(folder))
+    assert reopened.export_dict('example.com.json') == {}
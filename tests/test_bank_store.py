@@ -0,0 +1,123 @@
+import pytest
+
+from bank_cache import BankCache
+from bank_journal import VersionConflict
+from bank_sqlite import SqliteBankStore
+from bank_store import JsonBankStore
+
+from conftest import make_entry
+
+PAGE = 'https://example.com/'
+
+
+@pytest.fixture(params=['json', 'json-cached', 'sqlite'])
+def store(request, workdir):
+    if request.param == 'sqlite':
+        return SqliteBankStore(str(workdir / 'output_folder' / 'banks.sqlite3'), migrate_from=None)
+    cache = BankCache(2**20) if request.param == 'json-cached' else None
+    return JsonBankStore(str(workdir / 'output_folder'), cache=cache)
+
+
+def seed(store, name='example.com.json'):
+    ids = []
+    for entry_name, xpath in [('Login', '//button'), ('Search', '//input'), ('Logo', '//img')]:
+        ids.append(store.add_entry(name, PAGE, make_entry(entry_name, xpath), page_name='Home')['entry']['id'])
+    return ids
+
+
+def names(store, name='example.com.json'):
+    return [entry['name'] for _, _, entry in store.iter_rows(name) if entry is not None]
+
+
+def test_add_entry_skips_duplicates(store):
+    seed(store)
+    assert store.add_entry('example.com.json', PAGE, make_entry('Login', '//button')) is None
+    assert names(store) == ['Login', 'Search', 'Logo']
+    assert store.version('example.com.json') == 3
+
+
+def test_apply_batch_is_one_change(store):
+    login, search, logo = seed(store)
+    version = store.apply_batch('example.com.json', [
+        {'op': 'update', 'id': login, 'fields': {'custom_xpath': '//button[1]'}},
+        {'op': 'delete', 'id': logo},
+    ], expected_version=3)
+
+    assert version == 4
+    assert names(store) == ['Login', 'Search']
+    rows = {entry['id']: entry for _, _, entry in store.iter_rows('example.com.json')}
+    assert rows[login]['custom_xpath'] == '//button[1]'
+
+
+def test_apply_batch_with_missing_entry_changes_nothing(store):
+    login, search, logo = seed(store)
+    with pytest.raises(KeyError):
+        store.apply_batch('example.com.json', [
+            {'op': 'delete', 'id': login},
+            {'op': 'update', 'id': 'no-such-id', 'fields': {'name': 'x'}},
+        ])
+    # Deleted earlier in the same batch counts as missing too
+    with pytest.raises(KeyError):
+        store.apply_batch('example.com.json', [
+            {'op': 'delete', 'id': search},
+            {'op': 'update', 'id': search, 'fields': {'name': 'x'}},
+        ])
+    assert names(store) == ['Login', 'Search', 'Logo']
+    assert store.version('example.com.json') == 3
+
+
+def test_apply_batch_rejects_stale_version(store):
+    login, search, logo = seed(store)
+    with pytest.raises(VersionConflict) as conflict:
+        store.apply_batch('example.com.json', [{'op': 'delete', 'id': login}], expected_version=2)
+    assert conflict.value.version == 3
+    assert names(store) == ['Login', 'Search', 'Logo']
+
+
+def test_batch_endpoint_answers_409_on_conflict(workdir, monkeypatch):
+    import bank_store
+    import web_app
+
+    store = JsonBankStore(str(workdir / 'output_folder'))
+    monkeypatch.setitem(bank_store._stores, 'json', store)
+    login, search, logo = seed(store)
+    client = web_app.app.test_client()
+    body = {'filename': 'example.com.json', 'operations': [{'op': 'delete', 'entry_id': login}]}
+
+    response = client.post('/batch_update', json={**body, 'expected_version': 1})
+    assert response.status_code == 409
+    assert response.get_json()['version'] == 3
+
+    response = client.post('/batch_update', json={'filename': 'example.com.json', 'operations': [
+        {'op': 'delete', 'entry_id': login}, {'op': 'delete', 'entry_id': 'no-such-id'}]})
+    assert response.status_code == 404
+
+    response = client.post('/batch_update', json={**body, 'expected_version': 3})
+    assert response.status_code == 200
+    assert response.get_json()['version'] == 4
+    assert names(store) == ['Search', 'Logo']
+
+
+def test_single_edits_send_expected_version(workdir, monkeypatch):
+    import bank_store
+    import web_app
+
+    store = JsonBankStore(str(workdir / 'output_folder'))
+    monkeypatch.setitem(bank_store._stores, 'json', store)
+    login, search, logo = seed(store)
+    client = web_app.app.test_client()
+    version = client.get('/load_json/example.com.json?page=1').get_json()['version']
+
+    # Another tab saves first
+    response = client.post('/update_xpath', json={'filename': 'example.com.json', 'entry_id': login,
+                                                  'name': 'Sign in', 'final_xpath': '//button',
+                                                  'expected_version': version})
+    assert response.get_json()['version'] == version + 1
+    response = client.post('/update_xpath', json={'filename': 'example.com.json', 'entry_id': login,
+                                                  'name': 'Log in', 'final_xpath': '//button',
+                                                  'expected_version': version})
+    assert response.status_code == 409
+    response = client.post('/delete_xpath', json={'filename': 'example.com.json', 'entry_id': search,
+                                                  'expected_version': version})
+    assert response.status_code == 409
+    assert names(store) == ['Sign in', 'Search', 'Logo']
@@ -0,0 +1,55 @@
+import os
+
+import bank_journal
+import locator_lookup
+from xpath_bank import XPathBank
+
+from conftest import make_entry
+
+HOME = 'https://example.com/'
+LOGIN = 'https://example.com/login'
+
+
+def build(folder, count=0):
+    path = str(folder / 'example.com.json')
+    bank = XPathBank()
+    bank.add(HOME, make_entry('Search', '//input', id='s1'), page_name='Home')
+    bank.add(LOGIN, make_entry('Sign in', '//button', id='l1'), page_name='Login')
+    # A repeated name on a page: the first captured wins
+    bank.add(LOGIN, make_entry('Sign in', '//a', id='l2'))
+    for i in range(count):
+        bank.add(HOME, make_entry(f'Item {i}', f'//li[{i}]', id=f'i{i}'))
+    bank_journal.write_snapshot(path, bank.to_dict())
+    return path
+
+
+def test_lookups(workdir):
+    path = build(workdir / 'output_folder', count=200)
+    with locator_lookup.open_bank(path) as bank:
+        assert len(bank) == 203
+        assert bank.final_xpath(LOGIN, 'Sign in') == '//button'
+        assert bank.final_xpath('Login', 'Sign in') == '//button'
+        assert bank.get(HOME, 'Item 150')['final_xpath'] == '//li[150]'
+        assert bank.by_id('l2')['final_xpath'] == '//a'
+        assert bank.get(HOME, 'Sign in') is None
+        assert bank.final_xpath('https://example.com/other', 'Search') is None
+        assert bank.by_id('nope') is None
+
+
+def test_rebuilt_only_when_bank_changes(workdir):
+    path = build(workdir / 'output_folder')
+    assert locator_lookup.ensure_compiled(path)[1] is True
+    assert locator_lookup.ensure_compiled(path)[1] is False
+    assert not os.path.exists(path + bank_journal.LOCK_SUFFIX)
+
+    bank = bank_journal.load_bank(path)
+    bank_journal.append_ops(path, [bank.update('s1', {'final_xpath': '//input[@name="q"]'})])
+    assert locator_lookup.ensure_compiled(path)[1] is True
+    with locator_lookup.open_bank(path, rebuild=False) as compiled:
+        assert compiled.final_xpath(HOME, 'Search') == '//input[@name="q"]'
+
+
+def test_rejects_other_files(workdir):
+    other = workdir / 'output_folder' / 'example.com.locators'
+    other.write_bytes(b'not a compiled bank at all')
+    assert locator_lookup.read_meta(str(other)) is None
@@ -0,0 +1,55 @@
+import pytest
+
+from bank_store import JsonBankStore
+from dom_snapshots import save_snapshot
+from offline_validate import classify, is_valid_locator, validate_bank
+
+from conftest import make_entry
+
+PAGE = '''<html><body>
+<form><input name="q"><button id="go">Go</button><button>Reset</button></form>
+</body></html>'''
+
+
+@pytest.mark.parametrize('count, expected, error, status', [
+    (1, 1, None, 'unique'),
+    (0, 1, None, 'missing'),
+    (0, 0, None, 'missing'),
+    (2, 1, None, 'changed'),
+    (2, 2, None, 'multiple'),
+    (3, None, None, 'multiple'),
+    (None, 1, None, 'no_snapshot'),
+    (None, 1, 'Invalid expression', 'invalid'),
+])
+def test_classify(count, expected, error, status):
+    assert classify(count, expected, error) == status
+
+
+def test_is_valid_locator():
+    assert is_valid_locator('//button[@id="go"]')
+    assert is_valid_locator('form > button', 'css')
+    assert not is_valid_locator('//button[@id="go"')
+    assert not is_valid_locator('form >', 'css')
+    assert not is_valid_locator('  ')
+
+
+def test_validate_bank_against_snapshot(workdir):
+    store = JsonBankStore(str(workdir / 'output_folder'))
+    snapshot = save_snapshot('example.com.json', PAGE)
+    entries = [
+        make_entry('Go', '//button[@id="go"]', snapshot=snapshot,
+                   css_selector={'xpath': 'form button', 'count': 1}),
+        make_entry('Gone', '//a[@id="home"]', snapshot=snapshot),
+        make_entry('Broken', '//button[', snapshot=snapshot),
+        make_entry('Unsaved', '//input'),
+    ]
+    for entry in entries:
+        store.add_entry('example.com.json', 'https://example.com/', entry)
+
+    rows = validate_bank(store, 'example.com.json', all_candidates=True, workers=1)
+    statuses = {(row['element_name'], row['field']): (row['status'], row['count']) for row in rows}
+    assert statuses[('Go', 'final_xpath')] == ('unique', 1)
+    assert statuses[('Go', 'css_selector')] == ('changed', 2)
+    assert statuses[('Gone', 'final_xpath')] == ('missing', 0)
+    assert statuses[('Broken', 'final_xpath')][0] == 'invalid'
+    assert statuses[('Unsaved', 'final_xpath')] == ('no_snapshot', None)
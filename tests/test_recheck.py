@@ -0,0 +1,20 @@
+from recheck import locator_outcome
+
+
+def test_found_and_not_found():
+    assert locator_outcome({'count': 2, 'visible': True}) == \
+        {'status': 'found', 'count': 2, 'visible': True, 'error': None}
+    assert locator_outcome({'count': 0, 'visible': False}) == \
+        {'status': 'not_found', 'count': 0, 'visible': False, 'error': None}
+
+
+def test_error_is_invalid():
+    outcome = locator_outcome({'count': 0, 'visible': False, 'error': 'SyntaxError: bad xpath'})
+    assert outcome['status'] == 'invalid'
+    assert outcome['error'] == 'SyntaxError: bad xpath'
+
+
+def test_missing_detail_is_unavailable():
+    outcome = locator_outcome(None)
+    assert outcome['status'] == 'unavailable'
+    assert outcome['count'] is None
@@ -0,0 +1,89 @@
+import pytest
+
+from bank_cache import BankCache
+from bank_store import JsonBankStore
+from search_index import SearchIndex
+
+from conftest import make_entry
+
+
+@pytest.fixture
+def store(workdir):
+    store = JsonBankStore(str(workdir / 'output_folder'), cache=BankCache(2**20))
+    store.add_entry('a.com.json', 'https://a.com/login', make_entry('Sign in', '//button[@id="signin"]'),
+                    page_name='Login')
+    store.add_entry('a.com.json', 'https://a.com/login', make_entry('Username', '//input[@name="user"]'))
+    store.add_entry('b.com.json', 'https://b.com/', make_entry('Search box', '//input[@name="q"]'), page_name='Home')
+    return store
+
+
+@pytest.fixture
+def index(workdir, store):
+    index = SearchIndex(str(workdir / 'output_folder' / 'search.sqlite3'), store)
+    index.refresh()
+    return index
+
+
+def names(results):
+    return sorted(item['name'] for item in results)
+
+
+def test_substring_prefix_and_fields(index):
+    assert names(index.search('input')[0]) == ['Search box', 'Username']
+    assert names(index.search('INPUT', fields=['name'])[0]) == []
+    assert names(index.search('sign', mode='prefix')[0]) == ['Sign in']
+    assert names(index.search('in', mode='prefix')[0]) == []
+    # Short queries scan instead of using the trigram index
+    assert names(index.search('q"')[0]) == ['Search box']
+    assert names(index.search('login', fields=['page'])[0]) == ['Sign in', 'Username']
+    assert names(index.search('input', bank='b.com.json')[0]) == ['Search box']
+
+
+def test_limit(index):
+    results, has_more = index.search('input', limit=1)
+    assert len(results) == 1 and has_more
+
+
+def test_refresh_rewrites_only_changed_banks(index, store):
+    assert index.refresh() == {}
+    entry_id = store.add_entry('a.com.json', 'https://a.com/login', make_entry('Remember me', '//input[@type="checkbox"]'))['entry']['id']
+    assert index.refresh() == {'a.com.json': 1}
+    assert names(index.search('checkbox')[0]) == ['Remember me']
+
+    store.delete_entry('a.com.json', entry_id)
+    assert index.refresh() == {'a.com.json': 1}
+    assert index.search('checkbox')[0] == []
+    assert index.info()['entries'] == 3
+
+
+def test_refresh_leaves_the_bank_cache_alone(workdir, store):
+    for name in ('a.com.json', 'b.com.json'):
+        store.cache.invalidate(name)
+    store.load('b.com.json')
+    before = store.cache.info()
+
+    index = SearchIndex(str(workdir / 'output_folder' / 'search.sqlite3'), store)
+    assert index.refresh() == {'a.com.json': 2, 'b.com.json': 1}
+    assert store.cache.info() == before
+
+
+def test_refresh_if_due(workdir, store):
+    index = SearchIndex(str(workdir / 'output_folder' / 'search.sqlite3'), store, refresh_seconds=3600)
+    assert index.refresh_if_due() == {'a.com.json': 2, 'b.com.json': 1}
+    store.add_entry('b.com.json', 'https://b.com/', make_entry('Logo', '//img'))
+    assert index.refresh_if_due() is None
+    index.refresh_seconds = 0
+    assert index.refresh_if_due() == {'b.com.json': 1}
+
+
+def test_backend_read_from_schema(workdir, store):
+    import sqlite3
+
+    path = str(workdir / 'output_folder' / 'plain.sqlite3')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE search (name TEXT, page TEXT, xpaths TEXT)')
+    conn.close()
+    index = SearchIndex(path, store)
+    assert index.trigram is False
+    index.refresh()
+    assert names(index.search('input')[0]) == ['Search box', 'Username']
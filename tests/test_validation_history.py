@@ -0,0 +1,77 @@
+import pytest
+
+import bank_store
+from validation_history import ValidationHistory, derived_locator_id
+
+HEADER = 'page_url,element_name,element_xpath,is_exist,checked_date_time,entry_id\n'
+PAGE = 'https://example.com/'
+
+
+def row(outcome, time, entry_id='e1', name='Login', xpath='//button'):
+    return f'{PAGE},{name},{xpath},{outcome},2024-01-01 {time},{entry_id}\n'
+
+
+@pytest.fixture
+def history(workdir, monkeypatch):
+    # Legacy rows look their entry up in a bank; there is none here
+    monkeypatch.setitem(bank_store._stores, 'json', bank_store.JsonBankStore(str(workdir / 'output_folder')))
+    (workdir / 'reports').mkdir()
+    return ValidationHistory(str(workdir / 'reports' / 'history.sqlite3'), str(workdir / 'reports'))
+
+
+def append(workdir, text, day='2024-01-01', mode='a', encoding='utf-8'):
+    with open(workdir / 'reports' / f'{day}.csv', mode, encoding=encoding, newline='') as f:
+        f.write(text)
+
+
+def test_only_appended_complete_rows_are_read(workdir, history):
+    append(workdir, HEADER + row('yes', '10:00:00') + row('no', '10:05:00'), mode='w', encoding='utf-8-sig')
+    assert history.ingest() == 2
+    assert history.ingest() == 0
+
+    # A row still being written waits for its newline
+    append(workdir, row('yes', '10:10:00') + PAGE + ',Login,//butt')
+    assert history.ingest() == 1
+    append(workdir, 'on,yes,2024-01-01 10:15:00,e1\n')
+    assert history.ingest() == 1
+
+    stats = history.locator_stats('e1', days=100000)
+    locator = stats['locator']
+    assert (locator['checks'], locator['passes'], locator['failures'], locator['flips']) == (4, 3, 1, 2)
+    assert locator['first_failure'] == '2024-01-01 10:05:00'
+    assert locator['pass_rate'] == 0.75
+    assert stats['daily'][0]['day'] == '2024-01-01'
+
+
+def test_rewritten_report_is_not_counted_twice(workdir, history):
+    append(workdir, HEADER + row('yes', '10:00:00') + row('no', '10:05:00'), mode='w')
+    assert history.ingest() == 2
+    append(workdir, HEADER + row('yes', '10:00:00'), mode='w')
+    assert history.ingest() == 0
+    assert history.locator_stats('e1', days=100000)['locator']['checks'] == 2
+
+
+def test_rows_without_entry_id_get_a_derived_id(workdir, history):
+    append(workdir, 'page_url,element_name,element_xpath,is_exist,checked_date_time\n'
+                    f'{PAGE},Search,//input,timeout,2024-01-02 09:00:00\n', day='2024-01-02', mode='w')
+    assert history.ingest() == 1
+    locator_id = derived_locator_id(PAGE, 'Search', '//input')
+    locator = history.locator_stats(locator_id, days=100000)['locator']
+    assert (locator['entry_id'], locator['timeouts'], locator['last_result']) == (None, 1, None)
+
+
+def test_flakiest_and_day_diff(workdir, history):
+    append(workdir, HEADER + row('yes', '10:00:00') + row('no', '11:00:00') + row('yes', '12:00:00')
+           + row('yes', '10:00:00', entry_id='e2', name='Search', xpath='//input'), mode='w')
+    append(workdir, HEADER + row('no', '10:00:00').replace('2024-01-01', '2024-01-02')
+           + row('yes', '10:00:00', entry_id='e2', name='Search', xpath='//input').replace('2024-01-01', '2024-01-02'),
+           day='2024-01-02', mode='w')
+    assert history.ingest() == 6
+
+    flaky = history.flakiest(days=100000)
+    assert [item['locator_id'] for item in flaky] == ['e1']
+    assert flaky[0]['flips'] == 3
+
+    diff = history.day_diff('2024-01-02')
+    assert diff['previous'] == '2024-01-01'
+    assert [(c['locator_id'], c['previous'], c['current']) for c in diff['changes']] == [('e1', 'pass', 'fail')]
@@ -0,0 +1,430 @@
+import argparse
+import csv
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from urllib.parse import urlparse
+
+from flask import Blueprint, jsonify, request
+
+from bank_store import get_store, read_config
+
+# Indexed history of validation results. The daily reports/<date>.csv files
+# stay the record; this SQLite index is built from them incrementally (the byte
+# offset read so far is kept per file, so only appended rows are parsed) and
+# keeps per-locator and per-day rollups, so pass rates, first failures,
+# day-over-day changes and the flakiest locators are answered from a few
+# indexed rows whatever the length of the history.
+#
+# A locator is identified by its bank entry id. Rows written before reports
+# had an entry_id column are matched to their entry through the bank (page,
+# name, final xpath); rows that match nothing get an id derived from those
+# three values.
+
+HISTORY_PATH = os.path.join('reports', 'history.sqlite3')
+REPORTS_FOLDER = 'reports'
+DAILY_REPORT = re.compile(r'^\d{4}-\d{2}-\d{2}\.csv$')
+DEFAULT_DAYS = 90
+
+# is_exist value -> outcome; a flip is a pass followed by a fail or the reverse
+OUTCOMES = {'yes': 'pass', 'no': 'fail', 'timeout': 'timeout'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    header TEXT
+);
+CREATE TABLE IF NOT EXISTS checks (
+    source TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    locator_id TEXT NOT NULL,
+    checked_at TEXT,
+    day TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    PRIMARY KEY (source, row)
+);
+CREATE INDEX IF NOT EXISTS checks_by_locator ON checks (locator_id, checked_at);
+CREATE TABLE IF NOT EXISTS locators (
+    locator_id TEXT PRIMARY KEY,
+    entry_id TEXT,
+    page_url TEXT,
+    name TEXT,
+    xpath TEXT,
+    checks INTEGER NOT NULL DEFAULT 0,
+    passes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    timeouts INTEGER NOT NULL DEFAULT 0,
+    flips INTEGER NOT NULL DEFAULT 0,
+    first_checked TEXT,
+    last_checked TEXT,
+    first_failure TEXT,
+    last_failure TEXT,
+    last_result TEXT
+);
+CREATE INDEX IF NOT EXISTS locators_by_entry ON locators (entry_id);
+CREATE INDEX IF NOT EXISTS locators_by_page ON locators (page_url);
+CREATE TABLE IF NOT EXISTS daily (
+    day TEXT NOT NULL,
+    locator_id TEXT NOT NULL,
+    checks INTEGER NOT NULL DEFAULT 0,
+    passes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    timeouts INTEGER NOT NULL DEFAULT 0,
+    flips INTEGER NOT NULL DEFAULT 0,
+    last_outcome TEXT,
+    PRIMARY KEY (day, locator_id)
+);
+CREATE INDEX IF NOT EXISTS daily_by_locator ON daily (locator_id, day);
+"""
+
+LOCATOR_COLUMNS = ['locator_id', 'entry_id', 'page_url', 'name', 'xpath', 'checks', 'passes', 'failures',
+                   'timeouts', 'flips', 'first_checked', 'last_checked', 'first_failure', 'last_failure',
+                   'last_result']
+
+_histories = {}
+
+
+def derived_locator_id(page_url, name, xpath):
+    """Stable id for a report row that cannot be matched to a bank entry"""
+    return hashlib.sha1('\0'.join([page_url, name, xpath]).encode('utf-8')).hexdigest()[:12]
+
+
+def pass_rate(passes, failures):
+    return round(passes / (passes + failures), 4) if passes + failures else None
+
+
+class ValidationHistory:
+    """Validation results of the daily reports, indexed in one SQLite database"""
+
+    def __init__(self, db_path=HISTORY_PATH, reports_folder=REPORTS_FOLDER):
+        self.db_path = db_path
+        self.reports_folder = reports_folder
+        self._local = threading.local()
+        self._ingest_lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    # --- Ingestion ---
+
+    def ingest(self):
+        """Index the rows appended to the daily reports since the last call; returns the row count"""
+        paths = sorted(p for p in glob.glob(os.path.join(self.reports_folder, '*.csv'))
+                       if DAILY_REPORT.match(os.path.basename(p)))
+        added = 0
+        with self._ingest_lock:
+            banks = {}
+            for path in paths:
+                added += self._ingest_file(path, banks)
+        return added
+
+    def _ingest_file(self, path, banks):
+        conn = self._connect()
+        source = os.path.basename(path)
+        row = conn.execute('SELECT offset, rows, header FROM sources WHERE path = ?', (source,)).fetchone()
+        offset, rows, header = (row['offset'], row['rows'], json.loads(row['header'] or 'null')) if row else (0, 0, None)
+        size = os.path.getsize(path)
+        if size == offset:
+            return 0
+        if size < offset:
+            # Rewritten rather than appended; rows already indexed are skipped by (source, row)
+            print(f"{path} shrank; re-reading it from the start")
+            offset, rows, header = 0, 0, None
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+        complete = data.rfind(b'\n') + 1  # A row still being written is read next time
+        if not complete:
+            return 0
+        records = list(csv.reader(io.StringIO(data[:complete].decode('utf-8-sig' if offset == 0 else 'utf-8'))))
+        if header is None and records:
+            header, records = records[0], records[1:]
+        day_from_name = source[:-len('.csv')]
+
+        added = 0
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for record in records:
+                if not record:
+                    continue
+                rows += 1
+                values = dict(zip(header, record))
+                if self._add_check(conn, source, rows, values, day_from_name, banks):
+                    added += 1
+            conn.execute('INSERT OR REPLACE INTO sources (path, offset, rows, header) VALUES (?, ?, ?, ?)',
+                         (source, offset + complete, rows, json.dumps(header)))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return added
+
+    def _add_check(self, conn, source, row, values, default_day, banks):
+        page_url = values.get('page_url', '')
+        name = values.get('element_name', '')
+        xpath = values.get('element_xpath', '')
+        entry_id = values.get('entry_id') or self._resolve_entry(page_url, name, xpath, banks)
+        locator_id = entry_id or derived_locator_id(page_url, name, xpath)
+        checked_at = values.get('checked_date_time') or None
+        day = checked_at[:10] if checked_at else default_day
+        outcome = OUTCOMES.get(values.get('is_exist', '').strip().lower(), 'fail')
+        inserted = conn.execute(
+            'INSERT OR IGNORE INTO checks (source, row, locator_id, checked_at, day, outcome) VALUES (?, ?, ?, ?, ?, ?)',
+            (source, row, locator_id, checked_at, day, outcome)).rowcount
+        if not inserted:
+            return False
+
+        previous = conn.execute('SELECT last_result FROM locators WHERE locator_id = ?', (locator_id,)).fetchone()
+        last_result = previous['last_result'] if previous else None
+        flip = int(outcome != 'timeout' and last_result is not None and last_result != outcome)
+        passed, failed, timed_out = int(outcome == 'pass'), int(outcome == 'fail'), int(outcome == 'timeout')
+        failure_time = checked_at or day if failed else None
+        conn.execute("""
+            INSERT INTO locators (locator_id, entry_id, page_url, name, xpath, checks, passes, failures, timeouts,
+                                  flips, first_checked, last_checked, first_failure, last_failure, last_result)
+            VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (locator_id) DO UPDATE SET
+                entry_id = COALESCE(excluded.entry_id, entry_id), page_url = excluded.page_url,
+                name = excluded.name, xpath = excluded.xpath, checks = checks + 1,
+                passes = passes + excluded.passes, failures = failures + excluded.failures,
+                timeouts = timeouts + excluded.timeouts, flips = flips + excluded.flips,
+                last_checked = excluded.last_checked,
+                first_failure = COALESCE(first_failure, excluded.first_failure),
+                last_failure = COALESCE(excluded.last_failure, last_failure),
+                last_result = COALESCE(excluded.last_result, last_result)
+        """, (locator_id, entry_id, page_url, name, xpath, passed, failed, timed_out, flip, checked_at or day,
+              checked_at or day, failure_time, failure_time, None if outcome == 'timeout' else outcome))
+        conn.execute("""
+            INSERT INTO daily (day, locator_id, checks, passes, failures, timeouts, flips, last_outcome)
+            VALUES (?, ?, 1, ?, ?, ?, ?, ?)
+            ON CONFLICT (day, locator_id) DO UPDATE SET
+                checks = checks + 1, passes = passes + excluded.passes, failures = failures + excluded.failures,
+                timeouts = timeouts + excluded.timeouts, flips = flips + excluded.flips,
+                last_outcome = excluded.last_outcome
+        """, (day, locator_id, passed, failed, timed_out, flip, outcome))
+        return True
+
+    def _resolve_entry(self, page_url, name, xpath, banks):
+        """Entry id of a legacy report row, looked up in the bank of the page's domain"""
+        bank_name = f'{urlparse(page_url).netloc}.json'
+        if bank_name not in banks:
+            banks[bank_name] = None
+            try:
+                store = get_store()
+                if store.exists(bank_name):
+                    banks[bank_name] = store.load(bank_name)
+            except Exception as e:
+                print(f"Could not read {bank_name} to match report rows: {e}")
+        bank = banks[bank_name]
+        return bank.find_duplicate(page_url, name, xpath) if bank is not None else None
+
+    # --- Queries ---
+
+    def find_locators(self, entry_id=None, page_url=None, name=None, xpath=None, limit=50):
+        clauses, params = [], []
+        for column, value in (('entry_id', entry_id), ('page_url', page_url)):
+            if value:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        for column, value in (('name', name), ('xpath', xpath)):
+            if value:
+                clauses.append(f"{column} LIKE ? ESCAPE '\\'")
+                params.append('%' + value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._connect().execute(
+            f'SELECT * FROM locators {where} ORDER BY last_checked DESC LIMIT ?', params + [limit])
+        return [self._locator(row) for row in rows]
+
+    def locator_stats(self, locator_id, days=DEFAULT_DAYS):
+        """Totals and the window's pass rate, first failure and daily series of one locator"""
+        conn = self._connect()
+        row = conn.execute('SELECT * FROM locators WHERE locator_id = ?', (locator_id,)).fetchone()
+        if row is None:
+            return None
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        series = [dict(r) for r in conn.execute(
+            'SELECT day, checks, passes, failures, timeouts, flips, last_outcome FROM daily '
+            'WHERE locator_id = ? AND day >= ? ORDER BY day', (locator_id, since))]
+        window = {key: sum(day[key] for day in series) for key in ('checks', 'passes', 'failures', 'timeouts', 'flips')}
+        window.update({
+            'days': days,
+            'since': since,
+            'pass_rate': pass_rate(window['passes'], window['failures']),
+            'first_failure': next((day['day'] for day in series if day['failures']), None)
+        })
+        return {'locator': self._locator(row), 'window': window, 'daily': series}
+
+    def flakiest(self, days=DEFAULT_DAYS, limit=20, min_checks=2):
+        """Locators that flipped between pass and fail most often in the window"""
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        rows = self._connect().execute("""
+            SELECT d.locator_id, SUM(d.checks) AS checks, SUM(d.passes) AS passes, SUM(d.failures) AS failures,
+                   SUM(d.timeouts) AS timeouts, SUM(d.flips) AS flips, l.entry_id, l.page_url, l.name, l.xpath
+            FROM daily d JOIN locators l ON l.locator_id = d.locator_id
+            WHERE d.day >= ?
+            GROUP BY d.locator_id
+            HAVING SUM(d.checks) >= ? AND SUM(d.flips) > 0
+            ORDER BY CAST(SUM(d.flips) AS REAL) / SUM(d.checks) DESC, SUM(d.flips) DESC
+            LIMIT ?
+        """, (since, min_checks, limit))
+        results = []
+        for row in rows:
+            item = dict(row)
+            item['flakiness'] = round(item['flips'] / item['checks'], 4)
+            item['pass_rate'] = pass_rate(item['passes'], item['failures'])
+            results.append(item)
+        return results
+
+    def day_diff(self, day=None, previous=None):
+        """Locators whose last outcome of `day` differs from that of the previous day with results"""
+        conn = self._connect()
+        if day is None:
+            day = conn.execute('SELECT MAX(day) FROM daily').fetchone()[0]
+        if day is None:
+            return {'day': None, 'previous': None, 'changes': []}
+        if previous is None:
+            previous = conn.execute('SELECT MAX(day) FROM daily WHERE day < ?', (day,)).fetchone()[0]
+        rows = conn.execute("""
+            SELECT d.locator_id, p.last_outcome AS previous, d.last_outcome AS current,
+                   l.entry_id, l.page_url, l.name, l.xpath
+            FROM daily d
+            JOIN locators l ON l.locator_id = d.locator_id
+            LEFT JOIN daily p ON p.locator_id = d.locator_id AND p.day = ?
+            WHERE d.day = ? AND (p.last_outcome IS NULL OR p.last_outcome != d.last_outcome)
+            ORDER BY l.page_url, l.name
+        """, (previous, day))
+        return {'day': day, 'previous': previous, 'changes': [dict(row) for row in rows]}
+
+    def _locator(self, row):
+        locator = {column: row[column] for column in LOCATOR_COLUMNS}
+        locator['pass_rate'] = pass_rate(row['passes'], row['failures'])
+        return locator
+
+
+def get_history(config=None):
+    """Return the history index selected by config.json ("history_path")"""
+    if config is None:
+        config = read_config()
+    path = config.get('history_path', HISTORY_PATH)
+    if path not in _histories:
+        _histories[path] = ValidationHistory(path)
+    return _histories[path]
+
+
+def record_reports():
+    """Index newly written report rows; never fails the caller"""
+    try:
+        get_history().ingest()
+    except Exception as e:
+        print(f"Could not update validation history: {e}")
+
+
+history_bp = Blueprint('history', __name__)
+
+
+def _history():
+    history = get_history()
+    history.ingest()  # Pick up rows written by other processes (e.g. batch_recheck.py)
+    return history
+
+
+@history_bp.route('/history/ingest', methods=['POST'])
+def ingest_history():
+    try:
+        return jsonify({'status': 'success', 'ingested': get_history().ingest()})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@history_bp.route('/history/locators', methods=['GET'])
+def list_locators():
+    """Locators by entry_id or page_url (exact) and name or xpath (substring)"""
+    try:
+        locators = _history().find_locators(
+            entry_id=request.args.get('entry_id'), page_url=request.args.get('page_url'),
+            name=request.args.get('name'), xpath=request.args.get('xpath'),
+            limit=request.args.get('limit', 50, type=int))
+        return jsonify({'status': 'success', 'locators': locators})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@history_bp.route('/history/locators/<locator_id>', methods=['GET'])
+def get_locator(locator_id):
+    """Pass rate, first failure and daily results of one locator over ?days= (default 90)"""
+    try:
+        stats = _history().locator_stats(locator_id, request.args.get('days', DEFAULT_DAYS, type=int))
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    if stats is None:
+        return jsonify({'status': 'error', 'message': 'Locator not found'}), 404
+    return jsonify({'status': 'success', **stats})
+
+
+@history_bp.route('/history/flaky', methods=['GET'])
+def get_flaky():
+    """Top locators by pass/fail flips per check (?days=90&limit=20&min_checks=2)"""
+    try:
+        locators = _history().flakiest(request.args.get('days', DEFAULT_DAYS, type=int),
+                                       request.args.get('limit', 20, type=int),
+                                       request.args.get('min_checks', 2, type=int))
+        return jsonify({'status': 'success', 'locators': locators})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@history_bp.route('/history/diff', methods=['GET'])
+def get_day_diff():
+    """Changed outcomes between two days (?day=YYYY-MM-DD&previous=YYYY-MM-DD, default the last two)"""
+    day, previous = request.args.get('day'), request.args.get('previous')
+    try:
+        for value in (day, previous):
+            if value:
+                datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Dates must be YYYY-MM-DD'}), 400
+    try:
+        return jsonify({'status': 'success', **_history().day_diff(day, previous)})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index the daily validation reports and query their history')
+    parser.add_argument('--db', default=None, help=f'History database (default: config history_path or {HISTORY_PATH})')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('ingest', help='Index rows appended to reports/<date>.csv since the last run')
+    flaky_cmd = sub.add_parser('flaky', help='Print the flakiest locators')
+    flaky_cmd.add_argument('--days', type=int, default=DEFAULT_DAYS)
+    flaky_cmd.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    history = ValidationHistory(args.db) if args.db else get_history()
+    added = history.ingest()
+    if args.command == 'ingest':
+        print(f"Indexed {added} new report rows")
+    elif args.command == 'flaky':
+        for item in history.flakiest(args.days, args.limit):
+            print(f"{item['flakiness']:6.2f}  {item['flips']:4} flips / {item['checks']:4} checks  "
+                  f"{item['name']}  {item['xpath']}  ({item['page_url']})")
+
+
+if __name__ == '__main__':
+    main()
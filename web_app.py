@@ -1,21 +1,29 @@
-from flask import Flask, request, render_template, jsonify, send_file
-import subprocess
+from flask import Flask, Response, request, render_template, jsonify, stream_with_context
 import json
 import os
-import signal
-import sys
-from collections import OrderedDict
-import csv
-import io
+import hashlib
+import unicodedata
+from datetime import datetime, timezone
+from urllib.parse import quote, urlencode
+from werkzeug.http import dump_options_header
 from recheck import recheck_bp
+from session_manager import manager, session_or_latest, sessions_bp, start_pool
+from bank_store import get_store, read_config
+from bank_journal import VersionConflict
+from bank_query import query_bank
+from metrics import metrics_bp
+from validation_history import history_bp
+from search_index import search_bp
+import bank_export
 
 app = Flask(__name__)
 
-# Register recheck blueprint
+# Register recheck, session, metrics, history and search blueprints
 app.register_blueprint(recheck_bp)
-
-# Global variable to store the process
-capture_process = None
+app.register_blueprint(sessions_bp)
+app.register_blueprint(metrics_bp)
+app.register_blueprint(history_bp)
+app.register_blueprint(search_bp)
 
 @app.route('/', methods=['GET'])
 def index():
@@ -30,126 +38,164 @@ def index():
 
 @app.route('/start_capture', methods=['POST'])
 def start_capture():
-    global capture_process
-    
-    if capture_process and capture_process.poll() is None:
-        return jsonify({'status': 'error', 'message': 'Capture already running'}), 400
-    
     url = request.json.get('url')
     if not url:
         return jsonify({'status': 'error', 'message': 'URL is required'}), 400
     
-    # Update config.json with new URL
+    # Update config.json with new URL, keeping the other settings
     config_path = 'config.json'
-    config = {'load_url': url}
+    config = read_config(config_path)
+    config['load_url'] = url
     with open(config_path, 'w') as f:
         json.dump(config, f, indent=4)
     
-    # Start main.py with the URL
+    # Start main.py with the URL in its own session
     try:
-        python_path = '.venv/Scripts/python.exe' if os.path.exists('.venv/Scripts/python.exe') else sys.executable
-        capture_process = subprocess.Popen(
-            [python_path, 'main.py', '--url', url],
-            creationflags=subprocess.CREATE_NEW_CONSOLE if sys.platform == 'win32' else 0
-        )
-        return jsonify({'status': 'success', 'message': f'Capture started for {url}'})
+        session = manager.start('capture', url)
+        return jsonify({'status': 'success', 'message': f'Capture started for {url}', 'session': session.to_dict()})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/stop_capture', methods=['POST'])
 def stop_capture():
-    global capture_process
-    
-    if not capture_process or capture_process.poll() is not None:
+    """Stop the given capture session, or the latest one"""
+    data = request.get_json(silent=True) or {}
+    session = session_or_latest('capture', data.get('session_id'))
+    if not session or not session.alive:
         return jsonify({'status': 'error', 'message': 'No capture process running'}), 400
     
     try:
-        # Create stop file flag
-        stop_file = 'stop_capture.flag'
-        with open(stop_file, 'w') as f:
-            f.write('stop')
-        
-        # Wait for graceful shutdown
-        try:
-            capture_process.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            # Force terminate if graceful shutdown fails
-            if sys.platform == 'win32':
-                # On Windows, use taskkill to terminate process tree
-                subprocess.run(['taskkill', '/F', '/T', '/PID', str(capture_process.pid)], 
-                             capture_output=True)
-            else:
-                capture_process.kill()
-            capture_process.wait()
-        
-        # Clean up stop file
-        if os.path.exists(stop_file):
-            os.remove(stop_file)
-        
-        capture_process = None
-        return jsonify({'status': 'success', 'message': 'Capture stopped'})
+        manager.stop(session.id)
+        return jsonify({'status': 'success', 'message': 'Capture stopped', 'session': session.to_dict()})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 @app.route('/status', methods=['GET'])
 def get_status():
-    global capture_process
-    is_running = capture_process is not None and capture_process.poll() is None
-    return jsonify({'running': is_running})
+    sessions = [s.to_dict() for s in manager.list('capture') if s.alive]
+    return jsonify({'running': bool(sessions), 'sessions': sessions})
 
 @app.route('/list_json_files', methods=['GET'])
 def list_json_files():
-    output_folder = 'output_folder'
-    if not os.path.exists(output_folder):
-        return jsonify({'files': []})
-    
-    files = [f for f in os.listdir(output_folder) if f.endswith('.json')]
-    return jsonify({'files': sorted(files)})
+    return jsonify({'files': get_store().list_banks()})
+
+@app.route('/bank_cache', methods=['GET'])
+def bank_cache_stats():
+    """Hit/miss counters of the parsed-bank cache (JSON backend)"""
+    cache = getattr(get_store(), 'cache', None)
+    if cache is None:
+        return jsonify({'status': 'success', 'enabled': False})
+    return jsonify({'status': 'success', 'enabled': True, 'cache': cache.info()})
+
+def int_arg(name, default=None):
+    """An optional integer query parameter; ValueError if it is not an integer"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer') from None
 
 @app.route('/load_json/<filename>', methods=['GET'])
 def load_json(filename):
-    filepath = os.path.join('output_folder', filename)
-    if not os.path.exists(filepath):
+    """Return a bank, optionally filtered, projected and paginated
+
+    Query parameters: page, page_size (page sections), entry_offset,
+    entry_limit (entries per page), page_url, name, xpath (substring
+    filters), page_key, entry_id (exact filters) and fields (comma-separated
+    entry fields, e.g. final_xpath).
+    Responses carry ETag/Last-Modified so unchanged banks return 304, and
+    the bank's version for use as expected_version in edits.
+    """
+    store = get_store()
+    if not store.exists(filename):
         return jsonify({'status': 'error', 'message': 'File not found'}), 404
     
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            # Preserve order by using object_pairs_hook
-            data = json.load(f, object_pairs_hook=OrderedDict)
-        return jsonify({'status': 'success', 'data': data})
+        # Read before the data: a change in between only makes the version stale
+        version = store.version(filename)
+        signature, modified = store.signature(filename)
+        # Sorted so the same query in another parameter order shares the ETag
+        query = urlencode(sorted(request.args.items(multi=True)))
+        etag = hashlib.sha1(f'{signature}?{query}'.encode('utf-8')).hexdigest()
+        last_modified = datetime.fromtimestamp(int(modified), timezone.utc)
+        
+        not_modified = request.if_none_match.contains(etag) if request.if_none_match else (
+            request.if_modified_since is not None and request.if_modified_since >= last_modified)
+        if not_modified:
+            response = app.response_class(status=304)
+        elif request.args:
+            fields = request.args.get('fields')
+            data, pagination = query_bank(
+                store.iter_rows(filename),
+                page_url=request.args.get('page_url'),
+                name=request.args.get('name'),
+                xpath=request.args.get('xpath'),
+                fields=[f.strip() for f in fields.split(',') if f.strip()] if fields else None,
+                page=int_arg('page'),
+                page_size=int_arg('page_size'),
+                entry_offset=int_arg('entry_offset', 0),
+                entry_limit=int_arg('entry_limit'),
+                page_key=request.args.get('page_key'),
+                entry_id=request.args.get('entry_id')
+            )
+            response = jsonify({'status': 'success', 'data': data, 'pagination': pagination, 'version': version})
+        else:
+            response = jsonify({'status': 'success', 'data': store.export_dict(filename), 'version': version})
+        
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        # Let browsers keep the body but revalidate it on every request
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def resolve_entry(store, filename, data):
+    """Find the entry id addressed by a request (entry_id, or legacy page_url + xpath_index)"""
+    return store.resolve_entry(filename, entry_id=data.get('entry_id'),
+                               page_url=data.get('page_url'), index=data.get('xpath_index'))
+
+def expected_version(data):
+    """The optional expected_version of an edit request; ValueError if it is not an integer"""
+    version = data.get('expected_version')
+    if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+        raise ValueError('expected_version must be an integer')
+    return version
+
+def version_conflict(e):
+    return jsonify({'status': 'error', 'message': 'The bank has changed since it was loaded; reload and try again',
+                    'version': e.version}), 409
+
 @app.route('/update_xpath', methods=['POST'])
 def update_xpath():
     try:
         data = request.json
         filename = data.get('filename')
-        page_url = data.get('page_url')
-        xpath_index = data.get('xpath_index')
         name = data.get('name')
         final_xpath = data.get('final_xpath')
         
-        filepath = os.path.join('output_folder', filename)
-        if not os.path.exists(filepath):
+        store = get_store()
+        if not store.exists(filename):
             return jsonify({'status': 'error', 'message': 'File not found'}), 404
         
-        with open(filepath, 'r') as f:
-            json_data = json.load(f)
-        
-        if page_url not in json_data:
-            return jsonify({'status': 'error', 'message': 'Page URL not found'}), 404
+        entry_id = resolve_entry(store, filename, data)
+        if entry_id is None:
+            return jsonify({'status': 'error', 'message': 'XPath entry not found'}), 404
         
-        if xpath_index >= len(json_data[page_url]['xpaths']):
-            return jsonify({'status': 'error', 'message': 'XPath index out of range'}), 404
+        version = store.update_entry(filename, entry_id, {'name': name, 'final_xpath': final_xpath},
+                                     expected_version(data))
         
-        json_data[page_url]['xpaths'][xpath_index]['name'] = name
-        json_data[page_url]['xpaths'][xpath_index]['final_xpath'] = final_xpath
-        
-        with open(filepath, 'w') as f:
-            json.dump(json_data, f, indent=4)
-        
-        return jsonify({'status': 'success', 'message': 'XPath updated successfully'})
+        return jsonify({'status': 'success', 'message': 'XPath updated successfully', 'version': version})
+    except VersionConflict as e:
+        return version_conflict(e)
+    except KeyError:
+        return jsonify({'status': 'error', 'message': 'XPath entry not found'}), 404
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
@@ -158,78 +204,138 @@ def delete_xpath():
     try:
         data = request.json
         filename = data.get('filename')
-        page_url = data.get('page_url')
-        xpath_index = data.get('xpath_index')
         
-        filepath = os.path.join('output_folder', filename)
-        if not os.path.exists(filepath):
+        store = get_store()
+        if not store.exists(filename):
             return jsonify({'status': 'error', 'message': 'File not found'}), 404
         
-        with open(filepath, 'r') as f:
-            json_data = json.load(f)
-        
-        if page_url not in json_data:
-            return jsonify({'status': 'error', 'message': 'Page URL not found'}), 404
-        
-        if xpath_index >= len(json_data[page_url]['xpaths']):
-            return jsonify({'status': 'error', 'message': 'XPath index out of range'}), 404
-        
-        # Delete the xpath at the specified index
-        del json_data[page_url]['xpaths'][xpath_index]
-        
-        # If no xpaths left for this page, remove the parent page entry
-        if len(json_data[page_url]['xpaths']) == 0:
-            del json_data[page_url]
+        entry_id = resolve_entry(store, filename, data)
+        if entry_id is None:
+            return jsonify({'status': 'error', 'message': 'XPath entry not found'}), 404
         
-        with open(filepath, 'w') as f:
-            json.dump(json_data, f, indent=4)
+        # Deleting the last xpath of a page also removes the parent page entry
+        version = store.delete_entry(filename, entry_id, expected_version(data))
         
-        return jsonify({'status': 'success', 'message': 'XPath deleted successfully'})
+        return jsonify({'status': 'success', 'message': 'XPath deleted successfully', 'version': version})
+    except VersionConflict as e:
+        return version_conflict(e)
+    except KeyError:
+        return jsonify({'status': 'error', 'message': 'XPath entry not found'}), 404
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
-@app.route('/download_csv/<filename>', methods=['GET'])
-def download_csv(filename):
-    filepath = os.path.join('output_folder', filename)
-    if not os.path.exists(filepath):
-        return jsonify({'status': 'error', 'message': 'File not found'}), 404
-    
+BATCH_FIELDS = ['name', 'final_xpath']
+
+def batch_op(item):
+    """Turn one requested change into a journal op; ValueError if it is malformed"""
+    if not isinstance(item, dict) or not item.get('entry_id'):
+        raise ValueError('Every operation needs an entry_id')
+    if item.get('op') == 'delete':
+        return {'op': 'delete', 'id': item['entry_id']}
+    if item.get('op') == 'update':
+        fields = {field: item[field] for field in BATCH_FIELDS if field in item}
+        if not fields:
+            raise ValueError(f"Update of {item['entry_id']} changes none of {', '.join(BATCH_FIELDS)}")
+        return {'op': 'update', 'id': item['entry_id'], 'fields': fields}
+    raise ValueError(f"Unknown operation: {item.get('op')}")
+
+@app.route('/batch_update', methods=['POST'])
+def batch_update():
+    """Apply many renames, final_xpath changes and deletes to a bank in one atomic write
+
+    Body: {"filename", "expected_version" (optional), "operations": [
+    {"op": "update", "entry_id", "name", "final_xpath"} (either field may be
+    left out), {"op": "delete", "entry_id"}, ...]}. Operations apply in order
+    and nothing is written if any entry is missing (404) or the bank is no
+    longer at expected_version (409, with the current version).
+    """
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            json_data = json.load(f, object_pairs_hook=OrderedDict)
-        
-        # Create CSV in memory
-        output = io.StringIO()
-        csv_writer = csv.writer(output)
+        data = request.get_json(silent=True) or {}
+        filename = data.get('filename')
         
-        # Write header
-        csv_writer.writerow(['Page URL', 'Page Name', 'Element Name', 'Final XPath', 'Created On'])
+        store = get_store()
+        if not filename or not store.exists(filename):
+            return jsonify({'status': 'error', 'message': 'File not found'}), 404
         
-        # Write data rows
-        for page_url, page_data in json_data.items():
-            page_name = page_data.get('page_name', '')
-            if page_data.get('xpaths'):
-                for xpath_entry in page_data['xpaths']:
-                    csv_writer.writerow([
-                        page_url,
-                        page_name,
-                        xpath_entry.get('name', ''),
-                        xpath_entry.get('final_xpath', ''),
-                        xpath_entry.get('created_on', '')
-                    ])
+        operations = data.get('operations')
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'status': 'error', 'message': 'operations must be a non-empty list'}), 400
+        ops = [batch_op(item) for item in operations]
         
-        # Prepare response
-        output.seek(0)
-        csv_filename = filename.replace('.json', '.csv')
+        version = store.apply_batch(filename, ops, expected_version(data))
         
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=csv_filename
-        )
+        return jsonify({'status': 'success', 'message': f'{len(ops)} changes applied', 'version': version})
+    except VersionConflict as e:
+        return version_conflict(e)
+    except KeyError as e:
+        return jsonify({'status': 'error', 'message': f'XPath entry not found: {e.args[0]}'}), 404
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def attachment_header(download_name):
+    """Content-Disposition for a download, quoted like send_file does"""
+    try:
+        download_name.encode('ascii')
+        options = {'filename': download_name}
+    except UnicodeEncodeError:
+        # Plain ASCII fallback plus the RFC 5987 UTF-8 name
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        options = {'filename': simple, 'filename*': "UTF-8''" + quote(download_name, safe="!#$&+-.^_`|~")}
+    return dump_options_header('attachment', options)
+
+def export_response(store, names, download_base, fmt, all_banks=False):
+    """Stream an export of the given banks as an attachment
+
+    Query parameters: columns (comma-separated column ids or "all") and
+    gzip=1 to compress the stream.
+    """
+    columns_arg = request.args.get('columns')
+    gzip = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+    try:
+        if fmt not in bank_export.FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        columns = bank_export.parse_columns(columns_arg, all_banks) if (columns_arg or fmt == 'csv') else None
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    if gzip:
+        mimetype = 'application/gzip'
+    else:
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    download_name = bank_export.export_filename(download_base, fmt, gzip)
+    return Response(
+        stream_with_context(bank_export.export_stream(store, names, fmt, columns, gzip)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': attachment_header(download_name)}
+    )
+
+@app.route('/download_csv/<filename>', methods=['GET'])
+def download_csv(filename):
+    store = get_store()
+    if not store.exists(filename):
+        return jsonify({'status': 'error', 'message': 'File not found'}), 404
+    return export_response(store, [filename], filename, 'csv')
+
+@app.route('/export/<filename>', methods=['GET'])
+def export_bank(filename):
+    """Stream one bank as CSV or JSONL (?format=csv|jsonl, columns, gzip)"""
+    store = get_store()
+    if not store.exists(filename):
+        return jsonify({'status': 'error', 'message': 'File not found'}), 404
+    return export_response(store, [filename], filename, request.args.get('format', 'csv'))
+
+@app.route('/export_all', methods=['GET'])
+def export_all():
+    """Stream every bank in the store, one after another, with a bank column"""
+    store = get_store()
+    return export_response(store, store.list_banks(), 'all_banks', request.args.get('format', 'csv'), all_banks=True)
+
 if __name__ == '__main__':
+    # The debug reloader runs this file twice; only its child serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_pool()
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,240 @@
+import hashlib
+import sys
+import uuid
+
+from bank_records import EntryRecord
+
+# Candidate locator fields of an entry that are indexed by XPath string
+CANDIDATE_FIELDS = ['relative_xpath', 'full_xpath', 'css_selector']
+
+
+def new_entry_id():
+    return uuid.uuid4().hex[:12]
+
+
+def legacy_entry_id(page_key, position, entry):
+    """Deterministic id for entries saved before ids existed
+
+    Derived from the entry's position in the snapshot, so every process that
+    reads the same snapshot assigns the same ids until compaction stores them.
+    """
+    raw = '\0'.join([page_key, str(position), entry.get('name', ''),
+                     entry.get('final_xpath', ''), entry.get('created_on', '')])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]
+
+
+def entry_xpaths(entry):
+    """Every non-empty XPath/CSS string stored on an entry"""
+    values = [entry.get('final_xpath'), entry.get('custom_xpath')]
+    for field in CANDIDATE_FIELDS:
+        value = entry.get(field)
+        values.append(value.get('xpath') if isinstance(value, dict) else value)
+    for value in (entry.get('visual_xpath') or {}).values():
+        values.append(value.get('xpath') if isinstance(value, dict) else value)
+    return {v for v in values if v}
+
+
+class XPathBank:
+    """In-memory bank of captured xpaths with hash indexes for O(1) access
+
+    Pages keep their insertion order and entries are kept per page in dicts
+    keyed by a stable entry id, as compact EntryRecords (see bank_records.py);
+    entries are handed out as fresh dicts. Mutators return the journal
+    operation that describes the change so callers can persist it with
+    bank_journal. `version` is the version of the last journal line applied.
+    """
+
+    def __init__(self):
+        self.pages = {}         # page key -> page fields except 'xpaths'
+        self._entries = {}      # page key -> {entry id: EntryRecord}
+        self._by_id = {}        # entry id -> page key
+        self._by_key = {}       # (page key, name, final_xpath) -> {entry ids}
+        self._by_xpath = {}     # xpath string -> {entry ids}
+        self._by_name = {}      # element name -> {entry ids}
+        self.max_display_order = 0
+        self.version = 0
+
+    @classmethod
+    def from_dict(cls, data):
+        bank = cls()
+        for page_key, page_data in data.items():
+            bank._add_page(page_key, {k: v for k, v in page_data.items() if k != 'xpaths'})
+            for position, entry in enumerate(page_data.get('xpaths') or []):
+                if not entry.get('id'):
+                    entry = {'id': legacy_entry_id(page_key, position, entry), **entry}
+                bank._insert(page_key, entry)
+        return bank
+
+    def to_dict(self):
+        """The bank in the output_folder/<domain>.json schema"""
+        data = {}
+        for page_key, page_data in self.pages.items():
+            data[page_key] = dict(page_data)
+            data[page_key]['xpaths'] = [record.to_dict() for record in self._entries[page_key].values()]
+        return data
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, entry_id):
+        return entry_id in self._by_id
+
+    def entries(self, page_key):
+        return [record.to_dict() for record in list(self._entries.get(page_key, {}).values())]
+
+    def get(self, entry_id):
+        """Return (page_key, entry) for an entry id, or (None, None)"""
+        page_key = self._by_id.get(entry_id)
+        if page_key is None:
+            return None, None
+        return page_key, self._entries[page_key][entry_id].to_dict()
+
+    def entry_at(self, page_key, index):
+        """Resolve the legacy (page, list index) address to an entry id"""
+        ids = list(self._entries.get(page_key, {}))
+        if index is None or not 0 <= index < len(ids):
+            return None
+        return ids[index]
+
+    def find_duplicate(self, page_key, name, final_xpath):
+        ids = self._by_key.get((page_key, name, final_xpath))
+        return next(iter(ids)) if ids else None
+
+    def find_by_xpath(self, xpath):
+        return [self.get(entry_id) for entry_id in self._by_xpath.get(xpath, ())]
+
+    def find_by_name(self, name):
+        return [self.get(entry_id) for entry_id in self._by_name.get(name, ())]
+
+    def add(self, page_key, entry, page_name=None):
+        """Add an entry, creating its page if needed; returns the journal op"""
+        op = {'op': 'add', 'page': page_key}
+        if page_key not in self.pages:
+            page_data = {
+                'page_url': page_key,
+                'page_full_url': page_key,
+                'page_name': page_name,
+                'display_order': self.max_display_order + 1
+            }
+            self._add_page(page_key, page_data)
+            op['page_data'] = dict(page_data)
+        if not entry.get('id'):
+            entry = {'id': new_entry_id(), **entry}
+        self._insert(page_key, entry)
+        op['entry'] = entry
+        return op
+
+    def update(self, entry_id, fields):
+        """Update fields of an entry in place; returns the journal op"""
+        page_key, entry = self.get(entry_id)
+        if entry is None:
+            raise KeyError(entry_id)
+        self._unindex(page_key, entry)
+        entry = {**entry, **fields}
+        self._entries[page_key][entry_id] = EntryRecord.from_dict(entry)
+        self._index(page_key, entry)
+        return {'op': 'update', 'id': entry_id, 'fields': fields}
+
+    def delete(self, entry_id):
+        """Delete an entry, dropping its page once empty; returns the journal op"""
+        page_key, entry = self.get(entry_id)
+        if entry is None:
+            raise KeyError(entry_id)
+        self._unindex(page_key, entry)
+        del self._entries[page_key][entry_id]
+        del self._by_id[entry_id]
+        if not self._entries[page_key]:
+            del self._entries[page_key]
+            del self.pages[page_key]
+        return {'op': 'delete', 'id': entry_id}
+
+    def batch(self, ops):
+        """Apply update/delete operations all or nothing; returns one batch journal op
+
+        Raises KeyError, changing nothing, when an operation addresses an entry
+        that does not exist or was deleted earlier in the batch.
+        """
+        deleted = set()
+        for op in ops:
+            if op['id'] not in self._by_id or op['id'] in deleted:
+                raise KeyError(op['id'])
+            if op['op'] == 'delete':
+                deleted.add(op['id'])
+        for op in ops:
+            self._apply(op)
+        return {'op': 'batch', 'ops': ops}
+
+    def apply(self, op):
+        """Replay one journal operation"""
+        self._apply(op)
+        self.version = op['v'] if 'v' in op else self.version + 1
+
+    def _apply(self, op):
+        kind = op.get('op')
+        if kind == 'add':
+            entry = op['entry']
+            if entry.get('id') in self._by_id:
+                return  # Already applied
+            page_key = op['page']
+            if page_key not in self.pages:
+                page_data = op.get('page_data') or {'page_url': page_key, 'page_full_url': page_key}
+                self._add_page(page_key, dict(page_data))
+            if not entry.get('id'):
+                entry = {'id': legacy_entry_id(page_key, len(self._entries[page_key]), entry), **entry}
+            self._insert(page_key, entry)
+            return
+        if kind == 'batch':
+            for item in op['ops']:
+                self._apply(item)
+            return
+        if kind == 'base':
+            return
+        entry_id = op.get('id') or self.entry_at(op.get('page'), op.get('index'))
+        if entry_id not in self._by_id:
+            return  # Entry deleted meanwhile
+        if kind == 'update':
+            self.update(entry_id, op['fields'])
+        elif kind == 'delete':
+            self.delete(entry_id)
+        else:
+            print(f"Skipping unknown journal operation: {kind}")
+
+    def _add_page(self, page_key, page_data):
+        page_key = sys.intern(page_key)
+        for field in ('page_url', 'page_full_url'):
+            # Usually the page key itself; share the one string
+            if page_data.get(field) == page_key:
+                page_data[field] = page_key
+        self.pages[page_key] = page_data
+        self._entries[page_key] = {}
+        order = page_data.get('display_order')
+        if isinstance(order, (int, float)):
+            self.max_display_order = max(self.max_display_order, order)
+
+    def _insert(self, page_key, entry):
+        page_key = sys.intern(page_key)
+        self._entries[page_key][entry['id']] = EntryRecord.from_dict(entry)
+        self._by_id[entry['id']] = page_key
+        self._index(page_key, entry)
+
+    def _index(self, page_key, entry):
+        entry_id = entry['id']
+        self._by_key.setdefault((page_key, entry.get('name'), entry.get('final_xpath')), set()).add(entry_id)
+        self._by_name.setdefault(entry.get('name'), set()).add(entry_id)
+        for xpath in entry_xpaths(entry):
+            self._by_xpath.setdefault(xpath, set()).add(entry_id)
+
+    def _unindex(self, page_key, entry):
+        entry_id = entry['id']
+        _discard(self._by_key, (page_key, entry.get('name'), entry.get('final_xpath')), entry_id)
+        _discard(self._by_name, entry.get('name'), entry_id)
+        for xpath in entry_xpaths(entry):
+            _discard(self._by_xpath, xpath, entry_id)
+
+
+def _discard(index, key, entry_id):
+    ids = index.get(key)
+    if ids is not None:
+        ids.discard(entry_id)
+        if not ids:
+            del index[key]
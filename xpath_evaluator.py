@@ -0,0 +1,65 @@
+from selenium.webdriver.common.by import By
+
+# Evaluates every XPath in one execute_script round trip. For each XPath the
+# browser returns the match count, whether the first match is visible, and the
+# syntax error message if document.evaluate rejected it.
+BATCH_EVALUATE_SCRIPT = """
+var xpaths = arguments[0];
+var results = {};
+
+function isVisible(node) {
+    if (!node) return false;
+    var element = node.nodeType === Node.ELEMENT_NODE ? node : (node.ownerElement || node.parentElement);
+    if (!element) return false;
+    if (!(element.offsetWidth || element.offsetHeight || element.getClientRects().length)) return false;
+    var style = window.getComputedStyle(element);
+    return style.visibility !== 'hidden' && style.display !== 'none';
+}
+
+for (var i = 0; i < xpaths.length; i++) {
+    var xpath = xpaths[i];
+    if (Object.prototype.hasOwnProperty.call(results, xpath)) continue;
+    try {
+        var snapshot = document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        results[xpath] = {
+            count: snapshot.snapshotLength,
+            visible: isVisible(snapshot.snapshotLength ? snapshot.snapshotItem(0) : null),
+            error: null
+        };
+    } catch (e) {
+        results[xpath] = {count: 0, visible: false, error: String(e && e.message || e)};
+    }
+}
+return results;
+"""
+
+
+def evaluate_xpaths(driver, xpaths):
+    """Evaluate all XPaths in the current page with a single WebDriver round trip
+
+    Returns {xpath: {'count': int, 'visible': bool, 'error': str or None}}.
+    """
+    if not xpaths:
+        return {}
+    return driver.execute_script(BATCH_EVALUATE_SCRIPT, list(xpaths))
+
+
+def evaluate_xpaths_individually(driver, xpaths):
+    """Per-XPath find_elements evaluation, kept as the baseline for benchmarks"""
+    results = {}
+    for xpath in xpaths:
+        try:
+            elements = driver.find_elements(By.XPATH, xpath)
+            results[xpath] = {
+                'count': len(elements),
+                'visible': elements[0].is_displayed() if elements else False,
+                'error': None
+            }
+        except Exception as e:
+            results[xpath] = {'count': 0, 'visible': False, 'error': str(e)}
+    return results
+
+
+def existence_map(details):
+    """Reduce evaluation details to the {xpath: bool} shape used by the recheck UI"""
+    return {xpath: result['count'] > 0 for xpath, result in details.items()}